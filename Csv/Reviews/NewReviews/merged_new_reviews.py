@@ -1,6 +1,17 @@
+import argparse
 import csv
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import sys
+from datetime import date, datetime
 from pathlib import Path
 
+from review_index import review_key_hash
+
 NEWREV_DIR = Path("Csv/Reviews/NewReviews")
 DELTA_FILES = [
     NEWREV_DIR / "yamaps_new_since.csv",
@@ -10,8 +21,18 @@ DELTA_FILES = [
 ALL_NEW_SINCE = NEWREV_DIR / "all_new_since.csv"
 
 ALL_REVIEWS = Path("Csv/Reviews/all_reviews.csv")
+REVIEW_DB = Path("Csv/Reviews/all_reviews.sqlite")
+KEY_INDEX = Path("Csv/Reviews/all_reviews.keys.npy")
+WATERMARKS = Path("Csv/Reviews/watermarks.json")
+SUMMARY_BASE = {
+    "Yandex Maps": Path("Csv/Summary/yamaps_summary.csv"),
+    "Google Maps": Path("Csv/Summary/gmaps_summary.csv"),
+    "2GIS": Path("Csv/Summary/2gis_summary.csv"),
+}
+DATE_COLS = ["date_iso", "dateISO", "date", "Date", "DATE"]
 
 BASE_FIELDS = ["rating", "author", "date_iso", "text", "platform", "organization"]
+SENT_COL = "sentiment"
 
 
 def _norm(s: str) -> str:
@@ -59,6 +80,365 @@ def _write_csv(path: Path, fieldnames: list[str], rows: list[dict]) -> None:
             w.writerow(out)
 
 
+def _store_key(row: dict) -> str:
+    return "\x1f".join(_make_key(row))
+
+
+def _file_sig(path: Path) -> str:
+    """Размер и время изменения файла: по ним хранилище замечает, что CSV мог измениться без него."""
+    if not path.exists():
+        return ""
+    st = path.stat()
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def _hash_range(path: Path, start: int, end: int) -> str:
+    """blake2b байтов файла [start, end)."""
+    h = hashlib.blake2b(digest_size=16)
+    with path.open("rb") as f:
+        f.seek(start)
+        left = end - start
+        while left > 0:
+            buf = f.read(min(left, 1 << 20))
+            if not buf:
+                break
+            h.update(buf)
+            left -= len(buf)
+    return h.hexdigest()
+
+
+class ReviewStore:
+    """
+    Хранилище отзывов в SQLite: по строке на уникальный отзыв (UNIQUE-индекс по
+    нормализованному ключу _make_key), вторичный индекс по (platform, organization, date_iso).
+    Строка хранится целиком как JSON, порядок колонок — в meta, порядок строк — по id.
+    all_reviews.csv — экспорт хранилища. В meta же — хэши кусков CSV, записанных хранилищем
+    (выгрузка и каждое дописывание): если CSV переписан другим скриптом (merged_reviews.py,
+    add_sentiment.py), хранилище заново загружается из него; если в нём только дописаны строки —
+    добавляются они; если изменилось лишь время изменения — ничего не перечитывается.
+    """
+    def __init__(self, path: Path = REVIEW_DB, csv_path: Path = ALL_REVIEWS):
+        self.path = Path(path)
+        self.csv_path = Path(csv_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path))
+        self.db.executescript(
+            "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS reviews ("
+            " id INTEGER PRIMARY KEY, key TEXT NOT NULL,"
+            " platform TEXT, organization TEXT, date_iso TEXT, data TEXT NOT NULL);"
+            "CREATE UNIQUE INDEX IF NOT EXISTS reviews_key ON reviews(key);"
+            "CREATE INDEX IF NOT EXISTS reviews_org_date ON reviews(platform, organization, date_iso);"
+        )
+        self.fields = json.loads(self._meta("fields") or "null") or BASE_FIELDS[:]
+
+    def _meta(self, name: str):
+        row = self.db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, name: str, value: str):
+        self.db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+
+    def _blocks(self) -> list:
+        return json.loads(self._meta("csv_blocks") or "[]")
+
+    def _mark_written(self, start: int) -> None:
+        """Запоминает хэш куска CSV от start до конца (start=0 — файл целиком) и подпись файла."""
+        end = self.csv_path.stat().st_size
+        blocks = self._blocks() if start else []
+        blocks.append([start, end, _hash_range(self.csv_path, start, end)])
+        with self.db:
+            self._set_meta("csv_blocks", json.dumps(blocks))
+            self._set_meta("csv_sig", _file_sig(self.csv_path))
+
+    def _written_prefix(self) -> int:
+        """
+        Длина начала CSV, которое совпадает с записанным хранилищем, или -1, если записанное
+        изменено (тогда CSV переписан в обход хранилища).
+        """
+        blocks = self._blocks()
+        if not blocks or blocks[0][0] != 0 or self.csv_path.stat().st_size < blocks[-1][1]:
+            return -1
+        for start, end, digest in blocks:
+            if _hash_range(self.csv_path, start, end) != digest:
+                return -1
+        return blocks[-1][1]
+
+    def sync(self) -> bool:
+        """
+        Приводит хранилище к CSV, если тот изменился после последней записи хранилищем:
+        дописанные в конец строки добавляет, а переписанный файл загружает заново.
+        True — была полная перезагрузка.
+        """
+        if not self.csv_path.exists() or _file_sig(self.csv_path) == self._meta("csv_sig"):
+            return False
+        prefix = self._written_prefix()
+        if prefix >= 0:
+            if prefix < self.csv_path.stat().st_size:
+                with self.csv_path.open("rb") as fb:
+                    fb.seek(prefix)
+                    with io.TextIOWrapper(fb, encoding="utf-8", newline="") as f:
+                        with self.db:
+                            self._insert(csv.DictReader(f, fieldnames=self.fields, restval=""))
+                self._mark_written(prefix)
+            else:
+                with self.db:
+                    self._set_meta("csv_sig", _file_sig(self.csv_path))
+            return False
+        with self.csv_path.open("r", encoding="utf-8-sig", newline="") as f:
+            rdr = csv.DictReader(f)
+            with self.db:
+                self.db.execute("DELETE FROM reviews")
+                self.fields = list(rdr.fieldnames or BASE_FIELDS)
+                self._insert(rdr)
+                self._set_meta("fields", json.dumps(self.fields, ensure_ascii=False))
+        self._mark_written(0)
+        return True
+
+    def _insert(self, rows) -> list[dict]:
+        """INSERT OR IGNORE по ключу; возврат — строки, которых в хранилище ещё не было."""
+        added = []
+        cur = self.db.cursor()
+        for r in rows:
+            cur.execute(
+                "INSERT OR IGNORE INTO reviews (key, platform, organization, date_iso, data) VALUES (?, ?, ?, ?, ?)",
+                (_store_key(r), r.get("platform") or "", r.get("organization") or "", r.get("date_iso") or "",
+                 json.dumps(r, ensure_ascii=False)))
+            if cur.rowcount:
+                added.append(r)
+        return added
+
+    def add(self, rows: list[dict], fieldnames: list[str]) -> list[dict]:
+        """Добавляет дельту (дубли по ключу пропускаются), расширяя список колонок. Возврат — добавленные строки."""
+        with self.db:
+            for col in list(fieldnames) + BASE_FIELDS:
+                if col not in self.fields:
+                    self.fields.append(col)
+            self._set_meta("fields", json.dumps(self.fields, ensure_ascii=False))
+            return self._insert(rows)
+
+    def find(self, rows) -> dict:
+        """Сохранённые строки с теми же ключами, что у rows (поиск по UNIQUE-индексу): {ключ: строка}."""
+        found = {}
+        for r in rows:
+            key = _store_key(r)
+            hit = self.db.execute("SELECT data FROM reviews WHERE key = ?", (key,)).fetchone()
+            if hit:
+                found[key] = json.loads(hit[0])
+        return found
+
+    def rows(self):
+        for (data,) in self.db.execute("SELECT data FROM reviews ORDER BY id"):
+            yield json.loads(data)
+
+    def export_csv(self, path: Path = None) -> int:
+        """Пишет все отзывы в CSV (по умолчанию all_reviews.csv) через временный файл. Возврат — число строк."""
+        path = Path(path or self.csv_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        n = 0
+        with tmp.open("w", encoding="utf-8-sig", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=self.fields, quoting=csv.QUOTE_ALL, extrasaction="ignore")
+            w.writeheader()
+            for r in self.rows():
+                w.writerow({k: (r.get(k) if r.get(k) is not None else "") for k in self.fields})
+                n += 1
+        os.replace(tmp, path)
+        if path.resolve() == self.csv_path.resolve():
+            self._mark_written(0)
+        return n
+
+    def append_csv(self, rows: list[dict]) -> None:
+        """
+        Дописывает строки в конец all_reviews.csv, не трогая существующие.
+        Годится, только если CSV — актуальная выгрузка хранилища с теми же колонками.
+        """
+        start = self.csv_path.stat().st_size
+        with self.csv_path.open("rb") as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+        # utf-8 без BOM: метка есть только в начале файла, её пишет export_csv
+        with self.csv_path.open("a", encoding="utf-8", newline="") as f:
+            if last != b"\n":
+                f.write("\r\n")
+            w = csv.DictWriter(f, fieldnames=self.fields, quoting=csv.QUOTE_ALL, extrasaction="ignore")
+            for r in rows:
+                w.writerow({k: (r.get(k) if r.get(k) is not None else "") for k in self.fields})
+        self._mark_written(start)
+
+    def close(self):
+        self.db.close()
+
+
+def _key_index_fresh() -> bool:
+    """Индекс записан после последнего изменения all_reviews.csv (его не переписывали в обход слияния)."""
+    return KEY_INDEX.exists() and (not ALL_REVIEWS.exists()
+                                   or KEY_INDEX.stat().st_mtime_ns >= ALL_REVIEWS.stat().st_mtime_ns)
+
+
+def update_key_index(rows, incremental: bool) -> None:
+    """
+    Пишет KEY_INDEX — отсортированный массив uint64 уникальных review_key_hash (.npy,
+    парсеры открывают его через np.load(mmap_mode="r") и ищут np.searchsorted).
+    incremental=True — добавить хэши rows к существующему индексу, иначе собрать заново.
+    Без numpy индекс удаляется, чтобы парсеры не опирались на устаревший.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        KEY_INDEX.unlink(missing_ok=True)
+        return
+    hashes = (review_key_hash(r.get("platform"), r.get("organization"), r.get("author"), r.get("text"))
+              for r in rows)
+    keys = np.fromiter((h for h in hashes if h is not None), dtype=np.uint64)
+    keys = np.unique(keys)
+    if incremental:
+        # вставка нескольких новых хэшей в отсортированный индекс без его пересортировки
+        index = np.load(KEY_INDEX)
+        pos = np.searchsorted(index, keys)
+        hit = pos < len(index)
+        hit[hit] = index[pos[hit]] == keys[hit]
+        keys = np.insert(index, pos[~hit], keys[~hit])
+    tmp = KEY_INDEX.with_name(KEY_INDEX.name + ".tmp")
+    with tmp.open("wb") as f:
+        np.save(f, keys)
+    try:
+        os.replace(tmp, KEY_INDEX)
+    except OSError as e:  # индекс открыт работающим парсером (Windows)
+        tmp.unlink(missing_ok=True)
+        print(f"[WARN] Review key index was not updated: {e}")
+
+
+def _parse_date(s):
+    """Дата отзыва как в инкрементальных парсерах (_try_parse_date): ISO или дд.мм.гггг."""
+    if not s:
+        return None
+    s = s.strip()[:10]
+    try:
+        return datetime.fromisoformat(s).date()
+    except ValueError:
+        pass
+    m = re.match(r"^(\d{1,2})\.(\d{1,2})\.(\d{2,4})$", s)
+    if m:
+        d, mo, y = int(m.group(1)), int(m.group(2)), int(m.group(3))
+        if y < 100:
+            y += 2000
+        try:
+            return date(y, mo, d)
+        except ValueError:
+            return None
+    return None
+
+
+def _int_from_any(x):
+    s = str(x or "").replace("\u202f", " ").replace("\xa0", " ").strip()
+    m = re.search(r"(\d[\d\s]*)", s)
+    return int(m.group(1).replace(" ", "")) if m else None
+
+
+def _watermarks_fresh() -> bool:
+    """Отметки записаны после последнего изменения all_reviews.csv и базовых сводок."""
+    if not WATERMARKS.exists():
+        return False
+    mt = WATERMARKS.stat().st_mtime_ns
+    return all(not p.exists() or p.stat().st_mtime_ns <= mt for p in [ALL_REVIEWS, *SUMMARY_BASE.values()])
+
+
+def update_watermarks(rows, incremental: bool) -> bool:
+    """
+    Пишет WATERMARKS — по записи на (platform, organization): последняя дата отзыва
+    и reviews_count из базовой сводки площадки. Инкрементальные парсеры читают пороги
+    и прежние счётчики отсюда (review_index.load_watermarks), не сканируя all_reviews.csv и сводки.
+    incremental=True — дополнить существующие отметки строками rows, иначе собрать заново.
+    False — прежние отметки не прочитались, ничего не записано: их надо собрать заново.
+    """
+    marks: dict[tuple[str, str], dict] = {}
+    if incremental:
+        try:
+            with WATERMARKS.open("r", encoding="utf-8") as f:
+                for m in json.load(f)["organizations"]:
+                    marks[(m["platform"], m["organization"])] = {
+                        "platform": m["platform"], "organization": m["organization"],
+                        "latest_date": m.get("latest_date") or ""}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[WARN] Watermarks could not be read ({e!r}) - rebuilding them.")
+            return False
+
+    def mark(platform: str, org: str) -> dict:
+        return marks.setdefault((platform, org), {"platform": platform, "organization": org, "latest_date": ""})
+
+    for r in rows:
+        platform = (r.get("platform") or "").strip()
+        org = (r.get("organization") or "").strip()
+        if not platform or not org:
+            continue
+        m = mark(platform, org)
+        d = _parse_date(next((r[c] for c in DATE_COLS if r.get(c)), None))
+        if d is not None and d.isoformat() > m["latest_date"]:
+            m["latest_date"] = d.isoformat()
+
+    for platform, path in SUMMARY_BASE.items():
+        if not path.exists():
+            continue
+        with path.open("r", encoding="utf-8", newline="") as f:
+            for r in csv.DictReader(f):
+                org = (r.get("organization") or "").strip()
+                rc = _int_from_any(r.get("reviews_count"))
+                if (r.get("platform") or "").strip() == platform and org and rc is not None:
+                    mark(platform, org)["summary_reviews_count"] = rc
+
+    WATERMARKS.parent.mkdir(parents=True, exist_ok=True)
+    tmp = WATERMARKS.with_name(WATERMARKS.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump({"version": 1, "organizations": [marks[k] for k in sorted(marks)]}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, WATERMARKS)
+    return True
+
+
+def _sentiment_module():
+    """
+    add_sentiment из DataAnalytics (рядом с рабочей папкой или с самим скриптом).
+    None — если модуль или его зависимости недоступны: тогда дельта остаётся без разметки.
+    """
+    for d in (Path("DataAnalytics"), Path(__file__).resolve().parents[3] / "DataAnalytics"):
+        if d.is_dir() and str(d.resolve()) not in sys.path:
+            sys.path.insert(0, str(d.resolve()))
+    try:
+        import add_sentiment
+    except ImportError as e:
+        print(f"[WARN] Sentiment is not available ({e}) - run DataAnalytics/add_sentiment.py --incremental later.")
+        return None
+    return add_sentiment
+
+
+def label_sentiment(rows: list[dict], csv_rows: int = None) -> int:
+    """
+    Размечает тональность строк, которые сейчас будут дописаны в all_reviews.csv, и дообучает
+    на тех из них, у кого есть рейтинг, NB-модель, сохранённую рядом с all_reviews.csv
+    (add_sentiment.label_appended_rows — как шаг add_sentiment.py --incremental, без перезаписи CSV).
+    csv_rows — сколько строк в all_reviews.csv, если файл с прошлого раза только дописывался:
+    тогда CSV не перечитывается, если модель уже учла все его строки.
+    Ошибка разметки (например, нет pymorphy3 или numpy — add_sentiment импортирует их лениво)
+    слияние не прерывает: строки дописываются без тональности, её проставит --incremental.
+    Возврат: сколько строк размечено.
+    """
+    if not rows:
+        return 0
+    sa = _sentiment_module()
+    if sa is None:
+        return 0
+    try:
+        n = sa.label_appended_rows(ALL_REVIEWS, rows, csv_rows=csv_rows)
+        sa.save_lemma_cache()
+        return n
+    except Exception as e:
+        print(f"[WARN] Sentiment labeling failed ({e!r}) - run DataAnalytics/add_sentiment.py --incremental later.")
+        return 0
+
+
 def build_all_new_since(delta_paths: list[Path]) -> tuple[list[dict], list[str], int]:
     """
     Объединяет несколько дельт в одну с дедупликацией.
@@ -103,40 +483,79 @@ def build_all_new_since(delta_paths: list[Path]) -> tuple[list[dict], list[str],
     return combined, union_fields, total_in_sources
 
 
-def merge_into_all_reviews(all_new_rows: list[dict], new_fields: list[str]) -> int:
+def merge_into_all_reviews(all_new_rows: list[dict], new_fields: list[str], sentiment: bool = True) -> int:
     """
-    Вливает объединённую дельту в all_reviews.csv с дедупликацией.
+    Вливает объединённую дельту в all_reviews.csv с дедупликацией через ReviewStore:
+    проверка дубля — поиск по UNIQUE-индексу, а не множество ключей всего CSV.
+    sentiment=True — новые строки (и только они) размечаются и дообучают модель тональности
+    (label_sentiment); строкам-дублям тональность проставляется из хранилища.
+    Если колонки не изменились, новые строки дописываются в конец файла;
+    полная перезапись — только при новых колонках или отсутствии файла.
+    Заодно обновляются индекс хэшей ключей KEY_INDEX и отметки WATERMARKS для инкрементальных парсеров.
     Возврат: сколько реально добавлено.
     """
-    all_rows, all_fields = _read_csv_safe(ALL_REVIEWS)
-
-    for col in new_fields:
-        if col not in all_fields:
-            all_fields.append(col)
-    for bf in BASE_FIELDS:
-        if bf not in all_fields:
-            all_fields.append(bf)
+    store = ReviewStore()
+    try:
+        index_ok, marks_ok = _key_index_fresh(), _watermarks_fresh()
+        reloaded = store.sync()
+        if reloaded:
+            index_ok = marks_ok = False
+        fields_before = list(store.fields)
+        stored = store.find(all_new_rows)
+        fresh, seen = [], set()
+        for r in all_new_rows:
+            key = _store_key(r)
+            if key in stored:
+                if not (r.get(SENT_COL) or "").strip() and stored[key].get(SENT_COL):
+                    r[SENT_COL] = stored[key][SENT_COL]
+            elif key not in seen:
+                seen.add(key)
+                fresh.append(r)
+        new_fields = list(new_fields)
+        if sentiment and label_sentiment(fresh, None if reloaded else len(store)) and SENT_COL not in new_fields:
+            new_fields.append(SENT_COL)
+        added = store.add(fresh, new_fields)
+        if not ALL_REVIEWS.exists() or ALL_REVIEWS.stat().st_size == 0 \
+                or (added and store.fields != fields_before):
+            store.export_csv()
+        elif added:
+            store.append_csv(added)
+        if not index_ok:
+            update_key_index(store.rows(), incremental=False)
+        elif added:
+            update_key_index(added, incremental=True)
+        if not (marks_ok and update_watermarks(added, incremental=True)):
+            update_watermarks(store.rows(), incremental=False)
+    finally:
+        store.close()
+    return len(added)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Объединение дельт новых отзывов и вливание в all_reviews.csv.")
+    ap.add_argument("--export", nargs="?", const=str(ALL_REVIEWS), metavar="CSV",
+                    help="только выгрузить хранилище отзывов в CSV (по умолчанию all_reviews.csv)")
+    args = ap.parse_args(argv)
+
+    if args.export:
+        store = ReviewStore()
+        try:
+            store.sync()
+            n = store.export_csv(Path(args.export))
+            if Path(args.export).resolve() == ALL_REVIEWS.resolve():
+                update_key_index(store.rows(), incremental=False)
+                update_watermarks(store.rows(), incremental=False)
+        finally:
+            store.close()
+        print(f"[OK] Exported {n} reviews from {REVIEW_DB} to {args.export}")
+        return
 
-    existing = set(_make_key(r) for r in all_rows)
-
-    added = 0
-    for row in all_new_rows:
-        key = _make_key(row)
-        if key in existing:
-            continue
-        all_rows.append(row)
-        existing.add(key)
-        added += 1
-
-    _write_csv(ALL_REVIEWS, all_fields, all_rows)
-    return added
-
-
-def main():
     combined_rows, combined_fields, total_src = build_all_new_since(DELTA_FILES)
-    _write_csv(ALL_NEW_SINCE, combined_fields, combined_rows)
-
     added = merge_into_all_reviews(combined_rows, combined_fields)
+    # all_new_since пишется после слияния: новые строки уже с тональностью, дубли — с тональностью из хранилища
+    if SENT_COL not in combined_fields and any(r.get(SENT_COL) for r in combined_rows):
+        combined_fields.append(SENT_COL)
+    _write_csv(ALL_NEW_SINCE, combined_fields, combined_rows)
 
     print("[OK] The merger is complete.")
     print(f"  Total source lines: {total_src}")
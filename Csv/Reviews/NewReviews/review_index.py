@@ -0,0 +1,127 @@
+"""
+Ключ отзыва и файлы, которые merged_new_reviews.py пишет для инкрементальных парсеров:
+  all_reviews.keys.npy — отсортированные uint64-хэши review_key_hash всех отзывов all_reviews.csv;
+  watermarks.json      — отметки по (platform, organization) для порогов дат и прежних счётчиков.
+Общий модуль слияния и парсеров (Parsers/Incremental): ключ и формат файлов меняются только здесь.
+
+Ключей отзыва в проекте два, и у них разные задачи:
+  merged_new_reviews._make_key (и его хэш merged_reviews.key_hash) — точная строка all_reviews.csv
+    вместе с датой: по нему сливаются CSV и дедуплицирует ReviewStore;
+  review_key_hash — «этот отзыв уже собран» для парсера: без даты (у относительных дат она плавает),
+    автор и начало текста в той же нормализации, что и прежняя дедупликация парсеров.
+"""
+import re
+import json
+import hashlib
+import unicodedata
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+
+def norm_text(s: str) -> str:
+    if not s:
+        return ""
+    x = unicodedata.normalize("NFKC", s).lower()
+    x = re.sub(r"\s+", " ", x).strip()
+    x = re.sub(r"[«»\"'”“„‚…‐-–—\-–—·•/\\\(\)\[\]\{\},.;:!?]", "", x)
+    x = re.sub(r"\s+", " ", x).strip()
+    return x
+
+
+def norm_author(s: str) -> str:
+    if not s:
+        return ""
+    x = unicodedata.normalize("NFKC", s).lower()
+    x = re.sub(r"\s+", " ", x).strip()
+    return x
+
+
+def text_signature(s: str, length: int = 180) -> str:
+    """Сигнатура для дедупликации по тексту (усечённый нормализованный текст)."""
+    return norm_text(s)[:length]
+
+
+def review_key_hash(platform: str, organization: str, author: str, text: str) -> Optional[int]:
+    """
+    64-битный хэш ключа отзыва для all_reviews.keys.npy: площадка, организация, norm_author
+    и text_signature. None — у отзыва нет текста: такие отзывы по ключу не сравниваются
+    (иначе все отзывы автора без текста в организации считались бы одним).
+    """
+    sig = text_signature(text)
+    if not sig:
+        return None
+    parts = [" ".join(unicodedata.normalize("NFKC", s or "").lower().split()) for s in (platform, organization)]
+    key = "\x1f".join(parts + [norm_author(author), sig])
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def open_review_key_index(index_path: str, all_reviews_csv: str):
+    """
+    Отсортированные хэши ключей отзывов all_reviews.csv (индекс слияния, mmap только на чтение)
+    или None: индекса нет, нет numpy или CSV менялся после записи индекса.
+    """
+    p, c = Path(index_path), Path(all_reviews_csv)
+    if not p.exists() or (c.exists() and p.stat().st_mtime_ns < c.stat().st_mtime_ns):
+        return None
+    try:
+        import numpy as np
+        return np.load(p, mmap_mode="r")
+    except (ImportError, OSError, ValueError):
+        return None
+
+
+def in_review_key_index(index, key_hash: Optional[int]) -> bool:
+    if key_hash is None:
+        return False
+    i = int(index.searchsorted(index.dtype.type(key_hash)))
+    return i < len(index) and int(index[i]) == key_hash
+
+
+def load_watermarks(path: str, *sources: str) -> Optional[List[dict]]:
+    """
+    Отметки слияния по площадке и организации (merged_new_reviews.update_watermarks).
+    None — файла нет, он не читается или какой-то из sources менялся после его записи
+    (тогда парсер читает CSV как раньше).
+    """
+    p = Path(path)
+    if not p.exists():
+        return None
+    mt = p.stat().st_mtime_ns
+    if any(Path(s).exists() and Path(s).stat().st_mtime_ns > mt for s in sources):
+        return None
+    try:
+        with p.open("r", encoding="utf-8") as f:
+            return json.load(f)["organizations"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def latest_dates_from_watermarks(marks: List[dict], platform: str,
+                                 org_key: Callable[[str], str] = str.strip) -> Dict[str, date]:
+    """Последняя дата отзыва по организации площадки (ключ — org_key от названия): O(организаций)."""
+    latest: Dict[str, date] = {}
+    for m in marks:
+        if m.get("platform") != platform:
+            continue
+        org = org_key(m.get("organization") or "")
+        try:
+            d = date.fromisoformat(m.get("latest_date") or "")
+        except ValueError:
+            continue
+        if org and (org not in latest or d > latest[org]):
+            latest[org] = d
+    return latest
+
+
+def prev_counts_from_watermarks(marks: List[dict], platform: str,
+                                org_key: Callable[[str], str] = str.strip) -> Dict[str, int]:
+    """reviews_count базовой сводки площадки по организации (ключ — org_key от названия)."""
+    res: Dict[str, int] = {}
+    for m in marks:
+        if m.get("platform") != platform or m.get("summary_reviews_count") is None:
+            continue
+        org = org_key(m.get("organization") or "")
+        if org:
+            res[org] = int(m["summary_reviews_count"])
+    return res
@@ -1,6 +1,12 @@
 import csv
 import sys, io
+import os
+import heapq
+import hashlib
+import argparse
 import platform
+import tempfile
+from array import array
 from pathlib import Path
 
 if platform.system() == "Windows":
@@ -24,57 +30,217 @@ INPUTS = [
 ]
 OUT = "Csv/Reviews/all_reviews.csv"
 
-def main():
-    out_path = Path(OUT)
-    out_path.parent.mkdir(parents=True, exist_ok=True)
+BASE_FIELDS = ["rating", "author", "date_iso", "text", "platform", "organization"]
+# Сколько ключей держать в памяти (множество 64-битных хэшей, ~70 байт на ключ).
+# Если уникальных отзывов больше — дедупликация через внешнюю сортировку во временных файлах.
+MAX_KEYS_IN_MEMORY = 2_000_000
+POS_BITS = 40  # номер строки во входных файлах в паре (хэш, номер) при внешней сортировке
 
-    writer = None
-    header = None
-    files_merged = 0
-    rows_written = 0
 
-    with out_path.open("w", encoding="utf-8-sig", newline="") as fout:
-        for i, p in enumerate(INPUTS, 1):
-            path = Path(p)
-            if not path.is_file():
-                print(f"⚠️ missed: {p} (no file)")
-                continue
+def _norm(s: str) -> str:
+    """Нормализация для ключа: трим + свёртка пробелов + убираем \r\n."""
+    if s is None:
+        return ""
+    s = s.replace("\r", " ").replace("\n", " ")
+    return " ".join(s.split())
+
+
+def key_hash(row: dict) -> int:
+    """64-битный хэш ключа отзыва — того же, что _make_key в NewReviews/merged_new_reviews.py."""
+    key = "\x1f".join((
+        _norm(row.get("platform", "")).lower(),
+        _norm(row.get("organization", "")).lower(),
+        _norm(row.get("author", "")),
+        _norm(row.get("date_iso", "")),
+        _norm(row.get("text", "")),
+    ))
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def read_headers(paths: list[Path]) -> tuple[list[Path], list[str]]:
+    """Существующие непустые входы и объединение их колонок (порядок — по первому появлению)."""
+    found, fields = [], []
+    for p in paths:
+        if not p.is_file():
+            print(f"⚠️ missed: {p} (no file)")
+            continue
+        try:
+            with p.open("r", encoding="utf-8-sig", newline="") as f:
+                header = next(csv.reader(f), None)
+        except Exception as e:
+            print(f"⚠️ could not be read {p}: {e}")
+            continue
+        if not header:
+            print(f"⚠️ empty file: {p}")
+            continue
+        found.append(p)
+        for col in header:
+            if col and col not in fields:
+                fields.append(col)
+    for bf in BASE_FIELDS:
+        if bf not in fields:
+            fields.append(bf)
+    return found, fields
+
+
+def iter_rows(paths: list[Path]):
+    """Строки всех входов подряд, как словари по именам колонок: (путь, строка)."""
+    for p in paths:
+        try:
+            with p.open("r", encoding="utf-8-sig", newline="") as f:
+                for row in csv.DictReader(f):
+                    yield p, row
+        except Exception as e:
+            print(f"⚠️ could not be read {p}: {e}")
 
+
+def _write_run(values: list[int], tmp_dir: str, n_words: int) -> str:
+    """Сортирует кусок и пишет во временный файл словами uint64 (старшие слова первыми)."""
+    values.sort()
+    buf = array("Q")
+    mask = (1 << 64) - 1
+    for v in values:
+        buf.extend((v >> (64 * i)) & mask for i in reversed(range(n_words)))
+    fd, path = tempfile.mkstemp(suffix=".run", dir=tmp_dir)
+    with os.fdopen(fd, "wb") as f:
+        buf.tofile(f)
+    return path
+
+
+def _read_run(path: str, n_words: int, block: int = 1 << 16):
+    with open(path, "rb") as f:
+        while True:
+            buf = array("Q")
             try:
-                with path.open("r", encoding="utf-8-sig", newline="") as fin:
-                    rdr = csv.reader(fin)
-                    try:
-                        file_header = next(rdr)
-                    except StopIteration:
-                        print(f"⚠️ empty file: {p}")
-                        continue
-
-                    if writer is None:
-                        header = file_header
-                        writer = csv.writer(fout, quoting=csv.QUOTE_ALL)
-                        writer.writerow(header)
-                    else:
-                        if file_header != header:
-                            print(f"⚠️ {p} has a different header, lines will be skipped")
-                            continue
-
-                    file_rows = 0
-                    for row in rdr:
-                        try:
-                            writer.writerow(row)
-                            rows_written += 1
-                            file_rows += 1
-                        except Exception as e:
-                            print(f"⚠️ line missing in {p}: {e}")
-                            continue
-
-                    files_merged += 1
-                    print(f"✓ {p}: added {file_rows} lines")
-            except Exception as e:
-                print(f"⚠️ could not be read {p}: {e}")
+                buf.fromfile(f, block * n_words)
+            except EOFError:
+                pass
+            if not buf:
+                return
+            for i in range(0, len(buf), n_words):
+                v = 0
+                for w in buf[i:i + n_words]:
+                    v = (v << 64) | w
+                yield v
+
+
+def external_sort(values, budget: int, tmp_dir: str, n_words: int):
+    """Сортировка потока неотрицательных целых (< 2**(64*n_words)) кусками по budget и k-way слиянием."""
+    runs, chunk = [], []
+    for v in values:
+        chunk.append(v)
+        if len(chunk) >= budget:
+            runs.append(_write_run(chunk, tmp_dir, n_words))
+            chunk = []
+    if not runs:
+        chunk.sort()
+        yield from chunk
+        return
+    if chunk:
+        runs.append(_write_run(chunk, tmp_dir, n_words))
+    yield from heapq.merge(*(_read_run(r, n_words) for r in runs))
+
+
+def duplicate_positions(paths: list[Path], budget: int, tmp_dir: str):
+    """
+    Номера строк (сквозные по входам, по возрастанию), которые повторяют ключ более ранней строки.
+    Пары (хэш, номер) сортируются внешне: в каждой группе одного хэша первая строка остаётся,
+    остальные — дубли; их номера ещё раз сортируются внешне, чтобы второй проход шёл по порядку.
+    """
+    pos_mask = (1 << POS_BITS) - 1
+    pairs = ((key_hash(row) << POS_BITS) | pos for pos, (_, row) in enumerate(iter_rows(paths)))
+
+    def dups():
+        prev = None
+        for v in external_sort(pairs, budget, tmp_dir, n_words=2):
+            h = v >> POS_BITS
+            if h == prev:
+                yield v & pos_mask
+            prev = h
+
+    return external_sort(dups(), budget, tmp_dir, n_words=1)
+
+
+class _Output:
+    """Выходной CSV: пишется во временный файл рядом и подменяет OUT только в конце."""
+    def __init__(self, path: Path, fields: list[str]):
+        self.path = path
+        self.tmp = path.with_name(path.name + ".tmp")
+        self.f = self.tmp.open("w", encoding="utf-8-sig", newline="")
+        self.w = csv.DictWriter(self.f, fieldnames=fields, quoting=csv.QUOTE_ALL, extrasaction="ignore", restval="")
+        self.w.writeheader()
+
+    def write(self, row: dict):
+        self.w.writerow({k: v for k, v in row.items() if k is not None and v is not None})
+
+    def discard(self):
+        self.f.close()
+        self.tmp.unlink(missing_ok=True)
+
+    def commit(self):
+        self.f.close()
+        os.replace(self.tmp, self.path)
+
+
+def merge_streaming(paths: list[Path], out_path: Path, max_keys: int = MAX_KEYS_IN_MEMORY) -> dict:
+    """
+    Объединяет входы в out_path, сопоставляя колонки по именам и отбрасывая повторы ключа
+    (первое вхождение остаётся, порядок строк сохраняется). Пока уникальных ключей не больше
+    max_keys — один проход с множеством хэшей; иначе — второй проход по списку дублей,
+    полученному внешней сортировкой. Возврат: {путь: (прочитано, записано)} и итоги.
+    """
+    paths, fields = read_headers(paths)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    out = _Output(out_path, fields)
+    stats = {p: [0, 0] for p in paths}
+    seen: set[int] = set()
+    for p, row in iter_rows(paths):
+        stats[p][0] += 1
+        h = key_hash(row)
+        if h in seen:
+            continue
+        if len(seen) >= max_keys:
+            break
+        seen.add(h)
+        out.write(row)
+        stats[p][1] += 1
+    else:
+        out.commit()
+        return {"files": stats, "fields": fields, "external": False}
+
+    out.discard()
+    seen = None
+    print(f"⚠️ more than {max_keys} unique reviews - deduplicating via external sort")
+    stats = {p: [0, 0] for p in paths}
+    out = _Output(out_path, fields)
+    with tempfile.TemporaryDirectory(dir=out_path.parent) as tmp_dir:
+        dups = duplicate_positions(paths, max_keys, tmp_dir)
+        next_dup = next(dups, None)
+        for pos, (p, row) in enumerate(iter_rows(paths)):
+            stats[p][0] += 1
+            if pos == next_dup:
+                next_dup = next(dups, None)
                 continue
+            out.write(row)
+            stats[p][1] += 1
+    out.commit()
+    return {"files": stats, "fields": fields, "external": True}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Объединение CSV отзывов площадок в all_reviews.csv без дублей.")
+    ap.add_argument("--max-keys", type=int, default=MAX_KEYS_IN_MEMORY,
+                    help="сколько уникальных ключей держать в памяти до перехода на внешнюю сортировку")
+    args = ap.parse_args(argv)
 
-    print(f"Done -> {OUT} | files merged: {files_merged}, lines written: {rows_written}")
+    res = merge_streaming([Path(p) for p in INPUTS], Path(OUT), args.max_keys)
+    read = written = 0
+    for p, (n_read, n_written) in res["files"].items():
+        print(f"✓ {p}: added {n_written} lines" + (f" ({n_read - n_written} duplicates skipped)" if n_read > n_written else ""))
+        read += n_read
+        written += n_written
+    print(f"Done -> {OUT} | files merged: {len(res['files'])}, lines written: {written}, duplicates skipped: {read - written}")
 
 if __name__ == "__main__":
     main()
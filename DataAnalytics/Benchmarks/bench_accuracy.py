@@ -0,0 +1,103 @@
+"""
+Точность против скорости для вариантов модели тональности на наших данных:
+NB и линейная модель (логистическая регрессия, SGD), каждая — с биграммами и без.
+
+Берёт CSV с отзывами (по умолчанию all_reviews.csv; если его нет — синтетический корпус),
+откладывает каждый --holdout-й отзыв с рейтингом в тест, обучает варианты на остальных
+и сравнивает на тесте:
+  nb_accuracy       — знак LLR (для линейной — z) модели против класса по звёздам (1–2 / 4–5, без троек);
+  ensemble_accuracy — итоговая метка ансамбля против 1–2 negative / 3 neutral / 4–5 positive;
+  train_sec, predict_rows_per_sec, model_mb.
+Токенизация общая для всех вариантов и в замеры не входит.
+
+  python DataAnalytics/Benchmarks/bench_accuracy.py
+  python DataAnalytics/Benchmarks/bench_accuracy.py --csv Csv/Reviews/all_reviews.csv --holdout 4
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import add_sentiment as sa
+from synthetic_reviews import make_reviews
+
+LABEL_CODE = {"negative": -1, "neutral": 0, "positive": 1}
+
+
+def load_rows(path: Path, synthetic: int, seed: int):
+    if path.exists():
+        with path.open("r", encoding="utf-8-sig", newline="") as f:
+            return list(csv.DictReader(f)), str(path)
+    return make_reviews(synthetic, seed), f"synthetic {synthetic} rows"
+
+
+def model_mb(nb) -> float:
+    arrays = [v for v in nb.to_state().values() if isinstance(v, np.ndarray)]
+    return round(sum(a.nbytes for a in arrays) / 2**20, 2)
+
+
+def evaluate(name: str, make_model, corpus, train, test, stars) -> dict:
+    t0 = time.perf_counter()
+    nb = make_model()
+    nb.fit_batch(corpus, ((i, sa.rating_class({sa.RATING_COL: stars[i]})) for i in train))
+    if hasattr(nb, "_prepare"):
+        nb._prepare()
+    train_sec = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    llr, _ = nb.predict_llr_batch(corpus)
+    predict_sec = time.perf_counter() - t0
+
+    labels = np.array([LABEL_CODE[x] for x in sa.label_corpus(corpus, nb, test)])
+    r = np.array([stars[i] for i in test])
+    target = np.where(r >= 4, 1, np.where(r <= 2, -1, 0))
+    polar = target != 0
+    nb_sign = np.where(llr[test] > 0, 1, -1)
+    return {
+        "model": name,
+        "nb_accuracy": round(float((nb_sign[polar] == target[polar]).mean()), 4),
+        "ensemble_accuracy": round(float((labels == target).mean()), 4),
+        "train_sec": round(train_sec, 4),
+        "predict_rows_per_sec": round(len(corpus) / predict_sec, 1) if predict_sec > 0 else None,
+        "model_mb": model_mb(nb),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Точность/скорость вариантов модели тональности по звёздам.")
+    ap.add_argument("--csv", type=Path, default=Path(sa.DEFAULT_CSV))
+    ap.add_argument("--holdout", type=int, default=5, help="в тест идёт каждый N-й отзыв с рейтингом")
+    ap.add_argument("--synthetic", type=int, default=50_000, help="размер синтетики, если CSV нет")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args(argv)
+
+    rows, source = load_rows(args.csv, args.synthetic, args.seed)
+    stars = [sa.rating_value(r) for r in rows]
+    rated = [i for i, s in enumerate(stars) if s == s]
+    test = rated[::args.holdout]
+    test_set = set(test)
+    train = [i for i in rated if i not in test_set]
+    corpus = sa.build_corpus((r.get(sa.TEXT_COL) or "").strip() for r in rows)
+
+    variants = [
+        ("nb_unigram", lambda: sa.NBModel()),
+        ("nb_unigram_bigram", lambda: sa.NBModel(bigrams=True)),
+        ("linear_unigram", lambda: sa.LinearModel()),
+        ("linear_unigram_bigram", lambda: sa.LinearModel(bigrams=True)),
+    ]
+    result = {
+        "data": source,
+        "train_rows": len(train),
+        "test_rows": len(test),
+        "models": [evaluate(name, make, corpus, train, test, stars) for name, make in variants],
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Вливание маленькой дельты в большой all_reviews.csv (merged_new_reviews.merge_into_all_reviews).
+
+  full_rewrite — прежний путь: чтение всего CSV, множество ключей, перезапись файла целиком;
+  store_first  — первое слияние с ReviewStore: загрузка CSV в SQLite + дописывание дельты;
+  store_append — последующие слияния: поиск по индексу и дописывание только новых строк
+                 (без разметки тональности, sentiment=False);
+  store_append_sentiment — то же по умолчанию (sentiment=True): CSV размечен add_sentiment.py,
+                 новые строки размечаются и дообучают сохранённую NB-модель;
+  key_index    — проверка «отзыв уже есть» в инкрементальном парсере: открытие
+                 all_reviews.keys.npy (mmap) и поиск хэша против сканирования CSV в множество.
+
+Каждый прогон получает свою дельту (--delta новых строк и столько же дублей); время —
+медиана по --repeat прогонам, в JSON.
+
+  python DataAnalytics/Benchmarks/bench_merge.py --rows 50000 --delta 20
+"""
+import argparse
+import contextlib
+import csv
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+ROOT = HERE.parent.parent
+sys.path.insert(0, str(ROOT / "Csv" / "Reviews" / "NewReviews"))
+import numpy as np
+import merged_new_reviews as mnr
+import review_index
+from synthetic_reviews import FIELDS, make_reviews, write_csv
+
+
+def full_rewrite(delta: list[dict], fields: list[str]) -> int:
+    """Слияние как до ReviewStore: весь CSV в память и обратно."""
+    all_rows, all_fields = mnr._read_csv_safe(mnr.ALL_REVIEWS)
+    for col in fields + mnr.BASE_FIELDS:
+        if col not in all_fields:
+            all_fields.append(col)
+    existing = set(mnr._make_key(r) for r in all_rows)
+    added = 0
+    for row in delta:
+        key = mnr._make_key(row)
+        if key not in existing:
+            all_rows.append(row)
+            existing.add(key)
+            added += 1
+    mnr._write_csv(mnr.ALL_REVIEWS, all_fields, all_rows)
+    return added
+
+
+def _deltas(rows: list[dict], base: int, size: int, repeat: int):
+    for k in range(repeat):
+        new = [dict(r, author=f"{r['author']} #{k}") for r in rows[base + k * size:base + (k + 1) * size]]
+        yield new + [dict(r) for r in rows[k * size:(k + 1) * size]]
+
+
+def measure(merge, rows, base: int, size: int, repeat: int, first_only: bool = False) -> dict:
+    times, added = [], 0
+    for delta in _deltas(rows, base, size, 1 if first_only else repeat):
+        t0 = time.perf_counter()
+        added = merge(delta, FIELDS)
+        times.append(time.perf_counter() - t0)
+    return {"ms": round(statistics.median(times) * 1000, 2), "added": added,
+            "csv_mb": round(mnr.ALL_REVIEWS.stat().st_size / 2**20, 2)}
+
+
+def measure_key_index(probes: list[dict]) -> dict:
+    t0 = time.perf_counter()
+    with mnr.ALL_REVIEWS.open("r", encoding="utf-8-sig", newline="") as f:
+        keys = {review_index.review_key_hash(r["platform"], r["organization"], r["author"], r["text"]) for r in csv.DictReader(f)}
+    scan_sec = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    index = np.load(mnr.KEY_INDEX, mmap_mode="r")
+    open_sec = time.perf_counter() - t0
+    hashes = [review_index.review_key_hash(r["platform"], r["organization"], r["author"], r["text"]) for r in probes]
+    t0 = time.perf_counter()
+    found = 0
+    for h in hashes:
+        found += review_index.in_review_key_index(index, h)
+    lookup_sec = (time.perf_counter() - t0) / len(hashes)
+    assert found == sum(h in keys for h in hashes)
+    return {"csv_scan_ms": round(scan_sec * 1000, 2), "open_ms": round(open_sec * 1000, 3),
+            "lookup_us": round(lookup_sec * 1e6, 2), "keys": len(index), "probes": len(hashes), "found": found}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Слияние дельты: перезапись CSV против ReviewStore с дописыванием.")
+    ap.add_argument("--rows", type=int, default=50_000, help="строк в all_reviews.csv")
+    ap.add_argument("--delta", type=int, default=20, help="новых строк в дельте")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args(argv)
+
+    rows = make_reviews(args.rows + args.delta * args.repeat * 2, args.seed)
+    base = rows[:args.rows]
+    cwd = os.getcwd()
+    result = {"rows": args.rows, "delta": args.delta}
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            mnr.ALL_REVIEWS.parent.mkdir(parents=True, exist_ok=True)
+            write_csv(mnr.ALL_REVIEWS, base)
+            shutil.copy2(mnr.ALL_REVIEWS, "all_reviews.orig.csv")
+            result["full_rewrite"] = measure(full_rewrite, rows, args.rows, args.delta, args.repeat)
+
+            shutil.copy2("all_reviews.orig.csv", mnr.ALL_REVIEWS)
+            merge = lambda delta, fields: mnr.merge_into_all_reviews(delta, fields, sentiment=False)
+            result["store_first"] = measure(merge,
+                                            rows, args.rows, args.delta, args.repeat, first_only=True)
+            shutil.copy2("all_reviews.orig.csv", mnr.ALL_REVIEWS)
+            mnr.REVIEW_DB.unlink()
+            merge([], FIELDS)
+            result["store_append"] = measure(merge,
+                                             rows, args.rows, args.delta, args.repeat)
+            result["key_index"] = measure_key_index(rows[::max(1, len(rows) // 1000)])
+
+            sa = mnr._sentiment_module()
+            if sa is not None:
+                with contextlib.redirect_stdout(sys.stderr):
+                    sa.process_csv(mnr.ALL_REVIEWS, workers=1)
+                    mnr.merge_into_all_reviews([], FIELDS)
+                    result["store_append_sentiment"] = measure(mnr.merge_into_all_reviews, rows,
+                                                               args.rows + args.delta * args.repeat,
+                                                               args.delta, args.repeat)
+        finally:
+            os.chdir(cwd)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Память и время загрузки NB-модели: прежнее представление (два Counter + множество vocab,
+JSON-файл) против компактного (массивы int32 по id леммы, один .npz).
+
+Модель обучается на синтетическом корпусе (или на готовом CSV через --csv), сохраняется
+в обоих форматах, после чего каждый загружается заново: время — лучшее из --repeat
+прогонов, память — прирост (tracemalloc) от загруженной модели и пик при загрузке.
+
+  python DataAnalytics/Benchmarks/bench_nb_model.py --rows 100000
+  python DataAnalytics/Benchmarks/bench_nb_model.py --csv Csv/Reviews/all_reviews.csv
+"""
+import argparse
+import csv
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import add_sentiment as sa
+from bench_sentiment import reset_token_tables
+from synthetic_reviews import make_reviews
+
+
+def save_counter_json(path: Path, nb: sa.NBModel):
+    """Прежний формат .nb_model.json: словари счётчиков и список vocab."""
+    st = nb.to_state()
+    lemmas = st["lemmas"]
+    model = {
+        "pos_counts": {w: int(c) for w, c in zip(lemmas, st["pos_counts"]) if c},
+        "neg_counts": {w: int(c) for w, c in zip(lemmas, st["neg_counts"]) if c},
+        "pos_total": st["pos_total"], "neg_total": st["neg_total"],
+        "vocab": lemmas, "pos_docs": st["pos_docs"], "neg_docs": st["neg_docs"],
+    }
+    with path.open("w", encoding="utf-8") as f:
+        json.dump({"version": 1, "model": model}, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def load_counter_json(path: Path):
+    with path.open("r", encoding="utf-8") as f:
+        st = json.load(f)["model"]
+    return (Counter(st["pos_counts"]), Counter(st["neg_counts"]), set(st["vocab"]),
+            st["pos_total"], st["neg_total"], st["pos_docs"], st["neg_docs"])
+
+
+def load_compact(csv_path: Path):
+    return sa.NBModel.from_state(sa._read_nb_model_file(csv_path)["model"])
+
+
+def measure(load, repeat: int) -> dict:
+    best = None
+    for _ in range(repeat):
+        reset_token_tables()
+        t0 = time.perf_counter()
+        load()
+        sec = time.perf_counter() - t0
+        best = sec if best is None else min(best, sec)
+    reset_token_tables()
+    tracemalloc.start()
+    obj = load()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return {"load_ms": round(best * 1000, 2), "retained_mb": round(retained / 2**20, 3),
+            "peak_mb": round(peak / 2**20, 3)}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="NB-модель: Counter/JSON против массивов/.npz.")
+    ap.add_argument("--rows", type=int, default=100_000, help="размер синтетического корпуса")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--csv", type=Path, help="обучить на готовом CSV вместо синтетики")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args(argv)
+
+    if args.csv:
+        with args.csv.open("r", encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        rows = make_reviews(args.rows, args.seed)
+    nb = sa.train_nb_from_rows(rows)
+    classes = [sa.rating_class(r) for r in rows]
+    fps = array("Q", (sa.text_fingerprint((r.get(sa.TEXT_COL) or "").strip()) for r in rows))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "reviews.csv"
+        json_path = Path(tmp) / "reviews.nb_model.json"
+        save_counter_json(json_path, nb)
+        sa.save_nb_model(csv_path, nb, fps, classes)
+        sizes = {"json_kb": round(json_path.stat().st_size / 1024, 1),
+                 "npz_kb": round(sa.nb_model_path(csv_path).stat().st_size / 1024, 1)}
+        counter = measure(lambda: load_counter_json(json_path), args.repeat)
+        compact = measure(lambda: load_compact(csv_path), args.repeat)
+
+    result = {
+        "rows": len(rows),
+        "vocab": nb.vocab_size(),
+        "file": sizes,
+        "counter_json": counter,
+        "compact_npz": compact,
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
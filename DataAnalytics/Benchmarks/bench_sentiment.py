@@ -0,0 +1,169 @@
+"""
+Бенчмарк add_sentiment по стадиям на синтетических корпусах (по умолчанию 1k/10k/100k строк).
+
+Стадии: загрузка лексикона, токенизация+лемматизация (холодный кэш лемм), обучение NB,
+предсказание NB, лексиконная оценка и process_csv целиком. Для каждой стадии — время,
+строк/с и пик памяти (tracemalloc, отдельным прогоном). Результат печатается как JSON
+и сверяется с сохранённым baseline: стадии, просевшие по строкам/с больше допуска, считаются
+регрессией и скрипт завершается с кодом 1. Строк/с зависят от машины, поэтому baseline
+в репозитории не хранится: без него скрипт завершается с кодом 2 (сначала --update-baseline
+на этой машине; --no-compare — только замер).
+
+  python DataAnalytics/Benchmarks/bench_sentiment.py --update-baseline
+  python DataAnalytics/Benchmarks/bench_sentiment.py --sizes 1000,10000
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import add_sentiment as sa
+from synthetic_reviews import make_reviews, write_csv
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+DEFAULT_SIZES = "1000,10000,100000"
+# Стадии быстрее этого порога слишком шумные, чтобы ловить по ним регрессии
+MIN_COMPARE_SECONDS = 0.02
+
+
+def reset_token_tables():
+    """Сбрасывает словарь токенов и кэш лемм процесса, чтобы лемматизация мерилась «с нуля»."""
+    sa.reset_token_tables()
+    sa._lemma_cache.clear()
+
+
+def measure(setup, fn, items: int, memory: bool) -> dict:
+    state = setup()
+    t0 = time.perf_counter()
+    fn(state)
+    sec = time.perf_counter() - t0
+    res = {"seconds": round(sec, 4), "rows_per_sec": round(items / sec, 1) if sec > 0 else None}
+    if memory:
+        state = setup()
+        tracemalloc.start()
+        fn(state)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        res["peak_mb"] = round(peak / 2**20, 2)
+    return res
+
+
+def bench_size(n: int, seed: int, memory: bool, workdir: Path) -> dict:
+    rows = make_reviews(n, seed)
+    texts = [r["text"] for r in rows]
+    out = {}
+
+    def cold():
+        reset_token_tables()
+
+    out["lemmatize"] = measure(cold, lambda _: sa.build_corpus(texts), n, memory)
+
+    corpus = sa.build_corpus(texts)
+    out["nb_train"] = measure(lambda: None, lambda _: sa.train_nb_from_rows(rows, corpus), n, memory)
+
+    nb = sa.train_nb_from_rows(rows, corpus)
+    nb._prepare()
+    out["nb_predict"] = measure(lambda: None, lambda _: nb.predict_llr_batch(corpus), n, memory)
+
+    def lex_all(_):
+        for i in range(len(corpus)):
+            sa._lex_score_ids(corpus.doc(i), corpus.emoji[i], corpus.excl[i])
+
+    out["lex_score"] = measure(lambda: None, lex_all, n, memory)
+
+    src = workdir / f"reviews_{n}.csv"
+    write_csv(src, rows)
+
+    def fresh_copy():
+        dst = workdir / f"run_{n}.csv"
+        shutil.copyfile(src, dst)
+        for p in (sa.fingerprint_path(dst), sa.nb_model_path(dst)):
+            p.unlink(missing_ok=True)
+        reset_token_tables()
+        return dst
+
+    def end_to_end(path):
+        with contextlib.redirect_stdout(io.StringIO()):
+            sa.process_csv(path, workers=1, result_cache=False)
+
+    out["end_to_end"] = measure(fresh_copy, end_to_end, n, memory)
+    return out
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Список регрессий: стадии, у которых строк/с упало больше чем на tolerance от baseline."""
+    problems = []
+    for size, stages in result["sizes"].items():
+        for stage, cur in stages.items():
+            base = baseline.get("sizes", {}).get(size, {}).get(stage)
+            if not base or not base.get("rows_per_sec") or not cur.get("rows_per_sec"):
+                continue
+            if base.get("seconds", 0) < MIN_COMPARE_SECONDS:
+                continue
+            if cur["rows_per_sec"] < base["rows_per_sec"] * (1.0 - tolerance):
+                problems.append(f"{size} rows / {stage}: {cur['rows_per_sec']} rows/s "
+                                f"vs baseline {base['rows_per_sec']} rows/s")
+    return problems
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Бенчмарк стадий add_sentiment.")
+    ap.add_argument("--sizes", default=DEFAULT_SIZES, help="размеры корпусов через запятую")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", type=Path, help="куда дополнительно записать JSON с результатом")
+    ap.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    ap.add_argument("--update-baseline", action="store_true", help="сохранить результат как baseline")
+    ap.add_argument("--no-compare", action="store_true", help="только замер, без сверки с baseline")
+    ap.add_argument("--tolerance", type=float, default=0.3, help="допустимое падение строк/с (доля)")
+    ap.add_argument("--no-memory", action="store_true", help="не замерять пик памяти")
+    args = ap.parse_args(argv)
+
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    memory = not args.no_memory
+
+    result = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "lexicon_entries": len(sa.RU_SENTI),
+        "lexicon_load": measure(lambda: None, lambda _: sa.load_local_rusentilex(),
+                                max(1, len(sa.RU_SENTI)), memory),
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        # Синтетические прогоны не должны дописывать общий кэш лемм
+        sa.LEMMA_CACHE_FILE = Path(tmp) / "lemma_cache.tsv"
+        for n in sizes:
+            result["sizes"][str(n)] = bench_size(n, args.seed, memory, Path(tmp))
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    print(text)
+    if args.out:
+        args.out.write_text(text, encoding="utf-8")
+
+    if args.update_baseline:
+        args.baseline.write_text(text, encoding="utf-8")
+        print(f"Baseline saved: {args.baseline}", file=sys.stderr)
+        return 0
+    if args.no_compare:
+        return 0
+    if not args.baseline.exists():
+        print(f"ERROR: no baseline at {args.baseline} - the regression gate cannot run. "
+              f"Store one on this machine with --update-baseline (or pass --no-compare to only measure).",
+              file=sys.stderr)
+        return 2
+    problems = compare(result, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+    for p in problems:
+        print(f"REGRESSION: {p}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+Холодный старт против резидентного sentiment_worker на дельте из 50 отзывов.
+
+  cold_cli      — add_sentiment.py --incremental --no-worker (загрузка pymorphy, лексикона, модели);
+  warm_cli      — тот же вызов, который передаёт работу запущенному sentiment_worker;
+  warm_label    — remote_label_batch() для 50 текстов напрямую по сокету.
+
+  python DataAnalytics/Benchmarks/bench_worker.py --base-rows 5000 --repeat 3
+"""
+import argparse
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+ROOT = HERE.parent.parent
+sys.path.insert(0, str(HERE.parent))
+import sentiment_worker as sw
+from synthetic_reviews import make_reviews, write_csv
+
+SCRIPT = ROOT / "DataAnalytics" / "add_sentiment.py"
+WORKER = ROOT / "DataAnalytics" / "sentiment_worker.py"
+
+
+def _run_cli(csv_path: Path, *extra: str) -> float:
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, str(SCRIPT), "--incremental", "--workers", "1", *extra, str(csv_path)],
+                   cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - t0
+
+
+def _snapshot(csv_path: Path, dst: Path):
+    dst.mkdir(parents=True, exist_ok=True)
+    for p in csv_path.parent.glob(csv_path.stem + ".*"):
+        shutil.copy2(p, dst / p.name)
+
+
+def _restore(src: Path, csv_path: Path):
+    for p in src.iterdir():
+        shutil.copy2(p, csv_path.parent / p.name)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Холодный старт против резидентного процесса разметки.")
+    ap.add_argument("--base-rows", type=int, default=5000)
+    ap.add_argument("--delta", type=int, default=50)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    if sw.ping():
+        print("A sentiment worker is already running - stop it first (sentiment_worker.py --stop).", file=sys.stderr)
+        return 2
+
+    rows = make_reviews(args.base_rows + args.delta, seed=7)
+    base, delta = rows[:args.base_rows], rows[args.base_rows:]
+    delta_texts = [r["text"] for r in delta]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "data" / "all_reviews.csv"
+        write_csv(csv_path, base)
+        subprocess.run([sys.executable, str(SCRIPT), "--no-worker", "--workers", "1", str(csv_path)],
+                       cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        write_csv(csv_path.with_name("delta.tmp"), delta)
+        with csv_path.open("a", encoding="utf-8", newline="") as f, \
+                csv_path.with_name("delta.tmp").open("r", encoding="utf-8") as d:
+            next(d)
+            shutil.copyfileobj(d, f)
+        csv_path.with_name("delta.tmp").unlink()
+        snap = Path(tmp) / "snap"
+        _snapshot(csv_path, snap)
+
+        cold = []
+        for _ in range(args.repeat):
+            _restore(snap, csv_path)
+            cold.append(_run_cli(csv_path, "--no-worker"))
+
+        worker = subprocess.Popen([sys.executable, str(WORKER), "--csv", str(csv_path)],
+                                  cwd=ROOT, stdout=subprocess.DEVNULL)
+        try:
+            t0 = time.perf_counter()
+            while not sw.ping():
+                if worker.poll() is not None or time.perf_counter() - t0 > 120:
+                    raise RuntimeError("sentiment worker did not start")
+                time.sleep(0.05)
+            startup = time.perf_counter() - t0
+
+            warm = []
+            for _ in range(args.repeat):
+                _restore(snap, csv_path)
+                warm.append(_run_cli(csv_path))
+
+            label = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                if sw.remote_label_batch(delta_texts) is None:
+                    raise RuntimeError("sentiment worker did not answer")
+                label.append(time.perf_counter() - t0)
+        finally:
+            sw.stop()
+            worker.wait(timeout=30)
+
+    result = {
+        "base_rows": args.base_rows,
+        "delta_rows": args.delta,
+        "cold_cli_s": round(statistics.median(cold), 4),
+        "worker_startup_s": round(startup, 4),
+        "warm_cli_s": round(statistics.median(warm), 4),
+        "warm_label_ms": round(statistics.median(label) * 1000, 2),
+    }
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
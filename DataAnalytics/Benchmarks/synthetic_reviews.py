@@ -0,0 +1,91 @@
+"""
+Детерминированный синтетический корпус русских отзывов для бенчмарков add_sentiment.
+
+Слова берутся из POS_BASE/NEG_BASE, однословных статей RuSentiLex (если словарь найден),
+отрицаний, усилителей, фраз-триггеров и эмодзи; рейтинг согласован с тональностью текста
+(с небольшим шумом), часть отзывов без рейтинга.
+"""
+import csv
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import add_sentiment as sa
+
+FIELDS = ["rating", "author", "date_iso", "text", "platform", "organization"]
+PLATFORMS = ["Yandex Maps", "Google Maps", "2GIS"]
+ORGS = ["Автолоцман Север", "Автолоцман Юг", "Автолоцман Центр"]
+
+FILLER = (
+    "машина автомобиль салон менеджер сервис ремонт запчасти цена кредит страховка тест-драйв "
+    "приехал купил забрал ждал день неделю месяц договор оформление мастер приемка диагностика "
+    "колесо масло кузов гарантия скидка продавец консультант документы звонок запись"
+).split()
+
+
+def _lexicon_words():
+    pos = sorted(w for w, v in sa.RU_SENTI.items() if v > 0 and " " not in w)
+    neg = sorted(w for w, v in sa.RU_SENTI.items() if v < 0 and " " not in w)
+    return pos, neg
+
+
+def make_reviews(n: int, seed: int = 42) -> list[dict]:
+    rnd = random.Random(seed)
+    lex_pos, lex_neg = _lexicon_words()
+    pos_words = sorted(sa.POS_BASE) + lex_pos[:2000]
+    neg_words = sorted(sa.NEG_BASE) + lex_neg[:2000]
+    negations = sorted(sa.NEGATIONS)
+    intens = sorted(sa.INTENSIFIERS | sa.DIMINISHERS)
+    pos_emoji = sorted(sa.POS_EMOJI)
+    neg_emoji = sorted(sa.NEG_EMOJI)
+    pos_ph = sorted(sa.POS_TRIGGERS)
+    neg_ph = sorted(sa.NEG_TRIGGERS | sa.NEG_PREFIX_TRIGGERS)
+
+    rows = []
+    for i in range(n):
+        polarity = rnd.choices(("pos", "neg", "neu"), weights=(50, 35, 15))[0]
+        own, other = (pos_words, neg_words) if polarity != "neg" else (neg_words, pos_words)
+        toks = []
+        for _ in range(rnd.randint(3, 40)):
+            r = rnd.random()
+            if polarity != "neu" and r < 0.22:
+                toks.append(rnd.choice(own))
+            elif r < 0.27:
+                toks.append(rnd.choice(other))
+            elif r < 0.33:
+                toks.append(rnd.choice(negations))
+            elif r < 0.40:
+                toks.append(rnd.choice(intens))
+            else:
+                toks.append(rnd.choice(FILLER))
+        if rnd.random() < 0.05:
+            toks.insert(rnd.randrange(len(toks) + 1), rnd.choice(pos_ph if polarity == "pos" else neg_ph))
+        text = " ".join(toks).capitalize()
+        if rnd.random() < 0.15:
+            text += " " + rnd.choice(pos_emoji if polarity == "pos" else neg_emoji)
+        if rnd.random() < 0.2:
+            text += "!" * rnd.randint(1, 3)
+
+        if rnd.random() < 0.1:
+            rating = ""
+        else:
+            stars = {"pos": (4, 5), "neg": (1, 2), "neu": (3, 3)}[polarity]
+            rating = str(rnd.randint(1, 5) if rnd.random() < 0.1 else rnd.randint(*stars))
+        rows.append({
+            "rating": rating,
+            "author": f"user{i}",
+            "date_iso": f"2024-{(i // 28) % 12 + 1:02d}-{i % 28 + 1:02d}",
+            "text": text,
+            "platform": PLATFORMS[i % len(PLATFORMS)],
+            "organization": ORGS[(i // 3) % len(ORGS)],
+        })
+    return rows
+
+
+def write_csv(path: Path, rows: list[dict]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=FIELDS, quoting=csv.QUOTE_ALL)
+        w.writeheader()
+        w.writerows(rows)
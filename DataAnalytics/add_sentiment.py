@@ -1,65 +1,284 @@
-import csv, sys, re, math
-import pymorphy3 as pymorphy
+import time
+_IMPORT_T0 = time.perf_counter()
+
+import csv, sys, os, re, math, json, hashlib, pickle, sqlite3, argparse, tempfile, multiprocessing
 from pathlib import Path
-from collections import Counter
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+import sentiment_worker
+
+if TYPE_CHECKING:
+    import numpy as np  # только для аннотаций: numpy импортируется лениво через _numpy()
 
 DEFAULT_CSV = "Csv/Reviews/all_reviews.csv"
 TEXT_COL = "text"
 SENT_COL = "sentiment"
 RATING_COL = "rating"
 
-_morph = pymorphy.MorphAnalyzer()
+# Кэши лежат рядом с модулем, а не в рабочей папке. В сборке PyInstaller (--onefile)
+# __file__ указывает во временную папку распаковки — там кэш в папке приложения.
+CACHE_DIR = (Path("DataAnalytics/Cache") if getattr(sys, "frozen", False)
+             else Path(__file__).resolve().parent / "Cache")
+LEMMA_CACHE_FILE = CACHE_DIR / "lemma_cache.tsv"
+LEMMA_CACHE_MAX = 300_000
+RESULT_CACHE_FILE = CACHE_DIR / "sentiment_results.sqlite"
+
+# Тяжёлые ресурсы (pymorphy3 и его словари, лексикон, numpy) поднимаются при первом
+# обращении, чтобы normalize_text/lex_label и т.п. импортировались мгновенно.
+STARTUP_PROFILE: dict[str, float] = {}
+
+@contextmanager
+def _timed(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_PROFILE[stage] = STARTUP_PROFILE.get(stage, 0.0) + time.perf_counter() - t0
+
+_pymorphy = None
+_morph = None
+_np = None
+
+def _pymorphy_module():
+    global _pymorphy
+    if _pymorphy is None:
+        with _timed("import pymorphy3"):
+            import pymorphy3
+        _pymorphy = pymorphy3
+    return _pymorphy
+
+def _get_morph():
+    global _morph
+    if _morph is None:
+        pm = _pymorphy_module()
+        with _timed("load pymorphy dictionaries"):
+            _morph = pm.MorphAnalyzer()
+    return _morph
+
+def _numpy():
+    global _np
+    if _np is None:
+        with _timed("import numpy"):
+            import numpy
+        _np = numpy
+    return _np
+
+def morph_stamp() -> str:
+    return f"pymorphy3 {getattr(_pymorphy_module(), '__version__', '?')}"
+
+_lemma_cache: dict[str, str] = {}
+_lemma_new: dict[str, str] = {}
+_lemma_cache_loaded = False
+_lemma_file_rows = 0  # строк-пар в файле кэша (по load_lemma_cache и save_lemma_cache)
+_lemma_hits = 0
+_lemma_misses = 0
+
+def _parse_lemma(t: str) -> str:
+    try:
+        return _get_morph().parse(t)[0].normal_form
+    except Exception:
+        return t
 
 def lemma(tok: str) -> str:
+    global _lemma_hits, _lemma_misses
     t = (tok or "").lower().replace("ё", "е")
-    if _morph:
-        try:
-            return _morph.parse(t)[0].normal_form
-        except Exception:
-            return t
-    return t
-
-def load_local_rusentilex() -> dict:
-    candidates = [
-        Path("lexicons/rusentilex_2017.txt"),
-        Path("lexicons/rusentilex_2017.tsv"),
-        Path("lexicons/rusentilex_2017.csv"),
-        Path("rusentilex_2017.txt"),
-        Path("rusentilex.txt"),
-    ]
-    file = next((p for p in candidates if p.exists()), None)
-    if not file:
-        return {}
+    lem = _lemma_cache.get(t)
+    if lem is None and not _lemma_cache_loaded:
+        load_lemma_cache()
+        lem = _lemma_cache.get(t)
+    if lem is not None:
+        _lemma_hits += 1
+        return lem
+    _lemma_misses += 1
+    lem = _parse_lemma(t)
+    if len(_lemma_cache) >= LEMMA_CACHE_MAX:
+        _lemma_cache.pop(next(iter(_lemma_cache)))
+    _lemma_cache[t] = lem
+    if "\t" not in t and "\n" not in t:
+        _lemma_new[t] = lem
+    return lem
+
+def lemma_cache_hit_rate() -> float:
+    total = _lemma_hits + _lemma_misses
+    return _lemma_hits / total if total else 0.0
+
+def load_lemma_cache(path: Path = None) -> int:
+    """Подгружает сохранённые пары словоформа → лемма (если кэш от той же версии pymorphy)."""
+    global _lemma_cache_loaded, _lemma_file_rows
+    _lemma_cache_loaded = True
+    _lemma_file_rows = 0
+    path = path or LEMMA_CACHE_FILE
+    if not path.exists():
+        return 0
+    loaded = 0
+    try:
+        with _timed("load lemma cache"), path.open("r", encoding="utf-8") as f:
+            if f.readline().rstrip("\n") != morph_stamp():
+                return 0
+            for line in f:
+                _lemma_file_rows += 1
+                if loaded >= LEMMA_CACHE_MAX:
+                    continue
+                form, sep, lem = line.rstrip("\n").partition("\t")
+                if sep and form not in _lemma_cache:
+                    _lemma_cache[form] = lem
+                    loaded += 1
+    except OSError:
+        return 0
+    return loaded
+
+def save_lemma_cache(path: Path = None) -> int:
+    """
+    Дописывает в файл кэша пары, посчитанные в этом запуске. Если в файле стало бы больше
+    LEMMA_CACHE_MAX пар (дальше load_lemma_cache не читает — такие формы считались бы и
+    дописывались заново каждый запуск), файл атомарно переписывается последними 3/4 LEMMA_CACHE_MAX
+    парами кэша процесса — с запасом, чтобы не переписывать его при каждом сохранении.
+    """
+    global _lemma_file_rows
+    if not _lemma_new:
+        return 0
+    path = path or LEMMA_CACHE_FILE
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fresh = not path.exists()
+        if not fresh:
+            with path.open("r", encoding="utf-8") as f:
+                fresh = f.readline().rstrip("\n") != morph_stamp()
+        if fresh:
+            _lemma_file_rows = 0
+        if _lemma_file_rows + len(_lemma_new) > LEMMA_CACHE_MAX:
+            pairs = [(form, lem) for form, lem in {**_lemma_cache, **_lemma_new}.items()
+                     if "\t" not in form and "\n" not in form]
+            pairs = pairs[-(LEMMA_CACHE_MAX * 3 // 4):]
+            with _atomic_writer(path) as f:
+                f.write(morph_stamp() + "\n")
+                f.writelines(f"{form}\t{lem}\n" for form, lem in pairs)
+            _lemma_file_rows = len(pairs)
+        else:
+            with path.open("w" if fresh else "a", encoding="utf-8", newline="\n") as f:
+                if fresh:
+                    f.write(morph_stamp() + "\n")
+                for form, lem in _lemma_new.items():
+                    f.write(f"{form}\t{lem}\n")
+            _lemma_file_rows += len(_lemma_new)
+    except OSError:
+        return 0
+    n = len(_lemma_new)
+    _lemma_new.clear()
+    return n
+
+
+LEXICON_NAMES = ["rusentilex_2017.txt", "rusentilex_2017.tsv", "rusentilex_2017.csv"]
+LEXICON_CACHE_FILE = CACHE_DIR / "rusentilex.lexcache"
+LEXICON_CACHE_VERSION = 2
+RUSENTILEX_POLARITY = {"positive": 1.0, "negative": -1.0}
+
+def find_lexicon_file():
+    roots = [Path("Lexicons"), Path("lexicons"), Path(__file__).resolve().parent.parent / "Lexicons"]
+    candidates = [root / name for root in roots for name in LEXICON_NAMES]
+    candidates += [Path("rusentilex_2017.txt"), Path("rusentilex.txt")]
+    return next((p for p in candidates if p.exists()), None)
+
+def _parse_lexicon_line(s: str):
+    """(заголовок, вес) из строки словаря; None — если строку нужно пропустить."""
+    parts = [x.strip() for x in re.split(r"\t|;|,|\s{2,}", s)]
+    # RuSentiLex: слово, часть речи, лемма, тональность, источник[, значения]
+    if len(parts) >= 4 and parts[3].lower() in ("positive", "negative", "neutral", "positive/negative"):
+        w = RUSENTILEX_POLARITY.get(parts[3].lower())
+        return (parts[0], w) if w is not None else None
+    w = None
+    for x in parts[1:]:
+        m = re.search(r"[-+]?\d+(?:\.\d+)?", x)
+        if m:
+            try:
+                w = float(m.group(0)); break
+            except:
+                pass
+    if w is None:
+        j = " ".join(parts[1:]).lower()
+        if "pos" in j: w = 1.0
+        elif "neg" in j: w = -1.0
+    if w is None:
+        return None
+    return parts[0], float(w)
+
+def _build_rusentilex(file: Path) -> dict:
     lex = {}
     with file.open("r", encoding="utf-8", errors="ignore") as f:
         for raw in f:
             s = raw.strip()
-            if not s or s.startswith("#"):
+            if not s or s.startswith(("#", "!")):
                 continue
-            parts = re.split(r"\t|;|,|\s{2,}", s)
-            w = None
-            for x in parts[1:]:
-                m = re.search(r"[-+]?\d+(?:\.\d+)?", x)
-                if m:
-                    try:
-                        w = float(m.group(0)); break
-                    except:
-                        pass
-            if w is None:
-                j = " ".join(parts[1:]).lower()
-                if "pos" in j: w = 1.0
-                elif "neg" in j: w = -1.0
-            if w is None: 
+            entry = _parse_lexicon_line(s)
+            if entry is None:
                 continue
-            w = float(w)
-            lem = lemma((parts[0] if parts else "").strip())
+            head, w = entry
+            # многословные статьи храним последовательностью лемм через пробел
+            lem = " ".join(lemma(x) for x in head.split())
             if lem:
                 old = lex.get(lem)
                 if old is None or abs(w) > abs(old):
                     lex[lem] = w
     return lex
 
-RU_SENTI = load_local_rusentilex()
+def _lexicon_stamp(file: Path) -> str:
+    digest = hashlib.sha256(file.read_bytes()).hexdigest()
+    return f"v{LEXICON_CACHE_VERSION} {digest} {morph_stamp()}"
+
+def _read_lexicon_cache(stamp: str, path: Path = LEXICON_CACHE_FILE):
+    """Скомпилированный словарь: штамп, леммы одной строкой через \\n и веса массивом float64."""
+    try:
+        with path.open("rb") as f:
+            cached_stamp, words, weights = pickle.load(f)
+    except Exception:
+        return None
+    if cached_stamp != stamp:
+        return None
+    w = array("d")
+    w.frombytes(weights)
+    keys = words.split("\n") if words else []
+    if len(keys) != len(w):
+        return None
+    return dict(zip(keys, w))
+
+def _write_lexicon_cache(stamp: str, lex: dict, path: Path = LEXICON_CACHE_FILE):
+    keys = [k for k in lex if "\n" not in k]
+    payload = (stamp, "\n".join(keys), array("d", (lex[k] for k in keys)).tobytes())
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with tmp.open("wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+def load_local_rusentilex(use_cache: bool = True) -> dict:
+    file = find_lexicon_file()
+    if not file:
+        return {}
+    stamp = _lexicon_stamp(file)
+    if use_cache:
+        lex = _read_lexicon_cache(stamp)
+        if lex is not None:
+            return lex
+    lex = _build_rusentilex(file)
+    if use_cache:
+        _write_lexicon_cache(stamp, lex)
+    return lex
+
+_ru_senti = None
+
+def get_lexicon() -> dict:
+    """RuSentiLex (лемма или последовательность лемм → вес); загружается при первом обращении."""
+    global _ru_senti
+    if _ru_senti is None:
+        with _timed("build lexicon"):
+            _ru_senti = load_local_rusentilex()
+    return _ru_senti
 
 POS_BASE = {
     "рекомендовать","советовать","молодец","отлично","отличный","хорошо","хороший","супер","классный",
@@ -80,7 +299,9 @@ DIMINISHERS   = {"слегка","немного","чуть","чутка","едв
 POS_EMOJI     = {"🙂","😊","😃","😍","👍","🔥","💪","🥳","😄","😎"}
 NEG_EMOJI     = {"☹","🙁","😠","😡","👎","💩","😭","😤","😞","😣"}
 NEG_TRIGGERS  = {"не советую","не рекомендую","ни в коем случае","никогда не обращайтесь",
-                 "полный ужас","полный отстой","развод","лохотрон","мошенник","мошенничество","отвратительно","отвратно"}
+                 "полный ужас","полный отстой"}
+NEG_PREFIX_TRIGGERS = {"развод","лохотрон","мошенник","мошенничество"}
+TRIGGER_NEGATIONS   = {"не","без","ни"}
 POS_TRIGGERS  = {"без проблем","все отлично","всё отлично","очень доволен","очень довольна",
                  "все супер","всё супер"}
 
@@ -91,6 +312,18 @@ LEX_NEG_TH_SHORT      = -0.10
 LEX_POS_TH_LONG       = 0.14
 LEX_NEG_TH_LONG       = -0.11
 
+# Ансамбль NB + словарь (подбор по звёздам: DataAnalytics/tune_sentiment.py)
+NB_WEIGHT             = 0.6
+LEX_WEIGHT            = 0.4
+FUSED_NEUTRAL         = 0.08   # |fused| ниже — нейтрально
+DISAGREE_NEUTRAL      = 0.22   # NB и словарь спорят, и оба слабее — нейтрально
+WEAK_FUSED            = 0.15   # при <=1 словарном попадании |fused| ниже — нейтрально
+FUSED_POS_TH          = 0.15
+FUSED_NEG_TH          = -0.13
+
+HARD_NEG = 1
+HARD_POS = 2
+
 def normalize_text(s: str) -> str:
     s = (s or "").lower().replace("ё","е")
     s = re.sub(r"[^\w\s!?%:+\-]", " ", s, flags=re.U)
@@ -104,78 +337,273 @@ def emoji_score(raw: str) -> float:
     n = sum(ch in NEG_EMOJI for ch in (raw or ""))
     return float(p - n)
 
-def phrase_flags_and_score(raw: str):
-    txt = (raw or "").lower().replace("ё","е")
-    toks = re.findall(r"\w+|[!?]+", txt)
+def _trie_regex(phrases) -> str:
+    """Альтернатива фраз, свёрнутая в префиксное дерево: на каждой позиции проверяется не больше одной ветки."""
+    trie: dict = {}
+    for ph in phrases:
+        node = trie
+        for ch in ph:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def walk(node) -> str:
+        end = "" in node
+        alts = [re.escape(ch) + walk(sub) for ch, sub in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return "(?:" + body + ")?" if end else body
+
+    return walk(trie)
 
-    negations = {"не","без","ни"}
+def _norm_phrases(phrases):
+    return {p.lower().replace("ё", "е") for p in phrases}
+
+# Все триггеры ищутся одним проходом по исходному тексту в нижнем регистре (как раньше —
+# без normalize_text: фраза ищется подстрокой, пунктуация её разрывает):
+#   neg  — фраза-триггер негатива, pos — фраза-триггер позитива,
+#   noobm — «без обмана», pref — начало слова-триггера негатива (если перед ним нет отрицания).
+# Группы внутри опережающей проверки: совпадение ничего не поглощает, и фразы,
+# перекрывающиеся с другими, находятся так же, как при поиске каждой по отдельности.
+TRIGGER_RE = re.compile(
+    rf"(?=(?P<neg>{_trie_regex(_norm_phrases(NEG_TRIGGERS))})"
+    rf"|(?P<pos>{_trie_regex(_norm_phrases(POS_TRIGGERS))})"
+    rf"|(?P<noobm>\bбез\s+обман\w*\b)"
+    rf"|(?<!\w)(?P<pref>{_trie_regex(_norm_phrases(NEG_PREFIX_TRIGGERS))}))"
+)
+TRIGGER_TOKEN_RE = re.compile(r"\w+|[!?]+")
+
+def _phrase_flags(raw: str):
+    txt = (raw or "").lower().replace("ё", "е")
     hard_neg = False
     hard_pos = False
     ph_score = 0.0
+    # токены (слова и серии !?) читаются одним проходом вместе с триггерами: перед pref стоит
+    # не-буква, так что токен, кончающийся до m.start(), тот же, что в разборе всего текста
+    toks = TRIGGER_TOKEN_RE.finditer(txt)
+    tok = next(toks, None)
+    prev = ("", "")
 
-    multi_neg = ["не советую","не рекомендую","ни в коем случае","никогда не обращайтесь","полный ужас","полный отстой"]
-    for ph in multi_neg:
-        if ph in txt:
+    for m in TRIGGER_RE.finditer(txt):
+        kind = m.lastgroup
+        if kind == "neg":
             hard_neg = True
-
-    single_neg = ["развод","лохотрон","мошенник","мошенничество"]
-    for i, w in enumerate(toks):
-        for trg in single_neg:
-            if w.startswith(trg):
-                prev = {toks[j] for j in (i-1, i-2) if j >= 0}
-                if prev.isdisjoint(negations):
-                    hard_neg = True
-
-    for ph in ["без проблем","все отлично","всё отлично","очень доволен","очень довольна","все супер","всё супер"]:
-        if ph in txt:
+        elif kind == "pos":
             hard_pos = True
-
-    if re.search(r"\bбез\s+обман\w*\b", txt):
-        ph_score += 1.5
+        elif kind == "noobm":
+            ph_score = 1.5
+        elif not hard_neg:
+            # два предыдущих токена — как в разборе по токенам
+            while tok is not None and tok.end() <= m.start():
+                prev = (prev[1], tok.group())
+                tok = next(toks, None)
+            if TRIGGER_NEGATIONS.isdisjoint(prev):
+                hard_neg = True
 
     return hard_neg, hard_pos, ph_score
 
+def phrase_flags_and_score(raw: str):
+    return _phrase_flags(raw)
+
 
-def lex_word_weight(tok: str) -> float:
-    lem = lemma(tok)
-    if RU_SENTI:
-        w = RU_SENTI.get(lem)
+def _lemma_weight(lem: str) -> float:
+    lex = get_lexicon()
+    if lex:
+        w = lex.get(lem)
         if w is not None:
             return float(w * NEG_WEIGHT_MULT) if w < 0 else float(w)
     if lem in POS_BASE: return 1.0
     if lem in NEG_BASE: return -1.0 * NEG_WEIGHT_MULT
     return 0.0
 
-def lex_score(text: str):
-    if not text: return 0.0, 0, 0, 0
-    raw = text
-    toks = to_tokens(normalize_text(text))
-    score = emoji_score(raw)
+def lex_word_weight(tok: str) -> float:
+    return _lemma_weight(lemma(tok))
+
+# Словарь токенов процесса: каждая словоформа лемматизируется и взвешивается один раз,
+# дальше все стадии работают с её целочисленным id.
+_tok_index: dict[str, int] = {}
+_tok_forms: list[str] = []
+_tok_lemma = array("i")
+_tok_lex: list[float] = []
+_lemma_index: dict[str, int] = {}
+_lemma_forms: list[str] = []
+_lemma_hash = array("Q")  # устойчивый между процессами хэш леммы — для биграмм NB
+
+def _lemma_id(lem: str) -> int:
+    lid = _lemma_index.get(lem)
+    if lid is None:
+        lid = len(_lemma_forms)
+        _lemma_index[lem] = lid
+        _lemma_forms.append(lem)
+        _lemma_hash.append(int.from_bytes(hashlib.blake2b(lem.encode("utf-8"), digest_size=8).digest(), "little"))
+    return lid
+
+def token_id(tok: str) -> int:
+    i = _tok_index.get(tok)
+    if i is None:
+        lem = lemma(tok)
+        lid = _lemma_id(lem)
+        i = len(_tok_forms)
+        _tok_index[tok] = i
+        _tok_forms.append(tok)
+        _tok_lemma.append(lid)
+        _tok_lex.append(_lemma_weight(lem))
+    return i
+
+# NumPy-копии таблиц токенов: id леммы и хэш леммы по id токена. Таблицы процесса только
+# растут (в резидентном процессе и SentimentEngine — всё время работы), поэтому при обращении
+# дописывается лишь хвост новых токенов, а не перегоняется вся таблица.
+_tok_np = {"gen": 0, "n": 0, "lemma": None, "hash": None}
+
+def _token_tables():
+    """(id леммы, хэш леммы) для каждого id токена процесса — массивы NumPy длиной len(_tok_lemma)."""
+    np = _numpy()
+    t = _tok_np
+    n, m = len(_tok_lemma), t["n"]
+    if t["lemma"] is None or n > len(t["lemma"]):
+        cap = max(n, 2 * m, 1024)
+        for k, dt in (("lemma", np.int64), ("hash", np.uint64)):
+            buf = np.zeros(cap, dtype=dt)
+            if m:
+                buf[:m] = t[k][:m]
+            t[k] = buf
+    if m < n:
+        tail = np.array(_tok_lemma[m:n], dtype=np.int64)
+        t["lemma"][m:n] = tail
+        t["hash"][m:n] = np.array([_lemma_hash[i] for i in tail.tolist()], dtype=np.uint64)
+        t["n"] = n
+    return t["lemma"][:n], t["hash"][:n]
+
+def reset_token_tables():
+    """Сбрасывает словари токенов и лемм процесса вместе с их NumPy-копиями (для замеров «с нуля»)."""
+    _tok_index.clear()
+    _tok_forms.clear()
+    del _tok_lemma[:]
+    _tok_lex.clear()
+    _lemma_index.clear()
+    _lemma_forms.clear()
+    del _lemma_hash[:]
+    _tok_np.update(gen=_tok_np["gen"] + 1, n=0, lemma=None, hash=None)
+
+PHRASE_END = ""
+
+def build_lex_trie(lex: dict) -> dict:
+    """
+    Префиксное дерево по последовательностям лемм для многословных статей словаря:
+    {лемма: {лемма: {..., PHRASE_END: вес}}}. Однословные статьи уже учтены в весе токена (_tok_lex).
+    """
+    trie: dict = {}
+    for key in lex:
+        if " " not in key:
+            continue
+        node = trie
+        for lem in key.split(" "):
+            node = node.setdefault(lem, {})
+        node[PHRASE_END] = _lemma_weight(key)
+    return trie
+
+_lex_trie = None
+
+def get_lex_trie() -> dict:
+    global _lex_trie
+    if _lex_trie is None:
+        _lex_trie = build_lex_trie(get_lexicon())
+    return _lex_trie
+
+def __getattr__(name: str):
+    # RU_SENTI / LEX_TRIE остаются доступны как атрибуты модуля, но строятся лениво
+    if name == "RU_SENTI":
+        return get_lexicon()
+    if name == "LEX_TRIE":
+        return get_lex_trie()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _lex_match(trie: dict, tids, i: int):
+    """Самое длинное совпадение словаря, начинающееся с токена i: (вес, длина в токенах)."""
+    base, span = _tok_lex[tids[i]], 1
+    node = trie.get(_lemma_forms[_tok_lemma[tids[i]]])
+    j = i + 1
+    while node is not None and j < len(tids):
+        node = node.get(_lemma_forms[_tok_lemma[tids[j]]])
+        j += 1
+        if node is not None and PHRASE_END in node:
+            base, span = node[PHRASE_END], j - i
+    return base, span
+
+class Corpus:
+    """
+    Результат единственного прохода токенизации/лемматизации.
+    Токены всех отзывов лежат подряд в tids (id из token_id), границы — в offsets;
+    по каждому отзыву хранятся эмодзи, число '!' и флаги фраз-триггеров.
+    """
+    def __init__(self):
+        self.tids = array("i")
+        self.offsets = array("q", [0])
+        self.emoji = array("d")
+        self.excl = array("i")
+        self.hard = array("b")
+        self.ph = array("d")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def add(self, raw: str):
+        raw = raw or ""
+        toks = to_tokens(normalize_text(raw))
+        self.tids.extend([token_id(t) for t in toks])
+        self.offsets.append(len(self.tids))
+        self.emoji.append(emoji_score(raw))
+        self.excl.append(raw.count("!"))
+        hard_neg, hard_pos, ph_score = _phrase_flags(raw)
+        self.hard.append(HARD_NEG if hard_neg else (HARD_POS if hard_pos else 0))
+        self.ph.append(ph_score)
+
+    def doc(self, i: int):
+        return self.tids[self.offsets[i]:self.offsets[i + 1]]
+
+def build_corpus(texts) -> Corpus:
+    corpus = Corpus()
+    for t in texts:
+        corpus.add(t)
+    return corpus
+
+def _lex_score_ids(tids, emoji: float, excl: int):
+    score = emoji
     pos_hits = 0; neg_hits = 0
 
-    for i, tok in enumerate(toks):
-        base = lex_word_weight(tok)
-        if base == 0.0: 
+    trie = get_lex_trie()
+    i = 0
+    while i < len(tids):
+        base, span = _lex_match(trie, tids, i) if trie else (_tok_lex[tids[i]], 1)
+        if base == 0.0:
+            i += span
             continue
-        negated = any(i-k >= 0 and toks[i-k] in NEGATIONS for k in (1,2))
+        negated = any(i-k >= 0 and _tok_forms[tids[i-k]] in NEGATIONS for k in (1,2))
         w = base
         if negated:
             w = -base * (NEG_INVERT_POS_MULT if base > 0 else 1.0)
         for k in (1,2):
             j = i - k
             if j >= 0:
-                if toks[j] in INTENSIFIERS: w *= 1.4
-                elif toks[j] in DIMINISHERS: w *= 0.65
+                prev = _tok_forms[tids[j]]
+                if prev in INTENSIFIERS: w *= 1.4
+                elif prev in DIMINISHERS: w *= 0.65
         score += w
 
         if (base > 0 and not negated) or (base < 0 and negated):
             pos_hits += 1
         elif (base < 0 and not negated) or (base > 0 and negated):
             neg_hits += 1
+        i += span
 
     if score != 0:
-        score *= 1.0 + min(raw.count("!"), 3)*0.1
-    return score, len(toks), pos_hits, neg_hits
+        score *= 1.0 + min(excl, 3)*0.1
+    return score, len(tids), pos_hits, neg_hits
+
+def lex_score(text: str):
+    if not text: return 0.0, 0, 0, 0
+    c = build_corpus([text])
+    return _lex_score_ids(c.doc(0), c.emoji[0], c.excl[0])
 
 def lex_label(score: float, n: int) -> str:
     denom = max(3.0, float(n))
@@ -188,101 +616,890 @@ def lex_label(score: float, n: int) -> str:
         if norm < LEX_NEG_TH_LONG:  return "negative"
     return "neutral"
 
+BIGRAM_BITS = 20
+_HASH_MIX = 0x9E3779B97F4A7C15
+
+def _bigram_buckets(tids, offsets) -> "np.ndarray":
+    """
+    Корзина хэшированной биграммы лемм (токен p, токен p+1) для каждой позиции p корпуса;
+    -1 там, где p — последний токен отзыва. Хэш не зависит от id процесса.
+    """
+    np = _numpy()
+    n = len(tids)
+    out = np.full(n, -1, dtype=np.int64)
+    if n < 2:
+        return out
+    h = _token_tables()[1][tids]
+    mix = np.uint64(_HASH_MIX)
+    out[:-1] = (((h[:-1] * mix) ^ h[1:]) * mix >> np.uint64(64 - BIGRAM_BITS)).astype(np.int64)
+    ends = offsets[1:]
+    out[ends[ends > 0] - 1] = -1
+    return out
+
 class NBModel:
-    def __init__(self):
-        self.pos_counts = Counter()
-        self.neg_counts = Counter()
+    """
+    Наивный Байес по леммам. Счётчики — массивы int32, индексированные id леммы процесса
+    (_lemma_index/_lemma_forms), поэтому строки лемм хранятся в одной общей таблице,
+    а LLR всех лемм считается одним векторным проходом.
+    С bigrams=True добавляются биграммы лемм, хэшированные в 2**BIGRAM_BITS корзин:
+    память модели ограничена независимо от объёма данных.
+    """
+    NAME = "NB"
+    ALPHA = 1.0
+
+    def __init__(self, bigrams: bool = False):
+        np = _numpy()
+        self.pos_counts = np.zeros(0, dtype=np.int32)
+        self.neg_counts = np.zeros(0, dtype=np.int32)
         self.pos_total  = 0
         self.neg_total  = 0
-        self.vocab      = set()
         self.pos_docs   = 0
         self.neg_docs   = 0
+        self.bigrams    = bigrams
+        if bigrams:
+            self.bi_pos_counts = np.zeros(1 << BIGRAM_BITS, dtype=np.int32)
+            self.bi_neg_counts = np.zeros(1 << BIGRAM_BITS, dtype=np.int32)
+            self.bi_pos_total = 0
+            self.bi_neg_total = 0
+        self._reset_weights()
+
+    def _reset_weights(self):
+        self._lemw = None
+        self._tokw = None
+        self._tokw_n = 0
+        self._tokw_gen = -1
+        self._biw = None
+        self._llr_unknown = 0.0
+        self._llr_prior = 0.0
+        self._digest = None
+
+    def _grow(self, n: int):
+        """Дорастить массивы счётчиков до n лемм (с запасом, чтобы не копировать на каждом документе)."""
+        if len(self.pos_counts) >= n:
+            return
+        np = _numpy()
+        cap = max(n, 2 * len(self.pos_counts), 1024)
+        for name in ("pos_counts", "neg_counts"):
+            arr = np.zeros(cap, dtype=np.int32)
+            old = getattr(self, name)
+            arr[:len(old)] = old
+            setattr(self, name, arr)
+
+    def vocab_size(self) -> int:
+        return int(_numpy().count_nonzero((self.pos_counts != 0) | (self.neg_counts != 0)))
 
     def fit_doc(self, text: str, label: str):
-        toks = [lemma(t) for t in to_tokens(normalize_text(text))]
-        if not toks: return
-        for w in toks:
+        self.fit_ids(build_corpus([text]).doc(0), label)
+
+    def fit_ids(self, tids, label: str):
+        if not len(tids) or label not in ("pos", "neg"): return
+        np = _numpy()
+        lids = [_tok_lemma[t] for t in tids]
+        self._grow(max(lids) + 1)
+        np.add.at(self.pos_counts if label == "pos" else self.neg_counts, lids, 1)
+        if label == "pos":
+            self.pos_total += len(lids); self.pos_docs += 1
+        else:
+            self.neg_total += len(lids); self.neg_docs += 1
+        if self.bigrams:
+            self._fit_bigrams(np.array(tids, dtype=np.int64), np.array([0, len(tids)], dtype=np.int64), label)
+        self._reset_weights()
+
+    def _fit_bigrams(self, tids, offsets, label: str):
+        b = _bigram_buckets(tids, offsets)
+        b = b[b >= 0]
+        counts = self.bi_pos_counts if label == "pos" else self.bi_neg_counts
+        counts += _numpy().bincount(b, minlength=len(counts)).astype(counts.dtype)
+        if label == "pos":
+            self.bi_pos_total += len(b)
+        else:
+            self.bi_neg_total += len(b)
+
+    def fit_batch(self, corpus: "Corpus", items):
+        """Обучение сразу на многих отзывах корпуса: items — пары (номер отзыва в корпусе, 'pos'/'neg')."""
+        np = _numpy()
+        items = list(items)
+        if not items:
+            return
+        offsets = np.array(corpus.offsets, dtype=np.int64)
+        tids = np.array(corpus.tids, dtype=np.int64)
+        tok_lemma = _token_tables()[0]
+        self._grow(len(_lemma_forms))
+        for label in ("pos", "neg"):
+            docs = np.array([i for i, c in items if c == label], dtype=np.int64)
+            if not len(docs):
+                continue
+            starts = offsets[docs]
+            lens = offsets[docs + 1] - starts
+            # позиции всех токенов выбранных отзывов одним массивом
+            pos = np.repeat(starts - (np.cumsum(lens) - lens), lens) + np.arange(int(lens.sum()))
+            counts = self.pos_counts if label == "pos" else self.neg_counts
+            counts += np.bincount(tok_lemma[tids[pos]], minlength=len(counts)).astype(np.int32)
             if label == "pos":
-                self.pos_counts[w] += 1; self.pos_total += 1
-            elif label == "neg":
-                self.neg_counts[w] += 1; self.neg_total += 1
-            self.vocab.add(w)
-        if label == "pos": self.pos_docs += 1
-        elif label == "neg": self.neg_docs += 1
+                self.pos_total += int(lens.sum()); self.pos_docs += int(np.count_nonzero(lens))
+            else:
+                self.neg_total += int(lens.sum()); self.neg_docs += int(np.count_nonzero(lens))
+            if self.bigrams:
+                self._fit_bigrams(tids[pos], np.concatenate([[0], np.cumsum(lens)]), label)
+        self._reset_weights()
+
+    def to_state(self) -> dict:
+        """Состояние без привязки к id процесса: леммы словаря по алфавиту и счётчики в том же порядке."""
+        np = _numpy()
+        ids = np.flatnonzero((self.pos_counts != 0) | (self.neg_counts != 0))
+        lemmas = [_lemma_forms[i] for i in ids]
+        order = sorted(range(len(lemmas)), key=lemmas.__getitem__)
+        ids = ids[np.array(order, dtype=np.int64)] if order else ids
+        return {
+            "lemmas": [lemmas[k] for k in order],
+            "pos_counts": self.pos_counts[ids],
+            "neg_counts": self.neg_counts[ids],
+            "pos_total": self.pos_total,
+            "neg_total": self.neg_total,
+            "pos_docs": self.pos_docs,
+            "neg_docs": self.neg_docs,
+            "bigrams": self.bigrams,
+            **(self._bigram_state() if self.bigrams else {}),
+        }
+
+    def _bigram_state(self) -> dict:
+        np = _numpy()
+        nz = np.flatnonzero((self.bi_pos_counts != 0) | (self.bi_neg_counts != 0))
+        return {
+            "bi_buckets": nz.astype(np.int32),
+            "bi_pos_counts": self.bi_pos_counts[nz],
+            "bi_neg_counts": self.bi_neg_counts[nz],
+            "bi_pos_total": self.bi_pos_total,
+            "bi_neg_total": self.bi_neg_total,
+        }
+
+    @classmethod
+    def from_state(cls, st: dict) -> "NBModel":
+        np = _numpy()
+        nb = cls(bigrams=bool(st.get("bigrams", False)))
+        lids = np.array([_lemma_id(w) for w in st.get("lemmas") or []], dtype=np.int64)
+        nb._grow(len(_lemma_forms))
+        if len(lids):
+            nb.pos_counts[lids] = st["pos_counts"]
+            nb.neg_counts[lids] = st["neg_counts"]
+        nb.pos_total = int(st.get("pos_total", 0))
+        nb.neg_total = int(st.get("neg_total", 0))
+        nb.pos_docs = int(st.get("pos_docs", 0))
+        nb.neg_docs = int(st.get("neg_docs", 0))
+        if nb.bigrams:
+            nz = np.asarray(st["bi_buckets"], dtype=np.int64)
+            nb.bi_pos_counts[nz] = st["bi_pos_counts"]
+            nb.bi_neg_counts[nz] = st["bi_neg_counts"]
+            nb.bi_pos_total = int(st.get("bi_pos_total", 0))
+            nb.bi_neg_total = int(st.get("bi_neg_total", 0))
+        return nb
+
+    def same_as(self, other: "NBModel") -> bool:
+        np = _numpy()
+        a, b = self.to_state(), other.to_state()
+        return a.keys() == b.keys() and all(
+            np.array_equal(a[k], b[k]) if isinstance(a[k], np.ndarray) else a[k] == b[k] for k in a)
+
+    def digest(self) -> str:
+        """Отпечаток состояния модели: меняется при любом дообучении."""
+        if self._digest is None:
+            st = self.to_state()
+            h = hashlib.blake2b(digest_size=16)
+            h.update("\n".join(st["lemmas"]).encode("utf-8"))
+            h.update(st["pos_counts"].tobytes())
+            h.update(st["neg_counts"].tobytes())
+            h.update(repr((self.pos_total, self.neg_total, self.pos_docs, self.neg_docs)).encode("ascii"))
+            if self.bigrams:
+                for k in ("bi_buckets", "bi_pos_counts", "bi_neg_counts"):
+                    h.update(st[k].tobytes())
+                h.update(repr((self.bi_pos_total, self.bi_neg_total)).encode("ascii"))
+            self._digest = h.hexdigest()
+        return self._digest
 
     def ready(self) -> bool:
-        return self.pos_docs >= 10 and self.neg_docs >= 10 and len(self.vocab) >= 100
+        return self.pos_docs >= 10 and self.neg_docs >= 10 and self.vocab_size() >= 100
+
+    def _prepare(self):
+        """Один раз после обучения: LLR каждой леммы процесса, LLR неизвестного слова и разность априорных."""
+        if self._lemw is not None:
+            return
+        np = _numpy()
+        V = max(1, self.vocab_size())
+        a = self.ALPHA
+        docs = self.pos_docs + self.neg_docs + 2
+        self._llr_prior = math.log((self.pos_docs + 1) / docs) - math.log((self.neg_docs + 1) / docs)
+        log_pos_den = math.log(self.pos_total + a * V)
+        log_neg_den = math.log(self.neg_total + a * V)
+        self._llr_unknown = (math.log(a) - log_pos_den) - (math.log(a) - log_neg_den)
+        # log(count + alpha) через math.log по таблице: np.log может расходиться в последнем бите
+        top = int(max(self.pos_counts.max(initial=0), self.neg_counts.max(initial=0)))
+        logs = np.array([math.log(c + a) for c in range(top + 1)], dtype=np.float64)
+        self._lemw = (logs[self.pos_counts] - log_pos_den) - (logs[self.neg_counts] - log_neg_den)
+        if self.bigrams:
+            # отдельное мультиномиальное распределение по корзинам биграмм
+            Vb = max(1, int(np.count_nonzero((self.bi_pos_counts != 0) | (self.bi_neg_counts != 0))))
+            bi_pos_den = math.log(self.bi_pos_total + a * Vb)
+            bi_neg_den = math.log(self.bi_neg_total + a * Vb)
+            top = int(max(self.bi_pos_counts.max(), self.bi_neg_counts.max()))
+            logs = np.array([math.log(c + a) for c in range(top + 1)], dtype=np.float64)
+            self._biw = (logs[self.bi_pos_counts] - bi_pos_den) - (logs[self.bi_neg_counts] - bi_neg_den)
+
+    def _token_weights(self) -> "np.ndarray":
+        """
+        LLR для каждого id токена процесса (леммы, появившиеся после обучения, — как неизвестные).
+        Таблица копится в модели: на каждом вызове считаются только токены, появившиеся после прошлого.
+        """
+        np = _numpy()
+        self._prepare()
+        tok_lemma = _token_tables()[0]
+        n_lem = len(_lemma_forms)
+        if len(self._lemw) < n_lem:
+            grow = max(n_lem, 2 * len(self._lemw)) - len(self._lemw)
+            self._lemw = np.concatenate([self._lemw, np.full(grow, self._llr_unknown)])
+        if self._tokw is None or self._tokw_gen != _tok_np["gen"]:
+            self._tokw, self._tokw_n, self._tokw_gen = np.zeros(0), 0, _tok_np["gen"]
+        n, m = len(tok_lemma), self._tokw_n
+        if m < n:
+            if n > len(self._tokw):
+                buf = np.empty(max(n, 2 * m, 1024), dtype=np.float64)
+                buf[:m] = self._tokw[:m]
+                self._tokw = buf
+            self._tokw[m:n] = self._lemw[tok_lemma[m:n]]
+            self._tokw_n = n
+        return self._tokw[:n]
+
+    def predict_llr_batch(self, corpus: "Corpus") -> tuple["np.ndarray", "np.ndarray"]:
+        """LLR и число токенов сразу для всех отзывов корпуса."""
+        np = _numpy()
+        return self._predict(np.array(corpus.tids, dtype=np.int64), np.array(corpus.offsets, dtype=np.int64))
+
+    def _predict(self, tids, offsets):
+        """
+        LLR по отзывам, заданным токенами tids и границами offsets, и число признаков
+        (токены + биграммы). Вклад биграммы (p, p+1) прибавляется к весу позиции p,
+        так что всё суммируется одним reduceat.
+        """
+        np = _numpy()
+        counts = np.diff(offsets)
+        llr = np.zeros(len(counts), dtype=np.float64)
+        nonempty = counts > 0
+        if nonempty.any():
+            w = self._token_weights()[tids]
+            if self.bigrams:
+                b = _bigram_buckets(tids, offsets)
+                has = b >= 0
+                w[has] += self._biw[b[has]]
+                counts = counts + np.maximum(counts - 1, 0)
+            llr[nonempty] = np.add.reduceat(w, offsets[:-1][nonempty]) + self._llr_prior
+        return llr, counts
 
     def predict_llr(self, text: str) -> tuple[float, int]:
-        toks = [lemma(t) for t in to_tokens(normalize_text(text))]
-        if not toks: return 0.0, 0
-        V = max(1, len(self.vocab))
-        alpha = 1.0
-        prior_pos = math.log((self.pos_docs + 1) / (self.pos_docs + self.neg_docs + 2))
-        prior_neg = math.log((self.neg_docs + 1) / (self.pos_docs + self.neg_docs + 2))
-        ll_pos = prior_pos
-        ll_neg = prior_neg
-        for w in toks:
-            cp = self.pos_counts.get(w, 0)
-            cn = self.neg_counts.get(w, 0)
-            ll_pos += math.log((cp + alpha) / (self.pos_total + alpha * V))
-            ll_neg += math.log((cn + alpha) / (self.neg_total + alpha * V))
-        return (ll_pos - ll_neg), len(toks)
-
-def train_nb_from_rows(rows):
-    nb = NBModel()
-    for r in rows:
-        txt = (r.get(TEXT_COL) or "").strip()
-        rating_raw = r.get(RATING_COL)
-        if not txt or rating_raw in (None, ""):
-            continue
-        try:
-            rating = float(str(rating_raw).replace(",", "."))
-        except:
-            continue
-        if rating >= 4.0:
-            nb.fit_doc(txt, "pos")
-        elif rating <= 2.0:
-            nb.fit_doc(txt, "neg")
-    return nb
+        return self.predict_llr_ids(build_corpus([text]).doc(0))
+
+    def predict_llr_ids(self, tids) -> tuple[float, int]:
+        if not len(tids): return 0.0, 0
+        if self.bigrams:
+            np = _numpy()
+            llr, counts = self._predict(np.array(tids, dtype=np.int64), np.array([0, len(tids)], dtype=np.int64))
+            return float(llr[0]), int(counts[0])
+        w = self._token_weights()
+        return float(self._llr_prior + sum(w[t] for t in tids)), len(tids)
+
+LINEAR_BITS = 18
+LINEAR_MODEL_VERSION = 1
+
+class LinearModel:
+    """
+    Логистическая регрессия по хэшированным леммам (с bigrams=True — и биграммам лемм):
+    веса float32, 2**LINEAR_BITS корзин на каждый вид признаков. Значение признака —
+    число вхождений, делённое на max(3, n), то есть z = bias + Σ w / max(3, n).
+    Обучается целиком заново мини-батчевым SGD (шаг AdaGrad: частые леммы и bias
+    не раскачивают редкие) по классам из звёзд. Для ансамбля отдаёт
+    «LLR» = bias · max(3, n) + Σ w, чтобы nb_comp = tanh(LLR / max(3, n)) = tanh(z)
+    считался так же, как для NBModel.
+    """
+    NAME = "Linear"
+    EPOCHS = 5
+    BATCH = 256
+    LEARNING_RATE = 1.0
+    CHUNK_ROWS = 5000  # порядок обучения: куски строк по порядку файла, перемешивание внутри куска
+    SEED = 17
+
+    def __init__(self, bigrams: bool = False):
+        np = _numpy()
+        self.bigrams = bigrams
+        self.weights = np.zeros((2 if bigrams else 1) << LINEAR_BITS, dtype=np.float32)
+        self.bias = 0.0
+        self.pos_docs = 0
+        self.neg_docs = 0
+        self._g2 = None  # суммы квадратов градиентов AdaGrad; живут только на время обучения
+        self._g2_bias = 0.0
+        self._digest = None
+
+    def _features(self, tids, offsets):
+        """Индекс веса лемм по позициям и (с биграммами) индекс веса биграммы (p, p+1) или -1."""
+        np = _numpy()
+        h = _token_tables()[1][tids]
+        uni = (h * np.uint64(_HASH_MIX) >> np.uint64(64 - LINEAR_BITS)).astype(np.int64)
+        if not self.bigrams:
+            return uni, None
+        b = _bigram_buckets(tids, offsets)
+        return uni, np.where(b >= 0, (b >> (BIGRAM_BITS - LINEAR_BITS)) + (1 << LINEAR_BITS), -1)
+
+    def _n_features(self, counts):
+        np = _numpy()
+        return counts + np.maximum(counts - 1, 0) if self.bigrams else counts
+
+    def _dot(self, uni, bi, starts):
+        """Σ w по отзывам (float64); starts — начала непустых отзывов в uni/bi."""
+        np = _numpy()
+        w = self.weights[uni].astype(np.float64)
+        if bi is not None:
+            has = bi >= 0
+            w[has] += self.weights[bi[has]]
+        return np.add.reduceat(w, starts)
+
+    def corpus_features(self, corpus: "Corpus"):
+        """(offsets, uni, bi) корпуса для sgd_chunk — считать один раз на корпус, а не на каждый кусок."""
+        np = _numpy()
+        offsets = np.array(corpus.offsets, dtype=np.int64)
+        return (offsets, *self._features(np.array(corpus.tids, dtype=np.int64), offsets))
 
-def ensemble_label(text: str, nb: NBModel) -> str:
-    hard_neg, hard_pos, ph_score = phrase_flags_and_score(text)
-    if hard_neg: return "negative"
-    if hard_pos: return "positive"
+    def sgd_chunk(self, corpus: "Corpus", items, epoch: int, chunk_no: int, features=None):
+        """
+        Один проход SGD по куску: items — пары (номер отзыва в корпусе, 'pos'/'neg').
+        features — готовый corpus_features(corpus); без него признаки считаются здесь.
+        """
+        np = _numpy()
+        offsets, uni, bi = features if features is not None else self.corpus_features(corpus)
+        items = [(i, c) for i, c in items if c in ("pos", "neg") and offsets[i + 1] > offsets[i]]
+        if not items:
+            return
+        if epoch == 0:
+            self.pos_docs += sum(c == "pos" for _, c in items)
+            self.neg_docs += sum(c == "neg" for _, c in items)
+        docs = np.array([i for i, _ in items], dtype=np.int64)
+        y = np.array([c == "pos" for _, c in items], dtype=np.float64)
+        order = np.random.default_rng((self.SEED, epoch, chunk_no)).permutation(len(docs))
+        if self._g2 is None:
+            self._g2 = np.zeros(len(self.weights), dtype=np.float64)
+        lr = self.LEARNING_RATE
+        for k in range(0, len(order), self.BATCH):
+            sel = docs[order[k:k + self.BATCH]]
+            lens = offsets[sel + 1] - offsets[sel]
+            ends = np.cumsum(lens)
+            pos = np.repeat(offsets[sel] - (ends - lens), lens) + np.arange(int(ends[-1]))
+            b_uni, b_bi = uni[pos], (bi[pos] if bi is not None else None)
+            scale = 1.0 / np.maximum(3.0, self._n_features(lens))
+            z = self.bias + self._dot(b_uni, b_bi, ends - lens) * scale
+            g = 1.0 / (1.0 + np.exp(-z)) - y[order[k:k + self.BATCH]]
+            per_tok = np.repeat(g * scale / len(sel), lens)
+            grad = np.bincount(b_uni, per_tok, minlength=len(self.weights))
+            if b_bi is not None:
+                has = b_bi >= 0
+                grad += np.bincount(b_bi[has], per_tok[has], minlength=len(self.weights))
+            nz = np.flatnonzero(grad)
+            self._g2[nz] += grad[nz] ** 2
+            self.weights[nz] -= (lr * grad[nz] / np.sqrt(self._g2[nz])).astype(np.float32)
+            gb = float(g.mean())
+            self._g2_bias += gb * gb
+            if self._g2_bias > 0:
+                self.bias -= lr * gb / math.sqrt(self._g2_bias)
+        self._digest = None
 
-    ls, ln, pos_hits, neg_hits = lex_score(text)
-    lex_norm = (ls + ph_score) / max(3.0, float(ln))
-    lex_comp = math.tanh(lex_norm)  # [-1,1]
-    lex_cls = lex_label(ls + ph_score, ln)
+    def fit_batch(self, corpus: "Corpus", items):
+        """Обучение с нуля на отзывах корпуса (items — пары номер/класс по порядку строк CSV)."""
+        items = [(i, c) for i, c in items if c in ("pos", "neg")]
+        chunks = [items[k:k + self.CHUNK_ROWS] for k in range(0, len(items), self.CHUNK_ROWS)]
+        features = self.corpus_features(corpus) if chunks else None
+        for epoch in range(self.EPOCHS):
+            for no, chunk in enumerate(chunks):
+                self.sgd_chunk(corpus, chunk, epoch, no, features)
 
-    if not (nb and nb.ready()):
-        return lex_cls
+    def ready(self) -> bool:
+        return self.pos_docs >= 10 and self.neg_docs >= 10
+
+    def predict_llr_batch(self, corpus: "Corpus") -> tuple["np.ndarray", "np.ndarray"]:
+        """Одно разреженное скалярное произведение на весь корпус: (bias·max(3,n) + Σ w, n)."""
+        np = _numpy()
+        offsets = np.array(corpus.offsets, dtype=np.int64)
+        counts = np.diff(offsets)
+        n = self._n_features(counts)
+        llr = np.zeros(len(counts), dtype=np.float64)
+        nonempty = counts > 0
+        if nonempty.any():
+            uni, bi = self._features(np.array(corpus.tids, dtype=np.int64), offsets)
+            llr[nonempty] = (self._dot(uni, bi, offsets[:-1][nonempty])
+                             + self.bias * np.maximum(3.0, n[nonempty]))
+        return llr, n
+
+    def predict_llr(self, text: str) -> tuple[float, int]:
+        return self.predict_llr_ids(build_corpus([text]).doc(0))
+
+    def predict_llr_ids(self, tids) -> tuple[float, int]:
+        c = Corpus()
+        c.tids.extend(tids)
+        c.offsets.append(len(c.tids))
+        llr, n = self.predict_llr_batch(c)
+        return float(llr[0]), int(n[0])
+
+    def to_state(self) -> dict:
+        return {"engine": "linear", "weights": self.weights, "bias": self.bias, "bigrams": self.bigrams,
+                "pos_docs": self.pos_docs, "neg_docs": self.neg_docs}
+
+    @classmethod
+    def from_state(cls, st: dict) -> "LinearModel":
+        m = cls(bigrams=bool(st.get("bigrams", False)))
+        m.weights = _numpy().asarray(st["weights"], dtype=_numpy().float32).copy()
+        m.bias = float(st.get("bias", 0.0))
+        m.pos_docs = int(st.get("pos_docs", 0))
+        m.neg_docs = int(st.get("neg_docs", 0))
+        return m
+
+    def same_as(self, other) -> bool:
+        return isinstance(other, LinearModel) and self.digest() == other.digest()
+
+    def digest(self) -> str:
+        if self._digest is None:
+            h = hashlib.blake2b(self.weights.tobytes(), digest_size=16)
+            h.update(repr((self.bias, self.bigrams, self.pos_docs, self.neg_docs)).encode("ascii"))
+            self._digest = h.hexdigest()
+        return self._digest
+
+ENGINES = {"nb": NBModel, "linear": LinearModel}
+
+def new_model(engine: str = "nb", bigrams: bool = False):
+    return ENGINES[engine](bigrams)
+
+def model_from_state(st: dict):
+    return ENGINES[st.get("engine", "nb")].from_state(st)
+
+def rating_value(r: dict) -> float:
+    """Звёзды числом; nan, если рейтинга нет или он не разбирается."""
+    rating_raw = r.get(RATING_COL)
+    if rating_raw in (None, ""):
+        return math.nan
+    try:
+        return float(str(rating_raw).replace(",", "."))
+    except:
+        return math.nan
 
-    llr, n = nb.predict_llr(text)
-    nb_norm = llr / max(3.0, float(n))
-    nb_comp = math.tanh(nb_norm)
+def rating_class(r: dict):
+    """'pos' / 'neg' по звёздам (>=4 / <=2), None — если рейтинга нет или он нейтральный."""
+    rating = rating_value(r)
+    if rating >= 4.0:
+        return "pos"
+    if rating <= 2.0:
+        return "neg"
+    return None
 
-    fused = 0.6 * nb_comp + 0.4 * lex_comp
+def train_nb_from_rows(rows, corpus: Corpus = None, bigrams: bool = False, engine: str = "nb"):
+    if corpus is None:
+        corpus = build_corpus((r.get(TEXT_COL) or "").strip() for r in rows)
+    nb = new_model(engine, bigrams)
+    nb.fit_batch(corpus, ((i, rating_class(r)) for i, r in enumerate(rows)))
+    return nb
+
+def _doc_components(corpus: Corpus, i: int, nb_llr: float = 0.0, nb_n: int = 0):
+    """
+    Составляющие ансамбля для отзыва i:
+    (лекс. балл, токенов, lex_comp, nb_comp, fused, поз. попаданий, нег. попаданий).
+    """
+    ls, ln, pos_hits, neg_hits = _lex_score_ids(corpus.doc(i), corpus.emoji[i], corpus.excl[i])
+    lex_total = ls + corpus.ph[i]
+    lex_comp = math.tanh(lex_total / max(3.0, float(ln)))  # [-1,1]
+    nb_comp = math.tanh(nb_llr / max(3.0, float(nb_n)))
+    fused = NB_WEIGHT * nb_comp + LEX_WEIGHT * lex_comp
+    return lex_total, ln, lex_comp, nb_comp, fused, pos_hits, neg_hits
+
+def decide_label(hard: int, lex_total: float, ln: int, lex_comp: float, nb_comp: float,
+                 fused: float, hits: int, use_nb: bool) -> str:
+    if hard == HARD_NEG: return "negative"
+    if hard == HARD_POS: return "positive"
+
+    if not use_nb:
+        return lex_label(lex_total, ln)
 
-    if abs(fused) < 0.08:
+    if abs(fused) < FUSED_NEUTRAL:
         return "neutral"
 
-    if (lex_comp * nb_comp) < 0 and max(abs(lex_comp), abs(nb_comp)) < 0.22:
+    if (lex_comp * nb_comp) < 0 and max(abs(lex_comp), abs(nb_comp)) < DISAGREE_NEUTRAL:
         return "neutral"
 
-    if (pos_hits + neg_hits) <= 1 and abs(fused) < 0.15:
+    if hits <= 1 and abs(fused) < WEAK_FUSED:
         return "neutral"
 
-    if fused >= 0.15:
+    if fused >= FUSED_POS_TH:
         return "positive"
-    if fused <= -0.13:
+    if fused <= FUSED_NEG_TH:
         return "negative"
 
     return "neutral"
 
-def process_csv(path: Path):
-    with path.open("r", encoding="utf-8-sig", newline="") as f:
+def _ensemble_label_doc(corpus: Corpus, i: int, nb: NBModel, nb_llr: float = 0.0, nb_n: int = 0) -> str:
+    hard = corpus.hard[i]
+    if hard:
+        return decide_label(hard, 0.0, 0, 0.0, 0.0, 0.0, 0, False)
+    lex_total, ln, lex_comp, nb_comp, fused, pos_hits, neg_hits = _doc_components(corpus, i, nb_llr, nb_n)
+    return decide_label(0, lex_total, ln, lex_comp, nb_comp, fused, pos_hits + neg_hits,
+                        bool(nb and nb.ready()))
+
+def label_corpus(corpus: Corpus, nb: NBModel, indices=None) -> list[str]:
+    idx = range(len(corpus)) if indices is None else indices
+    if nb and nb.ready():
+        llr, counts = nb.predict_llr_batch(corpus)
+        return [_ensemble_label_doc(corpus, i, nb, float(llr[i]), int(counts[i])) for i in idx]
+    return [_ensemble_label_doc(corpus, i, nb) for i in idx]
+
+def score_corpus(corpus: Corpus, nb: NBModel) -> dict:
+    """Все составляющие ансамбля по каждому отзыву корпуса в виде массивов NumPy."""
+    np = _numpy()
+    n = len(corpus)
+    if nb and nb.ready():
+        llr, counts = nb.predict_llr_batch(corpus)
+    else:
+        llr, counts = np.zeros(n), np.zeros(n, dtype=np.int64)
+    comps = [_doc_components(corpus, i, float(llr[i]), int(counts[i])) for i in range(n)]
+    cols = list(zip(*comps)) if comps else [()] * 7
+    return {
+        "hard": np.array(corpus.hard, dtype=np.int8),
+        "lex_score": np.array(cols[0], dtype=np.float64),
+        "lex_tokens": np.array(cols[1], dtype=np.int32),
+        "lex_comp": np.array(cols[2], dtype=np.float64),
+        "nb_llr": llr,
+        "nb_tokens": counts,
+        "nb_comp": np.array(cols[3], dtype=np.float64),
+        "fused": np.array(cols[4], dtype=np.float64),
+        "pos_hits": np.array(cols[5], dtype=np.int32),
+        "neg_hits": np.array(cols[6], dtype=np.int32),
+        "hits": np.array(cols[5], dtype=np.int32) + np.array(cols[6], dtype=np.int32),
+    }
+
+def ensemble_label(text: str, nb, cache: "ResultCache" = None) -> str:
+    """Метка одного текста; nb — модель ансамбля: NBModel или LinearModel."""
+    if cache is not None:
+        return label_with_cache(cache, [text], lambda idx: label_corpus(build_corpus([text]), nb))[0]
+    return label_corpus(build_corpus([text]), nb)[0]
+
+PARALLEL_MIN_ROWS = 5000
+PARALLEL_CHUNK_ROWS = 2000
+
+_worker_nb = None
+
+def _init_worker(nb_state: dict):
+    """Инициализатор процесса пула: модель — из состояния; лексикон и pymorphy3 процесс поднимает сам при первом куске."""
+    global _worker_nb
+    _worker_nb = model_from_state(nb_state)
+
+def _label_chunk(texts: list[str]):
+    global _lemma_hits, _lemma_misses
+    _lemma_hits = _lemma_misses = 0
+    labels = label_corpus(build_corpus(texts), _worker_nb)
+    fresh = dict(_lemma_new)
+    _lemma_new.clear()
+    return labels, fresh, _lemma_hits, _lemma_misses
+
+def label_texts_parallel(texts: list[str], nb: NBModel, workers: int) -> list[str]:
+    """Разметка кусками в пуле процессов; порядок результата совпадает с порядком texts."""
+    global _lemma_hits, _lemma_misses
+    chunks = [texts[i:i + PARALLEL_CHUNK_ROWS] for i in range(0, len(texts), PARALLEL_CHUNK_ROWS)]
+    labels: list[str] = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(nb.to_state(),)) as ex:
+        for part, fresh, hits, misses in ex.map(_label_chunk, chunks):
+            labels.extend(part)
+            for form, lem in fresh.items():
+                if form not in _lemma_cache and len(_lemma_cache) < LEMMA_CACHE_MAX:
+                    _lemma_cache[form] = lem
+                _lemma_new.setdefault(form, lem)
+            _lemma_hits += hits
+            _lemma_misses += misses
+    return labels
+
+def text_fingerprint(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+def fingerprint_path(csv_path: Path) -> Path:
+    """Отпечатки текстов на момент последней разметки: по одному uint64 на строку CSV."""
+    return csv_path.with_name(csv_path.stem + ".sentiment_fp")
+
+def load_fingerprints(csv_path: Path) -> array:
+    fps = array("Q")
+    p = fingerprint_path(csv_path)
+    if p.exists():
+        try:
+            fps.frombytes(p.read_bytes())
+        except (OSError, ValueError):
+            return array("Q")
+    return fps
+
+def save_fingerprints(csv_path: Path, fps: array):
+    p = fingerprint_path(csv_path)
+    tmp = p.with_name(p.name + ".tmp")
+    tmp.write_bytes(fps.tobytes())
+    os.replace(tmp, p)
+
+NB_MODEL_VERSION = 2
+
+def nb_model_path(csv_path: Path) -> Path:
+    """
+    Модель одним .npz: meta (JSON: версия, pymorphy, число строк, отпечаток выборки, итоги),
+    lemmas (UTF-8, по строке на лемму) и счётчики pos/neg (int32) в том же порядке;
+    classes — классы обучающих строк (_class_codes), чтобы дописанные строки учитывать без чтения CSV.
+    """
+    return csv_path.with_name(csv_path.stem + ".nb_model.npz")
+
+def _class_codes(classes) -> bytes:
+    """Классы по звёздам одной буквой на строку: p / n / - (без оценки)."""
+    return "".join((c or "-")[0] for c in classes).encode("ascii")
+
+CLASS_BY_CODE = {ord("p"): "pos", ord("n"): "neg"}
+
+def _training_digest(fps, classes) -> str:
+    """Отпечаток обучающей выборки: тексты и классы по звёздам для первых len(fps) строк."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(fps.tobytes())
+    h.update(_class_codes(classes))
+    return h.hexdigest()
+
+def _read_nb_model_file(csv_path: Path):
+    p = nb_model_path(csv_path)
+    if not p.exists():
+        return None
+    np = _numpy()
+    try:
+        with np.load(p) as z:
+            st = json.loads(str(z["meta"]))
+            blob = z["lemmas"].tobytes().decode("utf-8")
+            model = {"lemmas": blob.split("\n") if blob else []}
+            model.update((k, z[k]) for k in z.files if k not in ("meta", "lemmas", "classes"))
+            if "classes" in z.files:
+                st["classes"] = [CLASS_BY_CODE.get(c) for c in z["classes"].tobytes()]
+    except (OSError, ValueError, KeyError):
+        return None
+    if st.get("version") != NB_MODEL_VERSION or st.get("morph") != morph_stamp():
+        return None
+    model.update(st.pop("totals", {}))
+    st["model"] = model
+    return st
+
+def load_nb_model(csv_path: Path, fps, classes, bigrams: bool = False):
+    """
+    Сохранённая модель, если она обучена на префиксе текущего CSV (строки только дописывались)
+    и с тем же набором признаков. Возврат: (NBModel, с какой строки дообучать) или (None, 0).
+    """
+    st = _read_nb_model_file(csv_path)
+    if st is None or bool(st["model"].get("bigrams", False)) != bigrams:
+        return None, 0
+    n = int(st.get("rows", -1))
+    if not 0 <= n <= len(fps):
+        return None, 0
+    if st.get("digest") != _training_digest(fps[:n], classes[:n]):
+        return None, 0
+    return NBModel.from_state(st.get("model") or {}), n
+
+def save_nb_model(csv_path: Path, nb: NBModel, fps, classes):
+    np = _numpy()
+    model = nb.to_state()
+    meta = {
+        "version": NB_MODEL_VERSION,
+        "morph": morph_stamp(),
+        "rows": len(fps),
+        "digest": _training_digest(fps, classes),
+        "totals": {k: v for k, v in model.items() if k != "lemmas" and not isinstance(v, np.ndarray)},
+    }
+    p = nb_model_path(csv_path)
+    tmp = p.with_name(p.name + ".tmp")
+    with tmp.open("wb") as f:
+        np.savez(f, meta=np.array(json.dumps(meta, ensure_ascii=False)),
+                 lemmas=np.frombuffer("\n".join(model["lemmas"]).encode("utf-8"), dtype=np.uint8),
+                 classes=np.frombuffer(_class_codes(classes), dtype=np.uint8),
+                 **{k: v for k, v in model.items() if isinstance(v, np.ndarray)})
+    os.replace(tmp, p)
+
+def linear_model_path(csv_path: Path) -> Path:
+    return csv_path.with_name(csv_path.stem + ".linear_model.npz")
+
+def load_linear_model(csv_path: Path, fps, classes, bigrams: bool = False):
+    """Сохранённая линейная модель, если она обучена ровно на текущем CSV; иначе None (переобучать)."""
+    p = linear_model_path(csv_path)
+    if not p.exists():
+        return None
+    np = _numpy()
+    try:
+        with np.load(p) as z:
+            meta = json.loads(str(z["meta"]))
+            weights = z["weights"]
+    except (OSError, ValueError, KeyError):
+        return None
+    if (meta.get("version") != LINEAR_MODEL_VERSION or meta.get("morph") != morph_stamp()
+            or meta.get("rows") != len(fps) or meta.get("digest") != _training_digest(fps, classes)
+            or bool(meta["model"].get("bigrams")) != bigrams):
+        return None
+    return LinearModel.from_state({**meta["model"], "weights": weights})
+
+def save_linear_model(csv_path: Path, model: LinearModel, fps, classes):
+    np = _numpy()
+    st = model.to_state()
+    meta = {
+        "version": LINEAR_MODEL_VERSION,
+        "morph": morph_stamp(),
+        "rows": len(fps),
+        "digest": _training_digest(fps, classes),
+        "model": {k: v for k, v in st.items() if k != "weights"},
+    }
+    p = linear_model_path(csv_path)
+    tmp = p.with_name(p.name + ".tmp")
+    with tmp.open("wb") as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), weights=st["weights"])
+    os.replace(tmp, p)
+
+def load_model(csv_path: Path, fps, classes, engine: str = "nb", bigrams: bool = False):
+    """(модель, с какой строки дообучать) или (None, 0). Линейная модель не дообучается — только целиком."""
+    if engine == "linear":
+        m = load_linear_model(csv_path, fps, classes, bigrams)
+        return (m, len(fps)) if m is not None else (None, 0)
+    return load_nb_model(csv_path, fps, classes, bigrams)
+
+def save_model(csv_path: Path, model, fps, classes):
+    if isinstance(model, LinearModel):
+        save_linear_model(csv_path, model, fps, classes)
+    else:
+        save_nb_model(csv_path, model, fps, classes)
+
+def components_path(csv_path: Path) -> Path:
+    """Составляющие ансамбля по каждой строке CSV — для подбора порогов без пересчёта."""
+    return csv_path.with_name(csv_path.stem + ".sentiment_scores.npz")
+
+def save_components(csv_path: Path, scores: dict, ratings, use_nb: bool):
+    """Массивы score_corpus (по строкам CSV) + звёзды и признак, участвовал ли NB, в .npz."""
+    np = _numpy()
+    arrays = dict(scores)
+    arrays["rating"] = np.array(ratings, dtype=np.float32)
+    arrays["use_nb"] = np.array(use_nb)
+    p = components_path(csv_path)
+    tmp = p.with_name(p.name + ".tmp")
+    with tmp.open("wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, p)
+
+RESULT_CACHE_VERSION = 2
+RESULT_CACHE_KEEP = 4  # сколько последних версий модели/лексикона держать в кэше результатов
+
+_result_hits = 0
+_result_lookups = 0
+
+def result_key(raw: str) -> int:
+    """
+    Ключ кэша результатов: хэш текста в нижнем регистре (ё → е). Не нормализованного:
+    фразы-триггеры, «без обмана», эмодзи и '!' ищутся в исходном тексте, и пунктуация
+    меняет метку («без проблем» против «без. проблем»).
+    """
+    s = (raw or "").lower().replace("ё", "е")
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+_lexicon_digest = None
+
+def result_stamp(nb: NBModel) -> str:
+    """Версия результата: лексикон, pymorphy3, пороги ансамбля и состояние NB-модели."""
+    global _lexicon_digest
+    if _lexicon_digest is None:
+        lex = repr(sorted(get_lexicon().items())).encode("utf-8")
+        _lexicon_digest = hashlib.blake2b(lex, digest_size=16).hexdigest()
+    tuning = (NEG_WEIGHT_MULT, NEG_INVERT_POS_MULT, LEX_POS_TH_SHORT, LEX_NEG_TH_SHORT,
+              LEX_POS_TH_LONG, LEX_NEG_TH_LONG, NB_WEIGHT, LEX_WEIGHT, FUSED_NEUTRAL,
+              DISAGREE_NEUTRAL, WEAK_FUSED, FUSED_POS_TH, FUSED_NEG_TH)
+    model = nb.digest() if nb and nb.ready() else "-"
+    return f"v{RESULT_CACHE_VERSION} {morph_stamp()} {_lexicon_digest} {tuning} {model}"
+
+class ResultCache:
+    """
+    Кэш меток в SQLite: (версия, result_key текста) → метка.
+    Одинаковые тексты (перепарсинг, дубли между Яндексом/2ГИС/Google, повторные прогоны)
+    не пересчитываются; при смене лексикона или модели меняется версия и старые метки
+    не используются. Хранятся только RESULT_CACHE_KEEP последних версий.
+    """
+    BATCH = 500
+
+    def __init__(self, stamp: str, path: Path = None):
+        path = path or RESULT_CACHE_FILE
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(path), timeout=10)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS stamps (id INTEGER PRIMARY KEY, stamp TEXT UNIQUE, used REAL);
+            CREATE TABLE IF NOT EXISTS labels (
+                sid INTEGER, key INTEGER, label TEXT, PRIMARY KEY (sid, key)) WITHOUT ROWID;
+        """)
+        with self.db:
+            self.db.execute("INSERT OR IGNORE INTO stamps (stamp, used) VALUES (?, ?)", (stamp, time.time()))
+            self.db.execute("UPDATE stamps SET used = ? WHERE stamp = ?", (time.time(), stamp))
+            self.sid = self.db.execute("SELECT id FROM stamps WHERE stamp = ?", (stamp,)).fetchone()[0]
+            stale = [r[0] for r in self.db.execute(
+                "SELECT id FROM stamps ORDER BY used DESC LIMIT -1 OFFSET ?", (RESULT_CACHE_KEEP,))]
+            for sid in stale:
+                self.db.execute("DELETE FROM labels WHERE sid = ?", (sid,))
+                self.db.execute("DELETE FROM stamps WHERE id = ?", (sid,))
+
+    def get_many(self, keys) -> dict:
+        found = {}
+        keys = list(set(keys))
+        try:
+            for k in range(0, len(keys), self.BATCH):
+                part = keys[k:k + self.BATCH]
+                q = f"SELECT key, label FROM labels WHERE sid = ? AND key IN ({','.join('?' * len(part))})"
+                found.update(self.db.execute(q, (self.sid, *part)))
+        except sqlite3.Error:
+            pass
+        return found
+
+    def put_many(self, items):
+        try:
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO labels (sid, key, label) VALUES (?, ?, ?)",
+                                    ((self.sid, k, v) for k, v in items))
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        self.db.close()
+
+def open_result_cache(nb: NBModel):
+    """ResultCache для текущей версии модели/лексикона или None, если базу открыть не удалось."""
+    try:
+        return ResultCache(result_stamp(nb))
+    except (sqlite3.Error, OSError):
+        return None
+
+def label_with_cache(cache, texts: list[str], compute) -> list[str]:
+    """
+    Метки для texts: готовые берутся из кэша, остальные считает compute(список индексов в texts)
+    (одинаковые тексты — один раз), новые метки дописываются в кэш. Без кэша — просто compute.
+    """
+    global _result_hits, _result_lookups
+    if cache is None:
+        return compute(list(range(len(texts))))
+    keys = [result_key(t) for t in texts]
+    known = cache.get_many(keys)
+    _result_lookups += len(keys)
+    first = {}
+    for k, key in enumerate(keys):
+        if key in known:
+            _result_hits += 1
+        else:
+            first.setdefault(key, k)
+    if first:
+        fresh = dict(zip(first, compute(list(first.values()))))
+        cache.put_many(fresh.items())
+        known.update(fresh)
+    return [known[key] for key in keys]
+
+def result_cache_hit_rate() -> float:
+    return _result_hits / _result_lookups if _result_lookups else 0.0
+
+def process_csv(path: Path, incremental: bool = False, rebuild_model: bool = False,
+                check_model: bool = False, workers: int = 1, result_cache: bool = True,
+                components: bool = False, bigrams: bool = False, engine: str = "nb") -> bool:
+    with _timed("read csv"), path.open("r", encoding="utf-8-sig", newline="") as f:
         rdr = csv.DictReader(f)
         rows = list(rdr)
         fieldnames = list(rdr.fieldnames or [])
@@ -290,21 +1507,433 @@ def process_csv(path: Path):
     if SENT_COL not in fieldnames:
         fieldnames.append(SENT_COL)
 
-    nb = train_nb_from_rows(rows)
+    texts = [(r.get(TEXT_COL) or "").strip() for r in rows]
+    fps = array("Q", (text_fingerprint(t) for t in texts))
+    classes = [rating_class(r) for r in rows]
+    if incremental:
+        old_fps = load_fingerprints(path)
+        todo = [i for i, r in enumerate(rows)
+                if not (r.get(SENT_COL) or "").strip() or i >= len(old_fps) or old_fps[i] != fps[i]]
+    else:
+        todo = list(range(len(rows)))
+
+    nb, fit_from = (None, 0) if rebuild_model or (not incremental and engine == "nb") else \
+        load_model(path, fps, classes, engine, bigrams)
+    if nb is None:
+        nb, fit_from = new_model(engine, bigrams), 0
+    fit_rows = [i for i in range(fit_from, len(rows)) if classes[i]]
+
+    if not todo and not fit_rows and not check_model and not components:
+        save_fingerprints(path, fps)
+        print(f"Up to date: {path}  ({len(rows)} lines, nothing to label)")
+        return True
+
+    # Сначала корпус только из строк для дообучения; размечаемые строки, которых нет
+    # в кэше результатов, дописываются в него потом (или уходят в пул процессов)
+    corpus = build_corpus(texts[i] for i in fit_rows)
+    pos = {i: k for k, i in enumerate(fit_rows)}
+    if fit_rows:
+        nb.fit_batch(corpus, ((pos[i], classes[i]) for i in fit_rows))
+    save_model(path, nb, fps, classes)
+
+    consistent = True
+    if check_model:
+        consistent = nb.same_as(train_nb_from_rows(rows, bigrams=bigrams, engine=engine))
+        print(f"{nb.NAME} model check: {'OK, matches a full retrain' if consistent else 'MISMATCH with a full retrain'}")
+
+    if todo:
+        def compute(ks):
+            rows_idx = [todo[k] for k in ks]
+            if workers > 1 and len(rows_idx) >= PARALLEL_MIN_ROWS:
+                return label_texts_parallel([texts[i] for i in rows_idx], nb, workers)
+            for i in rows_idx:
+                if i not in pos:
+                    pos[i] = len(corpus)
+                    corpus.add(texts[i])
+            return label_corpus(corpus, nb, [pos[i] for i in rows_idx])
+
+        cache = open_result_cache(nb) if result_cache else None
+        labels = label_with_cache(cache, [texts[i] for i in todo], compute)
+        if cache is not None:
+            cache.close()
+        for i, label in zip(todo, labels):
+            rows[i][SENT_COL] = label
+
+        with _atomic_writer(path) as f:
+            w = csv.DictWriter(f, fieldnames=fieldnames, quoting=csv.QUOTE_ALL)
+            w.writeheader()
+            w.writerows(rows)
+    save_fingerprints(path, fps)
+
+    if components:
+        for i in range(len(rows)):
+            if i not in pos:
+                pos[i] = len(corpus)
+                corpus.add(texts[i])
+        order = [pos[i] for i in range(len(rows))]
+        scores = {k: v[order] for k, v in score_corpus(corpus, nb).items()}
+        save_components(path, scores, [rating_value(r) for r in rows], nb.ready())
+
+    _report(path, len(rows), len(todo), incremental, len(fit_rows) if fit_from else None, nb)
+    return consistent
+
+STREAM_CHUNK_ROWS = 5000
+
+@contextmanager
+def _atomic_writer(path: Path):
+    """Пишет во временный файл рядом с path и подменяет им оригинал только после успешной записи."""
+    fd, tmp = tempfile.mkstemp(prefix=path.name + ".", suffix=".tmp", dir=str(path.parent))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+def _iter_csv(path: Path):
+    with path.open("r", encoding="utf-8-sig", newline="") as f:
+        yield from csv.DictReader(f)
+
+def _chunked(it, size: int):
+    chunk = []
+    for x in it:
+        chunk.append(x)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _fit_stream(nb, path: Path, start: int = 0) -> int:
+    """
+    Дообучает модель на размеченных звёздами строках начиная со start, читая CSV кусками.
+    Линейную модель — за LinearModel.EPOCHS проходов по файлу, куски те же, что в fit_batch.
+    """
+    linear = isinstance(nb, LinearModel)
+    fitted = 0
+    for epoch in range(nb.EPOCHS if linear else 1):
+        rated = (((r.get(TEXT_COL) or "").strip(), rating_class(r))
+                 for i, r in enumerate(_iter_csv(path)) if i >= start)
+        size = LinearModel.CHUNK_ROWS if linear else STREAM_CHUNK_ROWS
+        for no, chunk in enumerate(_chunked((tc for tc in rated if tc[1]), size)):
+            corpus = build_corpus(t for t, _ in chunk)
+            items = [(k, cls) for k, (_, cls) in enumerate(chunk)]
+            if linear:
+                nb.sgd_chunk(corpus, items, epoch, no)
+            else:
+                nb.fit_batch(corpus, items)
+            if epoch == 0:
+                fitted += len(chunk)
+    return fitted
+
+def process_csv_stream(path: Path, incremental: bool = False, rebuild_model: bool = False,
+                       check_model: bool = False, result_cache: bool = True,
+                       components: bool = False, bigrams: bool = False, engine: str = "nb") -> bool:
+    """
+    Потоковый вариант process_csv: память не зависит от размера CSV
+    (в памяти только отпечатки строк — 8 байт на строку — и модель).
+      1) проход по CSV: отпечатки текстов, классы по звёздам, какие строки размечать;
+      2) проход по строкам с рейтингом: обучение/дообучение NB кусками;
+      3) чтение, разметка и запись кусками во временный файл, который атомарно заменяет исходный.
+    """
+    fps = array("Q")
+    classes = []
+    old_fps = load_fingerprints(path) if incremental else array("Q")
+    todo = bytearray()
+    ratings = array("f")
+    with _timed("read csv"):
+        for i, r in enumerate(_iter_csv(path)):
+            fp = text_fingerprint((r.get(TEXT_COL) or "").strip())
+            fps.append(fp)
+            classes.append(rating_class(r))
+            if components:
+                ratings.append(rating_value(r))
+            todo.append(not incremental or not (r.get(SENT_COL) or "").strip()
+                        or i >= len(old_fps) or old_fps[i] != fp)
+    n_rows = len(fps)
+    n_todo = sum(todo)
+
+    nb, fit_from = (None, 0) if rebuild_model or (not incremental and engine == "nb") else \
+        load_model(path, fps, classes, engine, bigrams)
+    if nb is None:
+        nb, fit_from = new_model(engine, bigrams), 0
+    has_fit = any(classes[fit_from:])
+
+    if not n_todo and not has_fit and not check_model and not components:
+        save_fingerprints(path, fps)
+        print(f"Up to date: {path}  ({n_rows} lines, nothing to label)")
+        return True
+
+    fitted = _fit_stream(nb, path, fit_from) if has_fit else 0
+    save_model(path, nb, fps, classes)
+    del classes
+
+    consistent = True
+    if check_model:
+        full = new_model(engine, bigrams)
+        _fit_stream(full, path)
+        consistent = nb.same_as(full)
+        print(f"{nb.NAME} model check: {'OK, matches a full retrain' if consistent else 'MISMATCH with a full retrain'}")
+
+    parts = []
+    if n_todo or components:
+        cache = open_result_cache(nb) if result_cache else None
+        # читатель закрывается раньше подмены файла: на Windows открытый файл не заменить
+        with _atomic_writer(path) as fout, path.open("r", encoding="utf-8-sig", newline="") as fin:
+            rdr = csv.DictReader(fin)
+            fieldnames = list(rdr.fieldnames or [])
+            if SENT_COL not in fieldnames:
+                fieldnames.append(SENT_COL)
+            w = csv.DictWriter(fout, fieldnames=fieldnames, quoting=csv.QUOTE_ALL)
+            w.writeheader()
+            base = 0
+            for chunk in _chunked(rdr, STREAM_CHUNK_ROWS):
+                idx = [k for k in range(len(chunk)) if todo[base + k]]
+                if components:
+                    # составляющие нужны по всем строкам куска — корпус общий и для разметки
+                    corpus = build_corpus((r.get(TEXT_COL) or "").strip() for r in chunk)
+                    parts.append(score_corpus(corpus, nb))
+                    compute = lambda ks: label_corpus(corpus, nb, [idx[j] for j in ks])
+                else:
+                    compute = lambda ks: label_corpus(build_corpus(texts[j] for j in ks), nb)
+                if idx:
+                    texts = [(chunk[k].get(TEXT_COL) or "").strip() for k in idx]
+                    labels = label_with_cache(cache, texts, compute)
+                    for k, label in zip(idx, labels):
+                        chunk[k][SENT_COL] = label
+                w.writerows(chunk)
+                base += len(chunk)
+        if cache is not None:
+            cache.close()
+    save_fingerprints(path, fps)
+
+    if components:
+        np = _numpy()
+        scores = {k: np.concatenate([p[k] for p in parts]) for k in (parts[0] if parts else ())}
+        save_components(path, scores, ratings, nb.ready())
+
+    _report(path, n_rows, n_todo, incremental, fitted if fit_from else None, nb)
+    return consistent
+
+def _saved_training_rows(path: Path, csv_rows: int, bigrams: bool):
+    """
+    Отпечатки и классы всех csv_rows строк path из файлов рядом с CSV (без чтения CSV) или None:
+    NB-модель и отпечатки разметки должны покрывать ровно csv_rows строк и сходиться с отпечатком выборки.
+    """
+    st = _read_nb_model_file(path)
+    if st is None or "classes" not in st or bool(st["model"].get("bigrams", False)) != bigrams:
+        return None
+    fps, classes = load_fingerprints(path), st["classes"]
+    if not (int(st.get("rows", -1)) == len(fps) == len(classes) == csv_rows):
+        return None
+    if st.get("digest") != _training_digest(fps, classes):
+        return None
+    return fps, classes
+
+def label_appended_rows(path: Path, rows: list[dict], result_cache: bool = True,
+                        bigrams: bool = False, engine: str = "nb", csv_rows: int = None) -> int:
+    """
+    Тональность строк rows, которые сейчас будут дописаны в конец CSV path (в этом порядке), —
+    как при --incremental, но без перезаписи CSV:
+      1) отпечатки текстов и классы по звёздам строк path для проверки сохранённой модели:
+         если вызывающий знает, что в path ровно csv_rows строк и они только дописывались,
+         а модель и отпечатки разметки покрывают их все — берутся из файлов рядом с CSV,
+         иначе потоковый проход по path;
+      2) NB-модель дообучается на ещё не учтённых строках path и на строках rows с рейтингом
+         и сохраняется на path + rows; отпечатки разметки дополняются строками rows
+         (линейная модель не дообучается — только загружается или обучается по path);
+      3) строки rows без тональности размечаются этой моделью (через кэш результатов).
+    Запущенному sentiment_worker отправляется команда перечитать модель. Возврат: сколько размечено.
+    """
+    if not rows:
+        return 0
+    saved = _saved_training_rows(path, csv_rows, bigrams) if csv_rows is not None and engine == "nb" else None
+    fps, classes = saved or (array("Q"), [])
+    if saved is None and path.exists():
+        for r in _iter_csv(path):
+            fps.append(text_fingerprint((r.get(TEXT_COL) or "").strip()))
+            classes.append(rating_class(r))
+    texts = [(r.get(TEXT_COL) or "").strip() for r in rows]
+    new_fps = array("Q", (text_fingerprint(t) for t in texts))
+    new_classes = [rating_class(r) for r in rows]
+
+    nb, fit_from = load_model(path, fps, classes, engine, bigrams)
+    if nb is None:
+        nb, fit_from = new_model(engine, bigrams), 0
+    if any(classes[fit_from:]):
+        _fit_stream(nb, path, fit_from)
+    corpus = build_corpus(texts)
+    if not isinstance(nb, LinearModel):
+        nb.fit_batch(corpus, ((k, c) for k, c in enumerate(new_classes) if c))
+        save_model(path, nb, fps + new_fps, classes + new_classes)
+        if load_fingerprints(path) == fps:
+            # все прежние строки уже размечены — новые размечаются здесь же
+            save_fingerprints(path, fps + new_fps)
+
+    todo = [k for k, r in enumerate(rows) if not (r.get(SENT_COL) or "").strip()]
+    if todo:
+        cache = open_result_cache(nb) if result_cache else None
+        labels = label_with_cache(cache, [texts[k] for k in todo],
+                                  lambda ks: label_corpus(corpus, nb, [todo[j] for j in ks]))
+        if cache is not None:
+            cache.close()
+        for k, label in zip(todo, labels):
+            rows[k][SENT_COL] = label
+    sentiment_worker.reload()
+    return len(todo)
+
+def _report(path: Path, n_rows: int, n_todo: int, incremental: bool, nb_added, nb: NBModel):
+    labeled = f"{n_todo} of {n_rows} lines labeled" if incremental else f"{n_rows} lines"
+    name = nb.NAME
+    trained = f"{name}: +{nb_added} docs" if nb_added is not None else f"{name}: trained"
+    print(f"Updated: {path}  ({labeled})  "
+          f"{'(RuSentiLex: local)' if get_lexicon() else '(built-in dictionary)'}  "
+          f"{'(' + trained + ')' if nb.ready() else f'({name}: not enough data - vocabulary used)'}  "
+          f"(lemma cache: {lemma_cache_hit_rate():.1%} hits)"
+          + (f"  (result cache: {result_cache_hit_rate():.1%} hits)" if _result_lookups else ""))
+
+class SentimentEngine:
+    """
+    Разметка тональности внутри процесса, без запуска скрипта и без CSV.
+    Модель ансамбля (engine: "nb" или "linear") поднимается при первом обращении
+    (сохранённая рядом с csv_path, иначе обучается потоково по самому CSV) и дальше
+    остаётся в памяти вместе с лексиконом.
+
+        engine = SentimentEngine()
+        engine.label_batch(["Отличный сервис", "Не советую"])  # ['positive', 'negative']
+    """
+    def __init__(self, csv_path=DEFAULT_CSV, nb=None, result_cache: bool = True, engine: str = "nb"):
+        self.csv_path = Path(csv_path)
+        self.engine = engine
+        self._nb = nb
+        self.result_cache = result_cache
+        self._cache = None
+
+    @property
+    def nb(self):
+        if self._nb is None:
+            self._nb = self._load_model()
+        return self._nb
+
+    def _load_model(self):
+        if self.engine == "linear":
+            p = linear_model_path(self.csv_path)
+            try:
+                with _numpy().load(p) as z:
+                    meta = json.loads(str(z["meta"]))
+                    if meta.get("version") == LINEAR_MODEL_VERSION and meta.get("morph") == morph_stamp():
+                        return LinearModel.from_state({**meta["model"], "weights": z["weights"]})
+            except (OSError, ValueError, KeyError):
+                pass
+        else:
+            st = _read_nb_model_file(self.csv_path)
+            if st is not None:
+                return NBModel.from_state(st.get("model") or {})
+        nb = new_model(self.engine)
+        if self.csv_path.exists():
+            _fit_stream(nb, self.csv_path)
+        return nb
+
+    @property
+    def cache(self):
+        """Кэш результатов для текущей модели (None, если выключен или недоступен)."""
+        if self._cache is None and self.result_cache:
+            self._cache = open_result_cache(self.nb)
+        return self._cache
+
+    def reload(self):
+        """Сбросить модель: при следующем вызове она будет загружена заново."""
+        self._nb = None
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
+
+    def label_batch(self, texts) -> list[str]:
+        texts = [(t or "").strip() for t in texts]
+        if not texts:
+            return []
+        return label_with_cache(self.cache, texts,
+                                lambda idx: label_corpus(build_corpus(texts[i] for i in idx), self.nb))
+
+    def score_batch(self, texts) -> dict:
+        """Составляющие ансамбля по каждому тексту: словарь имя → массив NumPy (см. score_corpus)."""
+        return score_corpus(build_corpus((t or "").strip() for t in texts), self.nb)
 
-    for r in rows:
-        text = (r.get(TEXT_COL) or "").strip()
-        r[SENT_COL] = ensemble_label(text, nb)
+def print_startup_profile():
+    """Время по стадиям запуска; стадии, до которых дело не дошло, помечаются как not loaded."""
+    stages = ("import add_sentiment", "import numpy", "import pymorphy3", "load pymorphy dictionaries",
+              "load lemma cache", "build lexicon", "read csv")
+    print("Startup profile:")
+    for st in stages:
+        sec = STARTUP_PROFILE.get(st)
+        print(f"  {st:<28} {'not loaded' if sec is None else f'{sec * 1000:8.1f} ms'}")
 
-    with path.open("w", encoding="utf-8", newline="") as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames, quoting=csv.QUOTE_ALL)
-        w.writeheader()
-        w.writerows(rows)
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Разметка тональности отзывов в CSV.")
+    ap.add_argument("csv", nargs="?", default=DEFAULT_CSV, help="CSV с отзывами (по умолчанию all_reviews.csv)")
+    ap.add_argument("--incremental", action="store_true",
+                    help="размечать только строки без тональности или с изменившимся текстом")
+    ap.add_argument("--rebuild-model", action="store_true",
+                    help="переобучить NB-модель с нуля, не используя сохранённую")
+    ap.add_argument("--check-model", action="store_true",
+                    help="сверить дообученную NB-модель с обучением с нуля")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                    help="число процессов для разметки (по умолчанию — число ядер; 1 — без пула)")
+    ap.add_argument("--stream", action="store_true",
+                    help="потоковая обработка кусками с ограниченной памятью (без пула процессов)")
+    ap.add_argument("--no-worker", action="store_true",
+                    help="не обращаться к резидентному процессу sentiment_worker, считать здесь")
+    ap.add_argument("--components", action="store_true",
+                    help="сохранить составляющие ансамбля по каждой строке в <csv>.sentiment_scores.npz "
+                         "(для tune_sentiment.py)")
+    ap.add_argument("--engine", choices=sorted(ENGINES), default="nb",
+                    help="модель ансамбля: nb — наивный Байес (по умолчанию), linear — логистическая регрессия (SGD)")
+    ap.add_argument("--bigrams", action="store_true",
+                    help="NB с хэшированными биграммами лемм (2^20 корзин) в дополнение к словам")
+    ap.add_argument("--no-result-cache", action="store_true",
+                    help="не использовать кэш результатов (DataAnalytics/Cache/sentiment_results.sqlite)")
+    ap.add_argument("--startup-profile", action="store_true",
+                    help="напечатать время импорта, загрузки словарей pymorphy3, лексикона и чтения CSV")
+    args = ap.parse_args(argv)
+    try:
+        if not args.no_worker:
+            res = sentiment_worker.remote_process_csv(
+                csv=str(Path(args.csv).resolve()), incremental=args.incremental, stream=args.stream,
+                rebuild_model=args.rebuild_model, check_model=args.check_model, workers=max(1, args.workers),
+                result_cache=not args.no_result_cache, components=args.components, bigrams=args.bigrams,
+                engine=args.engine)
+            if res is not None:
+                ok, output = res
+                print(output, end="" if output.endswith("\n") else "\n")
+                if args.startup_profile:
+                    print_startup_profile()
+                if not ok:
+                    sys.exit(1)
+                return
+        if args.stream:
+            ok = process_csv_stream(Path(args.csv), incremental=args.incremental,
+                                    rebuild_model=args.rebuild_model, check_model=args.check_model,
+                                    result_cache=not args.no_result_cache, components=args.components,
+                                    bigrams=args.bigrams, engine=args.engine)
+        else:
+            ok = process_csv(Path(args.csv), incremental=args.incremental,
+                             rebuild_model=args.rebuild_model, check_model=args.check_model,
+                             workers=max(1, args.workers), result_cache=not args.no_result_cache,
+                             components=args.components, bigrams=args.bigrams, engine=args.engine)
+        if args.startup_profile:
+            print_startup_profile()
+        if not ok:
+            sys.exit(1)
+    finally:
+        # новые леммы этого запуска — в кэш на диске при любом исходе (в том числе Up to date)
+        save_lemma_cache()
 
-    print(f"Updated: {path}  ({len(rows)} lines)  "
-          f"{'(RuSentiLex: local)' if RU_SENTI else '(built-in dictionary)'}  "
-          f"{'(NB: trained)' if nb.ready() else '(NB: not enough data - vocabulary used)'}")
+STARTUP_PROFILE["import add_sentiment"] = time.perf_counter() - _IMPORT_T0
 
 if __name__ == "__main__":
-    p = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(DEFAULT_CSV)
-    process_csv(p)
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,238 @@
+"""
+Резидентный процесс разметки тональности.
+
+Держит в памяти MorphAnalyzer, лексикон и NB-модель и принимает запросы по локальному
+сокету (Unix socket, на Windows — именованный канал). Кадры — multiprocessing.connection
+(длина + байты), внутри кадра: 1 байт операции + полезная нагрузка.
+
+  запрос               ответ
+  P                    K                                — ping
+  L + JSON [тексты]    K + метки через \\n              — разметка пачки
+  C + JSON {параметры} K|E + JSON {ok, output}          — process_csv целиком
+  R                    K                                — перечитать модель
+  Q                    K                                — остановить процесс
+
+Запуск:  python DataAnalytics/sentiment_worker.py [--csv Csv/Reviews/all_reviews.csv]
+Клиенты (add_sentiment.py и другие) используют процесс, если он запущен, иначе работают сами.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+from typing import Optional
+
+if sys.platform == "win32":
+    ADDRESS = r"\\.\pipe\review_analytics_sentiment"
+    FAMILY = "AF_PIPE"
+else:
+    ADDRESS = str(Path(tempfile.gettempdir()) / f"review_analytics_sentiment_{os.getuid()}.sock")
+    FAMILY = "AF_UNIX"
+
+OP_PING, OP_LABEL, OP_CSV, OP_RELOAD, OP_QUIT = b"P", b"L", b"C", b"R", b"Q"
+ST_OK, ST_ERR = b"K", b"E"
+
+
+def _key_file() -> Path:
+    """Ключ доступа — в кэше add_sentiment (CACHE_DIR рядом с модулем), откуда бы ни запускали."""
+    import add_sentiment
+    return add_sentiment.CACHE_DIR / "sentiment_worker.key"
+
+
+def _read_key() -> Optional[bytes]:
+    try:
+        return _key_file().read_bytes() or None
+    except OSError:
+        return None
+
+
+def connect(address: str = ADDRESS):
+    """Соединение с запущенным процессом или None, если его нет."""
+    key = _read_key()
+    if key is None:
+        return None
+    if FAMILY == "AF_UNIX" and not os.path.exists(address):
+        return None
+    try:
+        return Client(address, family=FAMILY, authkey=key)
+    except Exception:
+        # нет сокета, отказ в соединении, чужой ключ — считаем, что процесса нет
+        return None
+
+
+def _request(conn, op: bytes, payload: bytes = b"") -> tuple[bytes, bytes]:
+    conn.send_bytes(op + payload)
+    frame = conn.recv_bytes()
+    return frame[:1], frame[1:]
+
+
+def remote_label_batch(texts, address: str = ADDRESS) -> Optional[list[str]]:
+    """Метки от резидентного процесса; None — если он не запущен или не ответил."""
+    conn = connect(address)
+    if conn is None:
+        return None
+    try:
+        with conn:
+            status, body = _request(conn, OP_LABEL, json.dumps(list(texts), ensure_ascii=False).encode("utf-8"))
+    except (OSError, EOFError):
+        return None
+    if status != ST_OK:
+        return None
+    return body.decode("utf-8").split("\n") if body else []
+
+
+def remote_process_csv(address: str = ADDRESS, **params) -> Optional[tuple[bool, str]]:
+    """process_csv в резидентном процессе: (ok, вывод) или None, если процесса нет."""
+    conn = connect(address)
+    if conn is None:
+        return None
+    try:
+        with conn:
+            status, body = _request(conn, OP_CSV, json.dumps(params, ensure_ascii=False).encode("utf-8"))
+    except (OSError, EOFError):
+        return None
+    res = json.loads(body.decode("utf-8"))
+    return status == ST_OK and bool(res.get("ok")), res.get("output", "")
+
+
+def ping(address: str = ADDRESS) -> bool:
+    conn = connect(address)
+    if conn is None:
+        return False
+    try:
+        with conn:
+            return _request(conn, OP_PING)[0] == ST_OK
+    except (OSError, EOFError):
+        return False
+
+
+def reload(address: str = ADDRESS) -> bool:
+    """Попросить запущенный процесс перечитать модель (после того как её сохранили снаружи)."""
+    conn = connect(address)
+    if conn is None:
+        return False
+    try:
+        with conn:
+            return _request(conn, OP_RELOAD)[0] == ST_OK
+    except (OSError, EOFError):
+        return False
+
+
+def stop(address: str = ADDRESS) -> bool:
+    conn = connect(address)
+    if conn is None:
+        return False
+    try:
+        with conn:
+            return _request(conn, OP_QUIT)[0] == ST_OK
+    except (OSError, EOFError):
+        return False
+
+
+def _run_csv(params: dict) -> tuple[bool, str]:
+    import add_sentiment as sa
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        path = Path(params["csv"])
+        if params.get("stream"):
+            ok = sa.process_csv_stream(path, incremental=params.get("incremental", False),
+                                       rebuild_model=params.get("rebuild_model", False),
+                                       check_model=params.get("check_model", False),
+                                       result_cache=params.get("result_cache", True),
+                                       components=params.get("components", False),
+                                       bigrams=params.get("bigrams", False),
+                                       engine=params.get("engine", "nb"))
+        else:
+            ok = sa.process_csv(path, incremental=params.get("incremental", False),
+                                rebuild_model=params.get("rebuild_model", False),
+                                check_model=params.get("check_model", False),
+                                workers=max(1, int(params.get("workers", 1))),
+                                result_cache=params.get("result_cache", True),
+                                components=params.get("components", False),
+                                bigrams=params.get("bigrams", False),
+                                engine=params.get("engine", "nb"))
+    sa.save_lemma_cache()
+    return ok, out.getvalue()
+
+
+def serve(csv_path: str, address: str = ADDRESS):
+    import add_sentiment as sa
+    engine = sa.SentimentEngine(csv_path)
+    engine.nb  # прогрев: модель загружается до первого запроса
+    # в add_sentiment тяжёлые ресурсы ленивые — резидентный процесс поднимает их сразу
+    sa.get_lex_trie()
+    sa._get_morph()
+
+    key = os.urandom(32)
+    key_path = _key_file()
+    key_path.parent.mkdir(parents=True, exist_ok=True)
+    key_path.write_bytes(key)
+    if FAMILY == "AF_UNIX" and os.path.exists(address):
+        os.unlink(address)
+
+    print(f"Sentiment worker listening on {address}", flush=True)
+    with Listener(address, family=FAMILY, authkey=key) as listener:
+        running = True
+        while running:
+            try:
+                conn = listener.accept()
+            except Exception:
+                # клиент отвалился или не прошёл проверку ключа
+                continue
+            with conn:
+                while True:
+                    try:
+                        frame = conn.recv_bytes()
+                    except (OSError, EOFError):
+                        break
+                    op, payload = frame[:1], frame[1:]
+                    try:
+                        if op == OP_PING:
+                            conn.send_bytes(ST_OK)
+                        elif op == OP_LABEL:
+                            labels = engine.label_batch(json.loads(payload.decode("utf-8")))
+                            conn.send_bytes(ST_OK + "\n".join(labels).encode("utf-8"))
+                        elif op == OP_CSV:
+                            ok, output = _run_csv(json.loads(payload.decode("utf-8")))
+                            engine.reload()
+                            conn.send_bytes(ST_OK + json.dumps({"ok": ok, "output": output},
+                                                               ensure_ascii=False).encode("utf-8"))
+                        elif op == OP_RELOAD:
+                            engine.reload()
+                            conn.send_bytes(ST_OK)
+                        elif op == OP_QUIT:
+                            conn.send_bytes(ST_OK)
+                            running = False
+                            break
+                        else:
+                            conn.send_bytes(ST_ERR + json.dumps({"ok": False, "output": "unknown op"}).encode("utf-8"))
+                    except Exception as e:
+                        try:
+                            conn.send_bytes(ST_ERR + json.dumps({"ok": False, "output": str(e)},
+                                                                ensure_ascii=False).encode("utf-8"))
+                        except (OSError, EOFError):
+                            break
+    try:
+        key_path.unlink()
+    except OSError:
+        pass
+    print("Sentiment worker stopped", flush=True)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Резидентный процесс разметки тональности.")
+    ap.add_argument("--csv", default="Csv/Reviews/all_reviews.csv", help="CSV, рядом с которым лежит NB-модель")
+    ap.add_argument("--stop", action="store_true", help="остановить запущенный процесс")
+    args = ap.parse_args(argv)
+    if args.stop:
+        print("stopped" if stop() else "worker is not running")
+        return
+    serve(args.csv)
+
+
+if __name__ == "__main__":
+    main()
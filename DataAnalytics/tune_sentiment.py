@@ -0,0 +1,164 @@
+"""
+Подбор порогов ансамбля тональности по звёздам без повторной лемматизации.
+
+Читает составляющие, сохранённые `add_sentiment.py --components` (<csv>.sentiment_scores.npz),
+и перебирает в NumPy веса NB/словаря, пороги fused и пороги словаря LEX_*_TH_*.
+Цель — доля совпадений с классом по звёздам: 1–2 — negative, 3 — neutral, 4–5 — positive
+(строки без рейтинга не учитываются).
+
+  python DataAnalytics/add_sentiment.py --components
+  python DataAnalytics/tune_sentiment.py
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+import add_sentiment as sa
+
+NEG, NEU, POS = -1, 0, 1
+
+NB_WEIGHTS = np.round(np.arange(0.30, 0.851, 0.05), 2)
+FUSED_NEUTRALS = np.round(np.arange(0.0, 0.161, 0.02), 2)
+POS_CUTS = np.round(np.arange(0.02, 0.401, 0.01), 2)
+NEG_CUTS = -POS_CUTS
+
+
+def load_scores(path: Path) -> dict:
+    with np.load(path) as z:
+        return {k: z[k] for k in z.files}
+
+
+def current_params() -> dict:
+    names = ("NB_WEIGHT", "LEX_WEIGHT", "FUSED_NEUTRAL", "DISAGREE_NEUTRAL", "WEAK_FUSED",
+             "FUSED_POS_TH", "FUSED_NEG_TH", "LEX_POS_TH_SHORT", "LEX_NEG_TH_SHORT",
+             "LEX_POS_TH_LONG", "LEX_NEG_TH_LONG")
+    return {n: getattr(sa, n) for n in names}
+
+
+def star_targets(rating: np.ndarray) -> np.ndarray:
+    return np.where(rating >= 4.0, POS, np.where(rating <= 2.0, NEG, NEU)).astype(np.int8)
+
+
+def predict(sc: dict, p: dict) -> np.ndarray:
+    """Векторный decide_label: метки -1/0/1 для набора параметров p (имена — как константы add_sentiment)."""
+    if bool(sc["use_nb"]):
+        lex, nb = sc["lex_comp"], sc["nb_comp"]
+        fused = p["NB_WEIGHT"] * nb + p["LEX_WEIGHT"] * lex
+        neutral = ((np.abs(fused) < p["FUSED_NEUTRAL"])
+                   | ((lex * nb < 0) & (np.maximum(np.abs(lex), np.abs(nb)) < p["DISAGREE_NEUTRAL"]))
+                   | ((sc["hits"] <= 1) & (np.abs(fused) < p["WEAK_FUSED"])))
+        out = np.where(fused >= p["FUSED_POS_TH"], POS, np.where(fused <= p["FUSED_NEG_TH"], NEG, NEU))
+        out[neutral] = NEU
+    else:
+        norm = sc["lex_score"] / np.maximum(3.0, sc["lex_tokens"])
+        short = sc["lex_tokens"] <= 5
+        pos_th = np.where(short, p["LEX_POS_TH_SHORT"], p["LEX_POS_TH_LONG"])
+        neg_th = np.where(short, p["LEX_NEG_TH_SHORT"], p["LEX_NEG_TH_LONG"])
+        out = np.where(norm > pos_th, POS, np.where(norm < neg_th, NEG, NEU))
+    out = out.astype(np.int8)
+    out[sc["hard"] == sa.HARD_NEG] = NEG
+    out[sc["hard"] == sa.HARD_POS] = POS
+    return out
+
+
+def _best_cuts(values: np.ndarray, target: np.ndarray, strict: bool):
+    """
+    Лучшие пороги «value >= pos → positive, value <= neg → negative» (strict: > и <).
+    Решения по pos и neg не пересекаются (pos > 0 > neg), поэтому число верных
+    раскладывается в сумму по двум порогам и каждый ищется отдельно через searchsorted.
+    Возврат: (число верных, pos, neg).
+    """
+    def above(cls, cuts):
+        v = np.sort(values[target == cls])
+        return len(v) - np.searchsorted(v, cuts, side="right" if strict else "left")
+
+    def below(cls, cuts):
+        v = np.sort(values[target == cls])
+        return np.searchsorted(v, cuts, side="left" if strict else "right")
+
+    gain_pos = above(POS, POS_CUTS) - above(NEU, POS_CUTS)
+    gain_neg = below(NEG, NEG_CUTS) - below(NEU, NEG_CUTS)
+    i, j = int(np.argmax(gain_pos)), int(np.argmax(gain_neg))
+    correct = int((target == NEU).sum() + gain_pos[i] + gain_neg[j])
+    return correct, float(POS_CUTS[i]), float(NEG_CUTS[j])
+
+
+def tune(sc: dict, target: np.ndarray, base: dict):
+    """Перебор сетки; возврат (лучшие параметры, число верных, число комбинаций)."""
+    best, best_ok, combos = dict(base), -1, 0
+    hard = sc["hard"] != 0
+    hard_ok = int((predict(sc, base)[hard] == target[hard]).sum())
+    free = ~hard
+    tgt = target[free]
+
+    if bool(sc["use_nb"]):
+        lex, nb, hits = sc["lex_comp"][free], sc["nb_comp"][free], sc["hits"][free]
+        disagree = (lex * nb < 0) & (np.maximum(np.abs(lex), np.abs(nb)) < base["DISAGREE_NEUTRAL"])
+        for w in NB_WEIGHTS:
+            lw = round(1.0 - float(w), 2)
+            fused = w * nb + lw * lex
+            weak = disagree | ((hits <= 1) & (np.abs(fused) < base["WEAK_FUSED"]))
+            for band in FUSED_NEUTRALS:
+                neutral = weak | (np.abs(fused) < band)
+                ok, pos_th, neg_th = _best_cuts(fused[~neutral], tgt[~neutral], strict=False)
+                ok += int((tgt[neutral] == NEU).sum())
+                combos += len(POS_CUTS) * len(NEG_CUTS)
+                if ok > best_ok:
+                    best_ok = ok
+                    best.update(NB_WEIGHT=float(w), LEX_WEIGHT=lw, FUSED_NEUTRAL=float(band),
+                                FUSED_POS_TH=pos_th, FUSED_NEG_TH=neg_th)
+    else:
+        norm = sc["lex_score"][free] / np.maximum(3.0, sc["lex_tokens"][free])
+        short = sc["lex_tokens"][free] <= 5
+        best_ok = 0
+        for mask, suffix in ((short, "SHORT"), (~short, "LONG")):
+            ok, pos_th, neg_th = _best_cuts(norm[mask], tgt[mask], strict=True)
+            best_ok += ok
+            combos += len(POS_CUTS) * len(NEG_CUTS)
+            best[f"LEX_POS_TH_{suffix}"], best[f"LEX_NEG_TH_{suffix}"] = pos_th, neg_th
+    return best, best_ok + hard_ok, combos
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Подбор порогов тональности по звёздам (по сохранённым составляющим).")
+    ap.add_argument("csv", nargs="?", default=sa.DEFAULT_CSV,
+                    help="CSV, для которого запускался add_sentiment.py --components")
+    args = ap.parse_args(argv)
+
+    path = sa.components_path(Path(args.csv))
+    if not path.exists():
+        print(f"No component scores at {path} - run add_sentiment.py --components first.")
+        sys.exit(1)
+    sc = load_scores(path)
+    known = ~np.isnan(sc["rating"])
+    if not known.any():
+        print("No star ratings to tune against.")
+        sys.exit(1)
+    sc = {k: (v[known] if v.ndim else v) for k, v in sc.items()}
+    target = star_targets(sc["rating"])
+
+    base = current_params()
+    base_ok = int((predict(sc, base) == target).sum())
+    t0 = time.perf_counter()
+    best, best_ok, combos = tune(sc, target, base)
+    ms = (time.perf_counter() - t0) * 1000
+
+    n = len(target)
+    mode = "NB + dictionary" if bool(sc["use_nb"]) else "dictionary only"
+    print(f"Rated reviews: {n}  (mode: {mode})  grid: {combos} combinations in {ms:.1f} ms")
+    print(f"Current accuracy: {base_ok / n:.2%}")
+    print(f"Best accuracy:    {best_ok / n:.2%}")
+    changed = [k for k in best if best[k] != base[k]]
+    if not changed:
+        print("Current thresholds are already the best on this grid.")
+        return
+    print("Suggested constants for add_sentiment.py:")
+    for k in changed:
+        print(f"  {k:<18} = {best[k]:g}    (now {base[k]:g})")
+
+
+if __name__ == "__main__":
+    main()
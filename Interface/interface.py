@@ -702,10 +702,10 @@ class MainWindow(QMainWindow):
             ("Merge Summary", Path("Csv/Summary/merged_summary.py")),
         ]
 
+        # тональность новых отзывов размечает сам Merge NEW Reviews
         self.INCR_MERGE_SCRIPTS: List[Tuple[str, Path]] = [
             ("Merge NEW Reviews", Path("Csv/Reviews/NewReviews/merged_new_reviews.py")),
             ("Merge NEW Summary", Path("Csv/Summary/NewSummary/merged_new_summary.py")),
-            ("Add Sentiment", Path("DataAnalytics/add_sentiment.py")),
         ]
 
         if df is not None:
@@ -19,11 +19,18 @@ from selenium.common.exceptions import (
 
 import os, sys, platform
 
+# ключ отзыва, индекс ключей и отметки слияния — общий модуль с merged_new_reviews.py
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "Csv" / "Reviews" / "NewReviews"))
+from review_index import (review_key_hash, open_review_key_index, in_review_key_index, load_watermarks,
+                          latest_dates_from_watermarks, prev_counts_from_watermarks, norm_author, text_signature)
+
 DGIS_URLS_FILE       = "./Urls/2gis_urls.txt"
 FALLBACK_URL         = ("https://2gis.ru/penza/search/%D0%B0%D0%B2%D1%82%D0%BE%D0%BB%D0%BE%D1%86%D0%BC%D0%B0%D0%BD/"
                         "firm/70000001057701394/44.973806%2C53.220685/tab/reviews?m=44.975027%2C53.220456%2F17.63")
 
 ALL_REVIEWS_CSV      = "Csv/Reviews/all_reviews.csv"
+ALL_REVIEWS_KEYS     = "Csv/Reviews/all_reviews.keys.npy"
+WATERMARKS_JSON      = "Csv/Reviews/watermarks.json"
 SUMMARY_BASE_CSV     = "Csv/Summary/2gis_summary.csv"
 
 OUT_CSV_REV_DELTA    = "Csv/Reviews/NewReviews/2gis_new_since.csv"
@@ -112,23 +119,6 @@ MONTHS_RU = {"января":1,"февраля":2,"марта":3,"апреля":4
              "июля":7,"августа":8,"сентября":9,"октября":10,"ноября":11,"декабря":12}
 RELATIVE_MAP = {"сегодня": 0, "вчера": -1}
 
-def norm_text(s: str) -> str:
-    if not s: return ""
-    x = unicodedata.normalize("NFKC", s).lower()
-    x = re.sub(r"\s+", " ", x).strip()
-    x = re.sub(r"[«»\"'”“„‚…‐-–—·•/\\\(\)\[\]\{\},.;:!?]", "", x)
-    x = re.sub(r"\s+", " ", x).strip()
-    return x
-
-def norm_author(s: str) -> str:
-    if not s: return ""
-    x = unicodedata.normalize("NFKC", s).lower()
-    x = re.sub(r"\s+", " ", x).strip()
-    return x
-
-def text_signature(s: str, length: int = 180) -> str:
-    return norm_text(s)[:length]
-
 def parse_ru_date_to_iso(s: Optional[str]) -> Optional[str]:
     if not s: return None
     s = s.strip().lower()
@@ -730,10 +720,19 @@ def main():
     except FileNotFoundError:
         urls = [FALLBACK_URL]
 
-    latest_by_org = load_latest_dates_by_org(ALL_REVIEWS_CSV, PLATFORM)
+    marks = load_watermarks(WATERMARKS_JSON, ALL_REVIEWS_CSV, SUMMARY_BASE_CSV)
+    if marks is not None:
+        latest_by_org = latest_dates_from_watermarks(marks, PLATFORM, normalize_org)
+        prev_counts = prev_counts_from_watermarks(marks, PLATFORM, normalize_org)
+        print(f"[INFO] Watermarks: {len(marks)} organizations from '{WATERMARKS_JSON}'.")
+    else:
+        latest_by_org = load_latest_dates_by_org(ALL_REVIEWS_CSV, PLATFORM)
+        prev_counts = load_prev_reviews_count(SUMMARY_BASE_CSV, PLATFORM)
     print(f"[INFO] Threshold dates: {len(latest_by_org)} орг. | speed={SPEED_PROFILE} | headless={HEADLESS}")
 
-    prev_counts = load_prev_reviews_count(SUMMARY_BASE_CSV, PLATFORM)
+    key_index = open_review_key_index(ALL_REVIEWS_KEYS, ALL_REVIEWS_CSV)
+    if key_index is not None:
+        print(f"[INFO] Review key index: {len(key_index)} keys from '{ALL_REVIEWS_KEYS}'.")
 
     Path(OUT_CSV_SUMMARY_NEW).parent.mkdir(parents=True, exist_ok=True)
     Path(OUT_CSV_REV_DELTA).parent.mkdir(parents=True, exist_ok=True)
@@ -770,6 +769,9 @@ def main():
             written = 0
             for r in reviews:
                 try:
+                    if key_index is not None and in_review_key_index(key_index, review_key_hash(
+                            PLATFORM, (r.get("organization") or "").strip(), r.get("author") or "", r.get("text") or "")):
+                        continue
                     w_rev.writerow({
                         "rating":       r.get("rating"),
                         "author":       (r.get("author") or "").strip(),
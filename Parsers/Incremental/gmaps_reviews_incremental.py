@@ -22,6 +22,11 @@ from selenium.webdriver.support import expected_conditions as EC
 
 import os, sys, platform
 from pathlib import Path
+
+# ключ отзыва, индекс ключей и отметки слияния — общий модуль с merged_new_reviews.py
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "Csv" / "Reviews" / "NewReviews"))
+from review_index import (review_key_hash, open_review_key_index, in_review_key_index, load_watermarks,
+                          latest_dates_from_watermarks, prev_counts_from_watermarks, norm_author, text_signature)
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
@@ -34,6 +39,8 @@ else:
 URLS_FILE      = "Urls/gmaps_urls.txt"
 
 ALL_REVIEWS_CSV      = "Csv/Reviews/all_reviews.csv"
+ALL_REVIEWS_KEYS     = "Csv/Reviews/all_reviews.keys.npy"
+WATERMARKS_JSON      = "Csv/Reviews/watermarks.json"
 SUMMARY_BASE_CSV     = "Csv/Summary/gmaps_summary.csv"
 OUT_CSV_REV_DELTA    = "Csv/Reviews/NewReviews/gmaps_new_since.csv"
 OUT_CSV_SUMMARY_NEW  = "Csv/Summary/NewSummary/gmaps_summary_new.csv"
@@ -213,27 +220,6 @@ def normalize_relative(text: Optional[str], now: Optional[datetime] = None) -> O
             pass
     return None
 
-def norm_text(s: str) -> str:
-    if not s:
-        return ""
-    x = unicodedata.normalize("NFKC", s).lower()
-    x = re.sub(r"\s+", " ", x).strip()
-    x = re.sub(r"[«»\"'”“„‚…‐-–—\-–—·•/\\\(\)\[\]\{\},.;:!?]", "", x)
-    x = re.sub(r"\s+", " ", x).strip()
-    return x
-
-def norm_author(s: str) -> str:
-    if not s:
-        return ""
-    x = unicodedata.normalize("NFKC", s).lower()
-    x = re.sub(r"\s+", " ", x).strip()
-    return x
-
-def text_signature(s: str, length: int = 180) -> str:
-    """Сигнатура для дедупликации по тексту (усечённый нормализованный текст)."""
-    n = norm_text(s)
-    return n[:length]
-
 def add_hl_ru(url: str) -> str:
     try:
         u = urlparse(url); q = parse_qs(u.query); q["hl"] = ["ru"]
@@ -564,11 +550,13 @@ def collect_delta_gmaps(
     threshold: date,
     w_rev,
     organization: str,
-    existing_keys_for_org: Set[Tuple[str, str]]
+    existing_keys_for_org: Set[Tuple[str, str]],
+    key_index=None
 ) -> int:
     """
     Скроллит контейнер отзывов. Пишет в CSV только отзывы с датой > threshold.
-    Перед записью проверяет, нет ли уже такого отзыва в all_reviews (author_norm + text_signature).
+    Перед записью проверяет, нет ли уже такого отзыва в all_reviews (author_norm + text_signature,
+    а при наличии key_index — ещё и по индексу хэшей ключей).
     Останавливается, как только встретит отзыв с датой <= threshold.
     Возвращает: сколько новых (записанных) отзывов.
     """
@@ -624,6 +612,9 @@ def collect_delta_gmaps(
             t_sig  = text_signature(txt)
             if (a_norm, t_sig) in existing_keys_for_org:
                 continue
+            if key_index is not None and in_review_key_index(
+                    key_index, review_key_hash(PLATFORM, organization, item.get("author") or "", txt)):
+                continue
 
             w_rev.writerow({
                 "rating":       item.get("rating"),
@@ -657,17 +648,30 @@ def collect_delta_gmaps(
     return written
 
 def main():
-    latest_by_org = load_latest_dates_by_org(ALL_REVIEWS_CSV, PLATFORM)
+    marks = load_watermarks(WATERMARKS_JSON, ALL_REVIEWS_CSV, SUMMARY_BASE_CSV)
+    if marks is not None:
+        latest_by_org = latest_dates_from_watermarks(marks, PLATFORM, normalize_org)
+        print(f"[INFO] Watermarks: {len(marks)} organizations from '{WATERMARKS_JSON}'.")
+    else:
+        latest_by_org = load_latest_dates_by_org(ALL_REVIEWS_CSV, PLATFORM)
     if latest_by_org:
         print(f"[INFO] Latest dates found {len(latest_by_org)} organizations in '{ALL_REVIEWS_CSV}'.")
     else:
         print(f"[INFO] '{ALL_REVIEWS_CSV}' not found or empty - we will collect everything we have (threshold = 2 years).")
 
-    existing_keys = load_existing_review_keys(ALL_REVIEWS_CSV, PLATFORM)
-    print(f"[INFO] Deduplication keys loaded from '{ALL_REVIEWS_CSV}': "
-          f"{sum(len(v) for v in existing_keys.values())} pieces (across all organizations).")
+    key_index = open_review_key_index(ALL_REVIEWS_KEYS, ALL_REVIEWS_CSV)
+    if key_index is not None:
+        # индекс хранит тот же ключ (norm_author + text_signature, без отзывов без текста), что и множества
+        # ниже, поэтому CSV не сканируется: множества копят только отзывы, записанные в этом прогоне
+        existing_keys = {}
+        print(f"[INFO] Deduplication keys: index '{ALL_REVIEWS_KEYS}' ({len(key_index)} pieces, CSV is not scanned).")
+    else:
+        existing_keys = load_existing_review_keys(ALL_REVIEWS_CSV, PLATFORM)
+        print(f"[INFO] Deduplication keys loaded from '{ALL_REVIEWS_CSV}': "
+              f"{sum(len(v) for v in existing_keys.values())} pieces (across all organizations).")
 
-    prev_counts = load_prev_reviews_count(SUMMARY_BASE_CSV, PLATFORM)
+    prev_counts = prev_counts_from_watermarks(marks, PLATFORM, normalize_org) if marks is not None \
+        else load_prev_reviews_count(SUMMARY_BASE_CSV, PLATFORM)
     prev_count = prev_counts.get(ORG_KEY, 0)
     print(f"[INFO] Old reviews_count from '{SUMMARY_BASE_CSV}' for '{ORG_LABEL}': {prev_count}")
 
@@ -729,7 +733,8 @@ def main():
 
             existing_keys_for_org = existing_keys.get(ORG_KEY, set())
 
-            written = collect_delta_gmaps(drv, container, threshold, w_rev, ORG_LABEL, existing_keys_for_org)
+            written = collect_delta_gmaps(drv, container, threshold, w_rev, ORG_LABEL, existing_keys_for_org,
+                                          key_index)
             total_written += written
             print(f"  new reviews recorded: {written}")
 
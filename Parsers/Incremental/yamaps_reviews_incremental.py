@@ -23,11 +23,18 @@ from typing import Optional, Dict
 
 import os, sys, platform
 from pathlib import Path
+
+# ключ отзыва, индекс ключей и отметки слияния — общий модуль с merged_new_reviews.py
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "Csv" / "Reviews" / "NewReviews"))
+from review_index import review_key_hash, open_review_key_index, in_review_key_index, load_watermarks, \
+    latest_dates_from_watermarks
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 
 IN_ALL_REVIEWS_CSV   = "Csv/Reviews/all_reviews.csv"
+IN_ALL_REVIEWS_KEYS  = "Csv/Reviews/all_reviews.keys.npy"
+IN_WATERMARKS_JSON   = "Csv/Reviews/watermarks.json"
 YAMAPS_URLS_FILE     = "Urls/yamaps_urls.txt"
 
 if platform.system() == "Windows":
@@ -595,12 +602,21 @@ def collect_visible_delta(driver, seen: set, out: list, strictly_newer_than: dat
 
 
 def main():
-    latest_by_org = load_latest_dates_by_org(IN_ALL_REVIEWS_CSV, PLATFORM)
+    marks = load_watermarks(IN_WATERMARKS_JSON, IN_ALL_REVIEWS_CSV)
+    if marks is not None:
+        latest_by_org = latest_dates_from_watermarks(marks, PLATFORM)
+        print(f"[INFO] Watermarks: {len(marks)} organizations from '{IN_WATERMARKS_JSON}'.")
+    else:
+        latest_by_org = load_latest_dates_by_org(IN_ALL_REVIEWS_CSV, PLATFORM)
     if latest_by_org:
         print(f"[INFO] Latest dates found {len(latest_by_org)} for organizations in '{IN_ALL_REVIEWS_CSV}'.")
     else:
         print(f"[INFO] '{IN_ALL_REVIEWS_CSV}' not found or empty - we will collect everything we have (threshold = 2 years).")
 
+    key_index = open_review_key_index(IN_ALL_REVIEWS_KEYS, IN_ALL_REVIEWS_CSV)
+    if key_index is not None:
+        print(f"[INFO] Review key index: {len(key_index)} keys from '{IN_ALL_REVIEWS_KEYS}'.")
+
     try:
         urls = [u.strip() for u in Path(YAMAPS_URLS_FILE).read_text(encoding="utf-8").splitlines() if u.strip()]
     except FileNotFoundError:
@@ -727,6 +743,13 @@ def main():
                 if idle >= IDLE_LIMIT:
                     break
 
+            if key_index is not None:
+                fresh = [r for r in batch if not in_review_key_index(
+                    key_index, review_key_hash(PLATFORM, organization, r.get("author") or "", r.get("text") or ""))]
+                if len(fresh) < len(batch):
+                    print(f"  Already in all_reviews: {len(batch) - len(fresh)}")
+                batch = fresh
+
             for r in batch:
                 reviews_writer.writerow({
                     "rating":       r.get("rating"),
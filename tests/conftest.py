@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+for d in ("DataAnalytics", "Csv/Reviews", "Csv/Reviews/NewReviews"):
+    sys.path.insert(0, str(ROOT / d))
@@ -0,0 +1,76 @@
+from array import array
+
+import numpy as np
+import pytest
+
+import add_sentiment as sa
+
+POS = ["Отличный сервис, мастера вежливые", "Спасибо, всё сделали быстро", "очень хорошо, не дорого"]
+NEG = ["Ужасно, грубый персонал", "Долго ждали, машину вернули грязной", "не хорошо и очень дорого"]
+MASK = (1 << 64) - 1
+
+
+def _items(n: int):
+    texts = [f"{(POS if i % 2 == 0 else NEG)[i % 3]} {i}" for i in range(n)]
+    return texts, [(i, "pos" if i % 2 == 0 else "neg") for i in range(n)]
+
+
+def _bucket(h1: int, h2: int) -> int:
+    mix = sa._HASH_MIX
+    return ((((h1 * mix) & MASK) ^ h2) * mix & MASK) >> (64 - sa.BIGRAM_BITS)
+
+
+def test_bigram_buckets_stay_inside_reviews():
+    corpus = sa.build_corpus(["очень хорошо", "", "не хорошо сделали", "ок"])
+    tids, offsets = np.array(corpus.tids, dtype=np.int64), np.array(corpus.offsets, dtype=np.int64)
+    h = [sa._lemma_hash[sa._tok_lemma[t]] for t in corpus.tids]
+    want = [_bucket(h[0], h[1]), -1, _bucket(h[2], h[3]), _bucket(h[3], h[4]), -1, -1]
+    assert sa._bigram_buckets(tids, offsets).tolist() == want
+
+
+def test_fit_batch_matches_fit_doc():
+    texts, items = _items(60)
+    batch = sa.NBModel(bigrams=True)
+    batch.fit_batch(sa.build_corpus(texts), items)
+    single = sa.NBModel(bigrams=True)
+    for i, c in items:
+        single.fit_doc(texts[i], c)
+    assert batch.same_as(single) and batch.bi_pos_total == sum(len(texts[i].split()) - 1 for i, c in items if c == "pos")
+
+
+def test_word_order_matters_only_with_bigrams():
+    texts, items = _items(60)
+    corpus = sa.build_corpus(texts)
+    probe = sa.build_corpus(["очень хорошо не дорого", "не дорого очень хорошо"])
+    for bigrams in (False, True):
+        nb = sa.NBModel(bigrams=bigrams)
+        nb.fit_batch(corpus, items)
+        llr, n = nb.predict_llr_batch(probe)
+        assert list(n) == ([4, 4] if not bigrams else [7, 7])
+        assert (llr[0] == pytest.approx(llr[1])) is not bigrams
+
+
+def test_single_and_batch_predictions_agree():
+    texts, items = _items(60)
+    nb = sa.NBModel(bigrams=True)
+    nb.fit_batch(sa.build_corpus(texts), items)
+    probes = ["очень хорошо", "", "грубый персонал, долго ждали", "спасибо"]
+    llr, n = nb.predict_llr_batch(sa.build_corpus(probes))
+    for k, t in enumerate(probes):
+        assert nb.predict_llr(t) == (pytest.approx(llr[k]) if n[k] else 0.0, int(n[k]))
+
+
+def test_saved_model_keeps_bigrams(tmp_path):
+    texts, items = _items(60)
+    nb = sa.NBModel(bigrams=True)
+    nb.fit_batch(sa.build_corpus(texts), items)
+    path = tmp_path / "reviews.csv"
+    fps = array("Q", (sa.text_fingerprint(t) for t in texts))
+    classes = [c for _, c in items]
+    sa.save_nb_model(path, nb, fps, classes)
+    loaded, n = sa.load_nb_model(path, fps, classes, bigrams=True)
+    assert n == 60 and loaded.same_as(nb)
+    probe = sa.build_corpus(texts[:5])
+    assert np.array_equal(loaded.predict_llr_batch(probe)[0], nb.predict_llr_batch(probe)[0])
+    # модель без биграмм сохранённую не берёт — обучается заново
+    assert sa.load_nb_model(path, fps, classes, bigrams=False) == (None, 0)
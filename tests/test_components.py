@@ -0,0 +1,84 @@
+import csv
+
+import numpy as np
+import pytest
+
+import add_sentiment as sa
+import tune_sentiment as ts
+
+POS = ["Отличный сервис, мастера вежливые", "Спасибо, всё сделали быстро!", "Без обмана, рекомендую 👍",
+       "Нормально, но долго"]
+NEG = ["Ужасно, грубый персонал", "Никогда не обращайтесь", "Долго ждали, развод на деньги 😡",
+       "Неплохо, но дорого"]
+LABEL = {ts.NEG: "negative", ts.NEU: "neutral", ts.POS: "positive"}
+
+
+def _write(path, n: int):
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, quoting=csv.QUOTE_ALL)
+        w.writerow(["rating", "text"])
+        for i in range(n):
+            pos = i % 2 == 0
+            w.writerow([str(i % 5 + 1) if i % 6 else "", f"{(POS if pos else NEG)[i % 4]} {i}"])
+
+
+def _read(path):
+    with path.open(encoding="utf-8-sig", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+@pytest.fixture(autouse=True)
+def _caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(sa, "LEMMA_CACHE_FILE", tmp_path / "lemma_cache.tsv")
+    monkeypatch.setattr(sa, "RESULT_CACHE_FILE", tmp_path / "results.sqlite")
+
+
+@pytest.fixture
+def scored(tmp_path):
+    path = tmp_path / "reviews.csv"
+    _write(path, 240)
+    sa.process_csv(path, result_cache=False, components=True)
+    return path, ts.load_scores(sa.components_path(path))
+
+
+def test_components_reproduce_labels(scored):
+    path, sc = scored
+    rows = _read(path)
+    assert all(len(v) == len(rows) for v in sc.values() if v.ndim)
+    assert bool(sc["use_nb"])
+    assert np.array_equal(np.isnan(sc["rating"]), [not r["rating"] for r in rows])
+    assert [LABEL[int(x)] for x in ts.predict(sc, ts.current_params())] == [r["sentiment"] for r in rows]
+
+
+def test_stream_writes_the_same_components(scored, tmp_path, monkeypatch):
+    _, sc = scored
+    monkeypatch.setattr(sa, "STREAM_CHUNK_ROWS", 37)
+    path = tmp_path / "stream" / "reviews.csv"
+    path.parent.mkdir()
+    _write(path, 240)
+    sa.process_csv_stream(path, result_cache=False, components=True)
+    stream = ts.load_scores(sa.components_path(path))
+    assert set(stream) == set(sc)
+    for k in sc:
+        assert np.array_equal(stream[k], sc[k], equal_nan=sc[k].dtype.kind == "f"), k
+
+
+@pytest.mark.parametrize("use_nb", [True, False])
+def test_tuner_counts_match_its_own_thresholds(scored, use_nb):
+    _, sc = scored
+    known = ~np.isnan(sc["rating"])
+    sc = {k: (v[known] if v.ndim else v) for k, v in sc.items()}
+    sc["use_nb"] = np.array(use_nb)
+    target = ts.star_targets(sc["rating"])
+    base = ts.current_params()
+    best, best_ok, combos = ts.tune(sc, target, base)
+    assert combos > 0
+    assert best_ok == int((ts.predict(sc, best) == target).sum())
+    assert best_ok >= int((ts.predict(sc, base) == target).sum())
+
+
+def test_tuner_cli(scored, capsys):
+    path, _ = scored
+    ts.main([str(path)])
+    out = capsys.readouterr().out
+    assert "Rated reviews: 200" in out and "mode: NB + dictionary" in out
@@ -0,0 +1,69 @@
+import csv
+
+import pytest
+
+import add_sentiment as sa
+
+POS = ["Отличный сервис, мастера вежливые", "Спасибо, всё сделали быстро!", "Без обмана, рекомендую 👍"]
+NEG = ["Ужасно, грубый персонал", "Никогда не обращайтесь", "Долго ждали, развод на деньги 😡"]
+PROBES = ["Отличный сервис", "Не советую", "грубый мастер, долго ждали", "всё быстро, спасибо", "", "просто визит"]
+
+
+def _write(path, n: int):
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, quoting=csv.QUOTE_ALL)
+        w.writerow(["rating", "text"])
+        for i in range(n):
+            pos = i % 2 == 0
+            w.writerow([("5" if pos else "1") if i % 4 else "", f"{(POS if pos else NEG)[i % 3]} {i}"])
+
+
+def _read(path):
+    with path.open(encoding="utf-8-sig", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+@pytest.fixture(autouse=True)
+def _caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(sa, "LEMMA_CACHE_FILE", tmp_path / "lemma_cache.tsv")
+    monkeypatch.setattr(sa, "RESULT_CACHE_FILE", tmp_path / "results.sqlite")
+
+
+@pytest.mark.parametrize("engine", ["nb", "linear"])
+def test_engine_labels_like_process_csv(tmp_path, engine):
+    path = tmp_path / "reviews.csv"
+    _write(path, 200)
+    # модели рядом ещё нет — движок обучается по CSV сам
+    cold = sa.SentimentEngine(path, result_cache=False, engine=engine).label_batch(PROBES)
+    sa.process_csv(path, result_cache=False, engine=engine)
+    rows = _read(path)
+    for result_cache in (False, True):
+        eng = sa.SentimentEngine(path, result_cache=result_cache, engine=engine)
+        try:
+            assert eng.nb.ready()
+            assert eng.label_batch([r["text"] for r in rows]) == [r["sentiment"] for r in rows]
+            assert eng.label_batch(PROBES) == cold
+        finally:
+            eng.reload()
+
+
+def test_engine_reload_picks_up_saved_model(tmp_path):
+    path = tmp_path / "reviews.csv"
+    _write(path, 40)
+    eng = sa.SentimentEngine(path, result_cache=False)
+    first = eng.nb
+    assert eng.nb is first
+    sa.process_csv(path, result_cache=False)
+    eng.reload()
+    assert eng.nb is not first and eng.nb.same_as(first)
+
+
+def test_score_batch_components(tmp_path):
+    path = tmp_path / "reviews.csv"
+    _write(path, 100)
+    eng = sa.SentimentEngine(path, result_cache=False)
+    comps = eng.score_batch(PROBES)
+    assert {"hard", "lex_score", "nb_llr", "fused", "hits"} <= set(comps)
+    assert all(len(v) == len(PROBES) for v in comps.values())
+    assert list(comps["hard"][:2]) == [0, sa.HARD_NEG]
+    assert comps["fused"][0] > 0 > comps["fused"][2]
@@ -0,0 +1,124 @@
+import csv
+from array import array
+
+import pytest
+
+import add_sentiment as sa
+import merged_new_reviews as mnr
+
+POS = ["Отличный сервис, мастера вежливые", "Спасибо, всё сделали быстро и качественно", "Очень довольна, рекомендую"]
+NEG = ["Ужасно, грубый персонал", "Долго ждали, машину вернули грязной", "Не советую, обманули с ценой"]
+FIELDS = ["rating", "author", "date_iso", "text", "platform", "organization"]
+
+
+def _rows(start: int, n: int) -> list[dict]:
+    rows = []
+    for i in range(start, start + n):
+        pos = i % 2 == 0
+        text = f"{(POS if pos else NEG)[i % 3]} {i}" if i % 7 else f"Обычный визит номер {i}"
+        rows.append({"rating": ("5" if pos else "1") if i % 5 else "", "author": f"a{i}",
+                     "date_iso": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}", "text": text,
+                     "platform": "2GIS", "organization": "Org"})
+    return rows
+
+
+def _write(path, rows, fields=FIELDS):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=fields, quoting=csv.QUOTE_ALL, extrasaction="ignore")
+        w.writeheader()
+        w.writerows(rows)
+
+
+def _read(path) -> list[dict]:
+    with path.open(encoding="utf-8-sig", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def _state(path):
+    """Отпечатки и классы CSV, сохранённая модель (и с какой строки её надо дообучать) и модель с нуля."""
+    fps, classes = array("Q"), []
+    for r in sa._iter_csv(path):
+        fps.append(sa.text_fingerprint((r.get("text") or "").strip()))
+        classes.append(sa.rating_class(r))
+    saved, fit_from = sa.load_model(path, fps, classes)
+    full = sa.new_model()
+    sa._fit_stream(full, path, 0)
+    return fps, saved, fit_from, full
+
+
+@pytest.fixture(autouse=True)
+def _caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(sa, "LEMMA_CACHE_FILE", tmp_path / "lemma_cache.tsv")
+    monkeypatch.setattr(sa, "RESULT_CACHE_FILE", tmp_path / "results.sqlite")
+    monkeypatch.setattr(sa.sentiment_worker, "reload", lambda *a, **kw: False)
+
+
+def test_incremental_run_labels_only_new_rows(tmp_path):
+    path = tmp_path / "reviews.csv"
+    _write(path, _rows(0, 120))
+    sa.process_csv(path, result_cache=False)
+    labeled = _read(path)
+    _write(path, labeled + _rows(120, 30), FIELDS + ["sentiment"])
+    sa.process_csv(path, incremental=True, result_cache=False)
+
+    rows = _read(path)
+    assert [r["sentiment"] for r in rows[:120]] == [r["sentiment"] for r in labeled]
+    fps, saved, fit_from, full = _state(path)
+    assert fit_from == len(rows) == 150 and saved.same_as(full)
+    assert sa.load_fingerprints(path) == fps
+    corpus = sa.build_corpus([r["text"] for r in rows[120:]])
+    assert [r["sentiment"] for r in rows[120:]] == sa.label_corpus(corpus, full)
+
+
+def test_merge_labels_and_fits_only_added_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write(mnr.ALL_REVIEWS, _rows(0, 200))
+    sa.process_csv(mnr.ALL_REVIEWS, result_cache=False)
+    mnr.main(["--export"])
+    stored = {r["author"]: r["sentiment"] for r in _read(mnr.ALL_REVIEWS)}
+
+    delta = _rows(200, 40) + [dict(r) for r in _rows(10, 5)]
+    assert mnr.merge_into_all_reviews(delta, FIELDS) == 40
+    assert [r["sentiment"] for r in delta[40:]] == [stored[f"a{i}"] for i in range(10, 15)]
+    assert all(r["sentiment"] for r in delta[:40])
+
+    rows = _read(mnr.ALL_REVIEWS)
+    assert len(rows) == 240 and [r["sentiment"] for r in rows[200:]] == [r["sentiment"] for r in delta[:40]]
+    fps, saved, fit_from, full = _state(mnr.ALL_REVIEWS)
+    assert fit_from == 240 and saved.same_as(full)
+    assert sa.load_fingerprints(mnr.ALL_REVIEWS) == fps
+
+
+def test_merge_does_not_reread_csv_when_model_covers_it(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write(mnr.ALL_REVIEWS, _rows(0, 200))
+    sa.process_csv(mnr.ALL_REVIEWS, result_cache=False)
+    mnr.main(["--export"])
+
+    iter_csv = sa._iter_csv
+    monkeypatch.setattr(sa, "_iter_csv", lambda path: pytest.fail("CSV re-read at merge time"))
+    for start in (200, 230):
+        assert mnr.merge_into_all_reviews(_rows(start, 30), FIELDS) == 30
+    monkeypatch.setattr(sa, "_iter_csv", iter_csv)
+
+    rows = _read(mnr.ALL_REVIEWS)
+    fps, saved, fit_from, full = _state(mnr.ALL_REVIEWS)
+    assert fit_from == len(rows) == 260 and saved.same_as(full)
+    assert sa.load_fingerprints(mnr.ALL_REVIEWS) == fps
+    corpus = sa.build_corpus([r["text"] for r in rows[200:]])
+    assert [r["sentiment"] for r in rows[200:]] == sa.label_corpus(corpus, full)
+
+
+def test_labeling_failure_does_not_abort_merge(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    _write(mnr.ALL_REVIEWS, _rows(0, 50))
+    mnr.main(["--export"])
+
+    def broken(*a, **kw):
+        raise ModuleNotFoundError("No module named 'pymorphy3'")
+    monkeypatch.setattr(sa, "label_appended_rows", broken)
+    assert mnr.merge_into_all_reviews(_rows(50, 10), FIELDS) == 10
+    assert "[WARN] Sentiment labeling failed" in capsys.readouterr().out
+    rows = _read(mnr.ALL_REVIEWS)
+    assert len(rows) == 60 and [r["author"] for r in rows[50:]] == [f"a{i}" for i in range(50, 60)]
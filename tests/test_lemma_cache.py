@@ -0,0 +1,41 @@
+import add_sentiment as sa
+
+WORDS = ["машины", "мастера", "ремонта", "отзывы", "колеса", "двигатели", "запчасти", "сервисы",
+         "масла", "фильтры", "тормоза", "шины", "диски", "фары", "зеркала"]
+
+
+def _new_run(monkeypatch):
+    """Состояние процесса как при новом запуске: кэш в памяти пуст и ещё не загружен."""
+    monkeypatch.setattr(sa, "_lemma_cache", {})
+    monkeypatch.setattr(sa, "_lemma_new", {})
+    monkeypatch.setattr(sa, "_lemma_cache_loaded", False)
+    monkeypatch.setattr(sa, "_lemma_misses", 0)
+
+
+def _pairs(path):
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert lines[0] == sa.morph_stamp()
+    return [line.split("\t") for line in lines[1:]]
+
+
+def test_lemma_cache_file_stays_within_the_cap(tmp_path, monkeypatch):
+    path = tmp_path / "lemma_cache.tsv"
+    monkeypatch.setattr(sa, "LEMMA_CACHE_FILE", path)
+    monkeypatch.setattr(sa, "LEMMA_CACHE_MAX", 8)
+    for start in range(0, len(WORDS), 3):
+        _new_run(monkeypatch)
+        for w in WORDS[start:start + 3]:
+            sa.lemma(w)
+        sa.save_lemma_cache()
+        pairs = _pairs(path)
+        assert len(pairs) <= 8 and len({f for f, _ in pairs}) == len(pairs)
+        assert [f for f, _ in pairs][-3:] == WORDS[start:start + 3]
+
+    # всё, что в файле, загружается и второй раз не считается и не дописывается
+    _new_run(monkeypatch)
+    before = path.read_bytes()
+    assert sa.load_lemma_cache() == len(_pairs(path))
+    for form, lem in _pairs(path):
+        assert sa.lemma(form) == lem
+    assert sa._lemma_misses == 0 and sa.save_lemma_cache() == 0
+    assert path.read_bytes() == before
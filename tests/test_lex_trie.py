@@ -0,0 +1,48 @@
+import pytest
+
+import add_sentiment as sa
+
+PHRASE = "оставляет желать лучшего"
+
+
+def _key(words: str) -> str:
+    return " ".join(sa.lemma(w) for w in words.split())
+
+
+@pytest.fixture
+def lexicon(tmp_path, monkeypatch):
+    """Маленький словарь RuSentiLex: однословная статья и фраза, которая её поглощает."""
+    path = tmp_path / "rusentilex_2017.txt"
+    path.write_text("! комментарий\n"
+                    "желать, Verb, желать, positive, feeling\n"
+                    f"{PHRASE}, Expr, {PHRASE}, negative, opinion\n", encoding="utf-8")
+    lex = sa._build_rusentilex(path)
+    monkeypatch.setattr(sa, "_ru_senti", lex)
+    monkeypatch.setattr(sa, "_lex_trie", None)
+    sa.reset_token_tables()  # веса токенов считаются по словарю — таблицы строятся заново
+    yield lex
+    monkeypatch.undo()
+    sa.reset_token_tables()
+
+
+def test_multiword_entries_are_lemma_sequences(lexicon):
+    assert lexicon == {"желать": 1.0, _key(PHRASE): -1.0}
+    trie = sa.get_lex_trie()
+    first, second, third = _key(PHRASE).split(" ")
+    assert list(trie) == [first]
+    assert trie[first][second][third] == {sa.PHRASE_END: -1.0 * sa.NEG_WEIGHT_MULT}
+
+
+def test_longest_match_wins_and_counts_once(lexicon):
+    score, n, pos, neg = sa.lex_score("Сервис оставляет желать лучшего")
+    assert (n, pos, neg) == (4, 0, 1) and score == pytest.approx(-sa.NEG_WEIGHT_MULT)
+
+
+def test_incomplete_phrase_falls_back_to_single_words(lexicon):
+    score, n, pos, neg = sa.lex_score("Оставляет желать большего")
+    assert (n, pos, neg) == (3, 1, 0) and score == pytest.approx(1.0)
+
+
+def test_negation_before_phrase_inverts_it(lexicon):
+    score, n, pos, neg = sa.lex_score("не оставляет желать лучшего")
+    assert (pos, neg) == (1, 0) and score == pytest.approx(sa.NEG_WEIGHT_MULT)
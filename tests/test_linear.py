@@ -0,0 +1,77 @@
+from array import array
+
+import numpy as np
+import pytest
+
+import add_sentiment as sa
+
+POS = ["Отличный сервис, мастера вежливые", "Спасибо, всё сделали быстро", "очень хорошо, не дорого"]
+NEG = ["Ужасно, грубый персонал", "Долго ждали, машину вернули грязной", "не хорошо и очень дорого"]
+PROBES = ["Отличный сервис", "грубый персонал", "", "спасибо, быстро", "долго ждали"]
+
+
+def _items(n: int):
+    texts = [f"{(POS if i % 2 == 0 else NEG)[i % 3]} {i}" for i in range(n)]
+    return texts, [(i, "pos" if i % 2 == 0 else "neg") for i in range(n)]
+
+
+def _fit(bigrams: bool = False, n: int = 120):
+    texts, items = _items(n)
+    m = sa.LinearModel(bigrams=bigrams)
+    m.fit_batch(sa.build_corpus(texts), items)
+    return m
+
+
+@pytest.mark.parametrize("bigrams", [False, True])
+def test_training_is_deterministic_and_separates_classes(bigrams):
+    m = _fit(bigrams)
+    assert m.ready() and (m.pos_docs, m.neg_docs) == (60, 60)
+    assert m.same_as(_fit(bigrams)) and not m.same_as(_fit(bigrams, n=100))
+    llr, _ = m.predict_llr_batch(sa.build_corpus(PROBES))
+    assert llr[0] > 0 and llr[1] < 0 and llr[2] == 0 and llr[3] > 0 and llr[4] < 0
+
+
+@pytest.mark.parametrize("bigrams", [False, True])
+def test_llr_is_bias_plus_weights(bigrams):
+    m = _fit(bigrams)
+    corpus = sa.build_corpus(PROBES)
+    llr, n = m.predict_llr_batch(corpus)
+    for k in range(len(PROBES)):
+        tids = np.array(corpus.doc(k), dtype=np.int64)
+        if not len(tids):
+            assert (llr[k], n[k]) == (0.0, 0)
+            continue
+        uni, bi = m._features(tids, np.array([0, len(tids)], dtype=np.int64))
+        w = float(m.weights[uni].astype(np.float64).sum())
+        if bigrams:
+            w += float(m.weights[bi[bi >= 0]].astype(np.float64).sum())
+        assert n[k] == (2 * len(tids) - 1 if bigrams else len(tids))
+        assert llr[k] == pytest.approx(m.bias * max(3.0, n[k]) + w)
+        assert m.predict_llr(PROBES[k]) == (pytest.approx(llr[k]), n[k])
+
+
+def test_chunked_training_follows_file_order(monkeypatch):
+    whole = _fit()
+    monkeypatch.setattr(sa.LinearModel, "CHUNK_ROWS", 50)
+    chunked = _fit()
+    assert not chunked.same_as(whole)
+    assert chunked.same_as(_fit())
+
+
+def test_saved_model_is_used_only_for_the_same_csv(tmp_path):
+    m = _fit()
+    texts, items = _items(120)
+    path = tmp_path / "reviews.csv"
+    fps = array("Q", (sa.text_fingerprint(t) for t in texts))
+    classes = [c for _, c in items]
+    sa.save_linear_model(path, m, fps, classes)
+    loaded = sa.load_linear_model(path, fps, classes)
+    assert loaded is not None and loaded.same_as(m)
+    assert np.array_equal(loaded.predict_llr_batch(sa.build_corpus(PROBES))[0],
+                          m.predict_llr_batch(sa.build_corpus(PROBES))[0])
+    # линейная модель не дообучается: дописанные строки или другие классы — обучение заново
+    assert sa.load_linear_model(path, fps + array("Q", [1]), classes + ["pos"]) is None
+    assert sa.load_linear_model(path, fps, ["neg"] + classes[1:]) is None
+    assert sa.load_linear_model(path, fps, classes, bigrams=True) is None
+    again, fit_from = sa.load_model(path, fps, classes, engine="linear")
+    assert fit_from == 120 and again.same_as(m)
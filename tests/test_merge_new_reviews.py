@@ -0,0 +1,146 @@
+import os
+
+import numpy as np
+import pytest
+
+import merged_new_reviews as mnr
+import review_index as rix
+
+PLATFORMS = ["Yandex Maps", "2GIS", "Google Maps"]
+
+
+def _row(i: int, **kw) -> dict:
+    r = {"rating": str(i % 5 + 1), "author": f"Автор {i % 50}", "date_iso": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+         "text": f"Отзыв номер {i}, всё хорошо", "platform": PLATFORMS[i % 3], "organization": f"Org {i % 4}"}
+    r.update(kw)
+    return r
+
+
+@pytest.fixture
+def reviews(tmp_path, monkeypatch):
+    """Рабочая папка с all_reviews.csv на 300 строк, выгруженным из хранилища."""
+    monkeypatch.chdir(tmp_path)
+    rows = [_row(i) for i in range(300)]
+    mnr._write_csv(mnr.ALL_REVIEWS, mnr.BASE_FIELDS, rows)
+    mnr.main(["--export"])
+    return rows
+
+
+def _touch(path):
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+
+def test_store_is_not_reloaded_when_only_mtime_changes(reviews):
+    store = mnr.ReviewStore()
+    try:
+        _touch(mnr.ALL_REVIEWS)
+        assert store.sync() is False
+        assert len(store) == len(reviews)
+        assert store._meta("csv_sig") == mnr._file_sig(mnr.ALL_REVIEWS)
+    finally:
+        store.close()
+
+
+def test_store_takes_rows_appended_outside(reviews):
+    with mnr.ALL_REVIEWS.open("a", encoding="utf-8", newline="") as f:
+        f.write('"5","Новый","2025-01-01","дописан руками","2GIS","Org 1"\r\n')
+    store = mnr.ReviewStore()
+    try:
+        assert store.sync() is False
+        assert len(store) == len(reviews) + 1
+        assert list(store.rows())[-1]["text"] == "дописан руками"
+    finally:
+        store.close()
+
+
+def test_store_reloads_rewritten_csv(reviews):
+    rows = [dict(r, sentiment="neutral") for r in reviews[:100]]
+    mnr._write_csv(mnr.ALL_REVIEWS, mnr.BASE_FIELDS + ["sentiment"], rows)
+    store = mnr.ReviewStore()
+    try:
+        assert store.sync() is True
+        assert len(store) == 100
+        assert store.fields[-1] == "sentiment"
+        assert store.sync() is False
+    finally:
+        store.close()
+
+
+def test_export_writes_utf8_bom(reviews):
+    assert mnr.ALL_REVIEWS.read_bytes().startswith(b"\xef\xbb\xbf")
+
+
+def test_merge_appends_only_new_rows(reviews):
+    before = mnr.ALL_REVIEWS.read_bytes()
+    delta = [_row(i) for i in range(300, 303)] + [_row(5), _row(7, text="  Отзыв номер 7,   всё хорошо ")]
+    assert mnr.merge_into_all_reviews(delta, mnr.BASE_FIELDS, sentiment=False) == 3
+    after = mnr.ALL_REVIEWS.read_bytes()
+    assert after.startswith(before)
+    rows, fields = mnr._read_csv_safe(mnr.ALL_REVIEWS)
+    assert len(rows) == 303 and [r["author"] for r in rows[-3:]] == [_row(i)["author"] for i in range(300, 303)]
+    assert mnr.merge_into_all_reviews(delta, mnr.BASE_FIELDS, sentiment=False) == 0
+    assert mnr.ALL_REVIEWS.read_bytes() == after
+
+
+def test_merge_with_new_column_rewrites_csv(reviews):
+    delta = [_row(400, source="app")]
+    assert mnr.merge_into_all_reviews(delta, mnr.BASE_FIELDS + ["source"], sentiment=False) == 1
+    with mnr.ALL_REVIEWS.open(encoding="utf-8-sig", newline="") as f:
+        header = f.readline()
+        rows = f.readlines()
+    assert header.strip() == ",".join(f'"{c}"' for c in mnr.BASE_FIELDS + ["source"])
+    assert len(rows) == 301 and rows[-1].strip().endswith('"app"') and rows[0].strip().endswith('""')
+
+
+def test_review_key_ignores_case_spacing_and_punctuation():
+    a = rix.review_key_hash("2GIS", "Org 1", "Иван  Петров", "Всё отлично, спасибо!")
+    assert a == rix.review_key_hash("2gis", " org 1", "иван петров", "всё   отлично спасибо")
+    assert a != rix.review_key_hash("2GIS", "Org 2", "Иван Петров", "Всё отлично, спасибо!")
+    assert rix.review_key_hash("2GIS", "Org 1", "Иван Петров", " ... !") is None
+
+
+def test_key_index_after_merges_matches_full_rebuild(reviews):
+    for start in (300, 310, 330):
+        delta = [_row(i) for i in range(start, start + 10)] + [_row(start - 300), _row(start, text="?!")]
+        mnr.merge_into_all_reviews(delta, mnr.BASE_FIELDS, sentiment=False)
+    incremental = np.load(mnr.KEY_INDEX)
+    index = rix.open_review_key_index(str(mnr.KEY_INDEX), str(mnr.ALL_REVIEWS))
+    assert index is not None
+    assert rix.in_review_key_index(index, rix.review_key_hash("2GIS", "Org 3", "Автор 31", "Отзыв номер 331, всё хорошо"))
+    assert not rix.in_review_key_index(index, rix.review_key_hash("2GIS", "Org 3", "Автор 31", "другой текст"))
+    assert not rix.in_review_key_index(index, None)
+    del index
+    mnr.main(["--export"])
+    assert np.array_equal(incremental, np.load(mnr.KEY_INDEX))
+    assert len(incremental) == 330
+
+
+def _summary(rows):
+    for path in mnr.SUMMARY_BASE.values():
+        path.parent.mkdir(parents=True, exist_ok=True)
+    mnr._write_csv(mnr.SUMMARY_BASE["2GIS"], ["platform", "organization", "reviews_count"], rows)
+
+
+def test_watermarks_after_merges_match_full_rebuild(reviews):
+    _summary([{"platform": "2GIS", "organization": "Org 1", "reviews_count": "1 234 отзыва"}])
+    mnr.main(["--export"])
+    for start in (300, 320):
+        delta = [_row(i, date_iso=f"2025-03-{i % 28 + 1:02d}") for i in range(start, start + 20)] + [_row(1)]
+        mnr.merge_into_all_reviews(delta, mnr.BASE_FIELDS, sentiment=False)
+    incremental = mnr.WATERMARKS.read_text(encoding="utf-8")
+    mnr.main(["--export"])
+    assert mnr.WATERMARKS.read_text(encoding="utf-8") == incremental
+
+    marks = rix.load_watermarks(str(mnr.WATERMARKS), str(mnr.ALL_REVIEWS))
+    assert {k for m in marks for k in m} == {"platform", "organization", "latest_date", "summary_reviews_count"}
+    assert rix.latest_dates_from_watermarks(marks, "2GIS", str.lower)["org 1"].isoformat() == "2025-03-22"
+    assert rix.prev_counts_from_watermarks(marks, "2GIS") == {"Org 1": 1234}
+
+
+def test_unreadable_watermarks_are_rebuilt(reviews):
+    expected = mnr.WATERMARKS.read_text(encoding="utf-8")
+    mnr.WATERMARKS.write_text('{"organizations": [{"platform"', encoding="utf-8")
+    mnr.merge_into_all_reviews([], mnr.BASE_FIELDS, sentiment=False)
+    assert mnr.WATERMARKS.read_text(encoding="utf-8") == expected
+    assert mnr.update_watermarks([], incremental=True) is True
@@ -0,0 +1,47 @@
+import csv
+
+import merged_reviews as mr
+
+FIELDS = ["rating", "author", "date_iso", "text", "platform", "organization"]
+
+
+def _write(path, fields, rows, encoding="utf-8"):
+    with path.open("w", encoding=encoding, newline="") as f:
+        w = csv.writer(f, quoting=csv.QUOTE_ALL)
+        w.writerow(fields)
+        w.writerows(rows)
+    return path
+
+
+def _inputs(tmp_path):
+    a = [[str(i % 5 + 1), f"a{i % 40}", f"2024-01-{i % 28 + 1:02d}", f"текст {i % 60}", "2GIS", "Org"]
+         for i in range(200)]
+    # те же отзывы, но колонки в другом порядке, лишние пробелы и своя колонка
+    b = [[r[3] + "  ", r[1], r[0], r[2], " 2gis", "ORG", "x"] for r in a[::3]]
+    b += [["новый", "b", "5", "2024-02-01", "Google Maps", "Org", "y"]]
+    return [_write(tmp_path / "a.csv", FIELDS, a, encoding="utf-8-sig"),
+            _write(tmp_path / "b.csv", ["text", "author", "rating", "date_iso", "platform", "organization", "extra"], b),
+            tmp_path / "missing.csv"]
+
+
+def test_external_dedup_matches_in_memory(tmp_path):
+    paths = _inputs(tmp_path)
+    mem = mr.merge_streaming(paths, tmp_path / "mem.csv")
+    ext = mr.merge_streaming(paths, tmp_path / "ext.csv", max_keys=7)
+    assert not mem["external"] and ext["external"]
+    assert (tmp_path / "mem.csv").read_bytes() == (tmp_path / "ext.csv").read_bytes()
+    assert [tuple(v) for v in mem["files"].values()] == [tuple(v) for v in ext["files"].values()]
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_columns_are_matched_by_name(tmp_path):
+    paths = _inputs(tmp_path)
+    res = mr.merge_streaming(paths, tmp_path / "out.csv")
+    assert res["fields"] == FIELDS + ["extra"]
+    with (tmp_path / "out.csv").open(encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 201
+    last = rows[-1]
+    assert (last["text"], last["rating"], last["platform"], last["extra"]) == ("новый", "5", "Google Maps", "y")
+    assert all(r["extra"] == "" for r in rows[:-1])
+    assert res["files"][paths[1]] == [len(range(0, 200, 3)) + 1, 1]
@@ -0,0 +1,50 @@
+import csv
+
+import pytest
+
+import add_sentiment as sa
+
+POS = ["Отличный сервис, мастера вежливые", "Спасибо, всё сделали быстро!", "Без обмана, рекомендую 👍"]
+NEG = ["Ужасно, грубый персонал", "Никогда не обращайтесь", "Долго ждали, развод на деньги 😡"]
+
+
+def _texts(n: int) -> list[str]:
+    return [f"{(POS if i % 2 == 0 else NEG)[i % 3]} {i}" if i % 11 else "" for i in range(n)]
+
+
+@pytest.fixture(autouse=True)
+def _caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(sa, "LEMMA_CACHE_FILE", tmp_path / "lemma_cache.tsv")
+    monkeypatch.setattr(sa, "RESULT_CACHE_FILE", tmp_path / "results.sqlite")
+    monkeypatch.setattr(sa, "PARALLEL_CHUNK_ROWS", 25)
+
+
+@pytest.mark.parametrize("engine,bigrams", [("nb", False), ("nb", True), ("linear", False)])
+def test_parallel_labels_match_serial(engine, bigrams):
+    texts = _texts(130)
+    rows = [{"text": t, "rating": "5" if i % 2 == 0 else "1"} for i, t in enumerate(texts)]
+    model = sa.train_nb_from_rows(rows, bigrams=bigrams, engine=engine)
+    assert model.ready()
+    serial = sa.label_corpus(sa.build_corpus(texts), model)
+    assert sa.label_texts_parallel(texts, model, workers=3) == serial
+    assert set(serial) >= {"positive", "negative"}
+
+
+def test_process_csv_with_workers_matches_serial(tmp_path, monkeypatch):
+    monkeypatch.setattr(sa, "PARALLEL_MIN_ROWS", 50)
+    paths = []
+    for name in ("serial", "parallel"):
+        p = tmp_path / name / "r.csv"
+        p.parent.mkdir()
+        with p.open("w", encoding="utf-8", newline="") as f:
+            w = csv.writer(f, quoting=csv.QUOTE_ALL)
+            w.writerow(["rating", "text"])
+            w.writerows([("5" if i % 2 == 0 else "1") if i % 4 else "", t] for i, t in enumerate(_texts(200)))
+        paths.append(p)
+    pools = []
+    parallel = sa.label_texts_parallel
+    monkeypatch.setattr(sa, "label_texts_parallel", lambda *a, **kw: pools.append(1) or parallel(*a, **kw))
+    sa.process_csv(paths[0], workers=1, result_cache=False)
+    sa.process_csv(paths[1], workers=2, result_cache=False)
+    assert pools == [1]
+    assert paths[1].read_bytes() == paths[0].read_bytes()
@@ -0,0 +1,57 @@
+import re
+
+import pytest
+
+import add_sentiment as sa
+
+
+def baseline_phrase_flags(raw):
+    """phrase_flags_and_score до однопроходного поиска триггеров (эталон поведения)."""
+    txt = (raw or "").lower().replace("ё", "е")
+    toks = re.findall(r"\w+|[!?]+", txt)
+    hard_neg = any(ph in txt for ph in ["не советую", "не рекомендую", "ни в коем случае",
+                                         "никогда не обращайтесь", "полный ужас", "полный отстой"])
+    for i, w in enumerate(toks):
+        if any(w.startswith(t) for t in ["развод", "лохотрон", "мошенник", "мошенничество"]):
+            if {toks[j] for j in (i - 1, i - 2) if j >= 0}.isdisjoint({"не", "без", "ни"}):
+                hard_neg = True
+    hard_pos = any(ph in txt for ph in ["без проблем", "все отлично", "очень доволен", "очень довольна", "все супер"])
+    ph_score = 1.5 if re.search(r"\bбез\s+обман\w*\b", txt) else 0.0
+    return hard_neg, hard_pos, ph_score
+
+
+@pytest.mark.parametrize("raw", [
+    "Не советую никому", "не,советую", "не  советую", "не! развод", "-развод", "это развод!",
+    "не развод", "без мошенничества", "Всё отлично, спасибо", "очень довольна", "Без обмана!",
+    "ни в коем случае!", "полный ужасно", "", "просто текст",
+])
+def test_phrase_flags_match_baseline(raw):
+    assert sa.phrase_flags_and_score(raw) == baseline_phrase_flags(raw)
+
+
+def test_phrase_flags_fuzz_against_baseline():
+    import random
+    pieces = ["не", "Не", "без", "ни", "советую", "рекомендую", "в коем случае", "никогда", "обращайтесь",
+              "полный", "ужас", "отстой", "развод", "разводилово", "лохотрон", "мошенник", "мошенничество",
+              "проблем", "все", "всё", "отлично", "очень", "доволен", "довольна", "супер", "обмана",
+              "!", "?", ",", "-", "_", "5", "😊"]
+    rnd = random.Random(7)
+    for _ in range(20000):
+        raw = "".join(rnd.choice(pieces) + rnd.choice([" ", " ", "", ",", "! ", "  ", "-", "\n"])
+                      for _ in range(rnd.randint(1, 8)))
+        assert sa.phrase_flags_and_score(raw) == baseline_phrase_flags(raw), raw
+
+
+def test_corpus_uses_the_same_flags():
+    c = sa.build_corpus(["не,советую", "-развод", "без обмана"])
+    assert list(c.hard) == [0, sa.HARD_NEG, 0]
+    assert list(c.ph) == [0.0, 0.0, 1.5]
+
+
+def test_phrase_flags_are_linear_in_text_length():
+    import time
+    raw = "не развод " * 40000
+    t0 = time.perf_counter()
+    assert sa.phrase_flags_and_score(raw) == (False, False, 0.0)
+    # прежний поиск токенов от начала текста на каждом триггере — минуты на такой строке
+    assert time.perf_counter() - t0 < 2.0
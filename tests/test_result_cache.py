@@ -0,0 +1,31 @@
+import add_sentiment as sa
+
+VARIANTS = [
+    "сервис так себе, без проблем", "сервис так себе, без. проблем", "Сервис так себе без проблем!",
+    "никогда не обращайтесь", "никогда, не обращайтесь", "Никогда не обращайтесь!!!",
+    "без обмана, всё честно", "без, обмана всё честно", "Без обмана всё честно 👍",
+    "не развод, все честно", "не, развод все честно", "Отлично 😡", "Отлично 🙂", "отлично",
+]
+
+
+def _labels(texts, nb, cache):
+    return sa.label_with_cache(cache, texts, lambda ks: sa.label_corpus(sa.build_corpus([texts[k] for k in ks]), nb))
+
+
+def test_cached_labels_match_uncached_on_punctuation_variants(tmp_path):
+    rows = [{"text": t, "rating": "5" if i % 3 else "1"} for i, t in enumerate(VARIANTS * 3)]
+    for nb in (sa.new_model(), sa.train_nb_from_rows(rows)):
+        want = sa.label_corpus(sa.build_corpus(VARIANTS), nb)
+        cache = sa.ResultCache(sa.result_stamp(nb), tmp_path / "results.sqlite")
+        try:
+            # холодный кэш с повторами внутри прогона, затем тёплый в другом порядке
+            assert _labels(VARIANTS + VARIANTS, nb, cache) == want + want
+            assert _labels(VARIANTS[::-1], nb, cache) == want[::-1]
+        finally:
+            cache.close()
+
+
+def test_result_key_keeps_punctuation_but_not_case():
+    assert sa.result_key("Без обмана") == sa.result_key("без обмана")
+    assert sa.result_key("Всё ок") == sa.result_key("все ок")
+    assert sa.result_key("без проблем") != sa.result_key("без. проблем")
@@ -0,0 +1,92 @@
+import csv
+import shutil
+import threading
+import time
+
+import pytest
+
+import add_sentiment as sa
+import sentiment_worker as sw
+
+POS = ["Отличный сервис, мастера вежливые", "Спасибо, всё сделали быстро!", "Без обмана, рекомендую 👍"]
+NEG = ["Ужасно, грубый персонал", "Никогда не обращайтесь", "Долго ждали, развод на деньги 😡"]
+PROBES = ["Отличный сервис", "Не советую", "грубый мастер, долго ждали", "всё быстро, спасибо", "", "просто визит"]
+
+
+def _write(path, n: int):
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, quoting=csv.QUOTE_ALL)
+        w.writerow(["rating", "text"])
+        for i in range(n):
+            pos = i % 2 == 0
+            w.writerow([("5" if pos else "1") if i % 4 else "", f"{(POS if pos else NEG)[i % 3]} {i}"])
+
+
+@pytest.fixture(autouse=True)
+def _caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(sa, "CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(sa, "LEMMA_CACHE_FILE", tmp_path / "cache" / "lemma_cache.tsv")
+    monkeypatch.setattr(sa, "RESULT_CACHE_FILE", tmp_path / "cache" / "results.sqlite")
+
+
+@pytest.fixture
+def worker(tmp_path):
+    """Резидентный процесс (в потоке) на своём сокете для reviews.csv из tmp_path."""
+    if sw.FAMILY != "AF_UNIX":
+        pytest.skip("named pipes are exercised on Windows only")
+    path = tmp_path / "reviews.csv"
+    _write(path, 200)
+    sa.process_csv(path, result_cache=False)
+    address = str(tmp_path / "w.sock")
+    thread = threading.Thread(target=sw.serve, args=(str(path), address), daemon=True)
+    thread.start()
+    for _ in range(200):
+        if sw.ping(address):
+            break
+        time.sleep(0.05)
+    yield path, address
+    sw.stop(address)
+    thread.join(10)
+    assert not thread.is_alive()
+
+
+def test_label_round_trip_matches_in_process(worker):
+    path, address = worker
+    assert sw.ping(address)
+    local = sa.SentimentEngine(path, result_cache=False).label_batch(PROBES)
+    assert sw.remote_label_batch(PROBES, address) == local
+    assert sw.remote_label_batch(PROBES[::-1], address) == local[::-1]
+    assert sw.remote_label_batch([], address) == []
+
+
+def test_csv_round_trip_matches_in_process(worker, tmp_path):
+    path, address = worker
+    remote, local = tmp_path / "remote" / "r.csv", tmp_path / "local" / "r.csv"
+    for p in (remote, local):
+        p.parent.mkdir()
+        _write(p, 120)
+    sa.process_csv(local, result_cache=False)
+    ok, output = sw.remote_process_csv(address, csv=str(remote), result_cache=False, workers=1)
+    assert ok and "120" in output
+    assert remote.read_bytes() == local.read_bytes()
+
+    # после C и R процесс размечает моделью, сохранённой заново рядом с reviews.csv
+    shutil.copy(local, path)
+    sa.process_csv(path, result_cache=False)
+    assert sw.reload(address)
+    assert sw.remote_label_batch(PROBES, address) == sa.SentimentEngine(path, result_cache=False).label_batch(PROBES)
+
+
+def test_no_worker_means_none(tmp_path):
+    address = str(tmp_path / "missing.sock")
+    assert sw.remote_label_batch(PROBES, address) is None
+    assert sw.remote_process_csv(address, csv="x.csv") is None
+    assert not sw.ping(address) and not sw.reload(address)
+
+
+def test_csv_request_forwards_workers(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(sa, "process_csv", lambda path, **kw: calls.append(kw["workers"]) or True)
+    for params, want in (({}, 1), ({"workers": 4}, 4), ({"workers": 0}, 1)):
+        assert sw._run_csv({"csv": str(tmp_path / "reviews.csv"), **params}) == (True, "")
+        assert calls.pop() == want
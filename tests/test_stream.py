@@ -0,0 +1,69 @@
+import csv
+
+import pytest
+
+import add_sentiment as sa
+
+POS = ["Отличный сервис, мастера вежливые", "Спасибо, всё сделали быстро!", "Без обмана, рекомендую 👍"]
+NEG = ["Ужасно, грубый персонал", "Никогда не обращайтесь", "Долго ждали, развод на деньги 😡"]
+
+
+def _write(path, n: int, start: int = 0):
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, quoting=csv.QUOTE_ALL)
+        w.writerow(["rating", "author", "text"])
+        for i in range(start, start + n):
+            pos = i % 2 == 0
+            w.writerow([("5" if pos else "1") if i % 4 else "", f"a{i}", f"{(POS if pos else NEG)[i % 3]} {i}"])
+
+
+@pytest.fixture(autouse=True)
+def _caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(sa, "LEMMA_CACHE_FILE", tmp_path / "lemma_cache.tsv")
+    monkeypatch.setattr(sa, "RESULT_CACHE_FILE", tmp_path / "results.sqlite")
+    monkeypatch.setattr(sa, "STREAM_CHUNK_ROWS", 37)
+
+
+@pytest.mark.parametrize("engine,bigrams", [("nb", False), ("nb", True), ("linear", False)])
+def test_stream_matches_serial(tmp_path, engine, bigrams):
+    serial, stream = tmp_path / "serial" / "r.csv", tmp_path / "stream" / "r.csv"
+    for p in (serial, stream):
+        p.parent.mkdir()
+        _write(p, 300)
+    sa.process_csv(serial, result_cache=False, bigrams=bigrams, engine=engine)
+    sa.process_csv_stream(stream, result_cache=False, bigrams=bigrams, engine=engine)
+    assert stream.read_bytes() == serial.read_bytes()
+    assert not list(stream.parent.glob("*.tmp"))
+
+    # дописанные строки: инкрементальные прогоны тоже совпадают
+    _write(tmp_path / "more.csv", 50, start=300)
+    for p in (serial, stream):
+        with p.open("a", encoding="utf-8", newline="") as f:
+            f.writelines((tmp_path / "more.csv").read_text(encoding="utf-8").splitlines(True)[1:])
+    sa.process_csv(serial, incremental=True, result_cache=False, bigrams=bigrams, engine=engine)
+    sa.process_csv_stream(stream, incremental=True, result_cache=False, bigrams=bigrams, engine=engine)
+    assert stream.read_bytes() == serial.read_bytes()
+
+
+def test_stream_closes_the_source_before_replacing_it(tmp_path, monkeypatch):
+    path = tmp_path / "r.csv"
+    _write(path, 100)
+    opened = []
+    real_open, real_replace = sa.Path.open, sa.os.replace
+
+    def tracking_open(self, *args, **kw):
+        f = real_open(self, *args, **kw)
+        if self == path:
+            opened.append(f)
+        return f
+
+    def checked_replace(src, dst):
+        # как на Windows: открытый файл заменить нельзя
+        if any(not f.closed for f in opened):
+            raise PermissionError(f"{dst} is open")
+        return real_replace(src, dst)
+
+    monkeypatch.setattr(sa.Path, "open", tracking_open)
+    monkeypatch.setattr(sa.os, "replace", checked_replace)
+    sa.process_csv_stream(path, result_cache=False)
+    assert "sentiment" in path.read_text(encoding="utf-8").splitlines()[0]
@@ -0,0 +1,30 @@
+import numpy as np
+
+import add_sentiment as sa
+
+TEXTS = ["Отличный сервис, всё быстро", "Ужасно долго ждали, грубый персонал", "Нормально, без проблем",
+         "Не советую, сплошной обман", "Очень вежливые мастера, рекомендую"] * 8
+
+
+def test_token_tables_follow_the_growing_tables():
+    sa.build_corpus(TEXTS[:3])
+    sa._token_tables()
+    sa.build_corpus(["совсем новые словоформы появились", "ещё одна незнакомая фраза"])
+    lemma, hashes = sa._token_tables()
+    assert np.array_equal(lemma, np.array(sa._tok_lemma, dtype=np.int64))
+    assert np.array_equal(hashes, np.array(sa._lemma_hash, dtype=np.uint64)[lemma])
+
+
+def test_token_weights_extend_after_new_tokens():
+    rows = [{"text": t, "rating": "5" if i % 2 == 0 else "1"} for i, t in enumerate(TEXTS)]
+    for bigrams in (False, True):
+        nb = sa.train_nb_from_rows(rows, bigrams=bigrams)
+        before = sa.build_corpus(TEXTS)
+        nb.predict_llr_batch(before)
+        fresh = sa.build_corpus(["первый раз видим эти слова", "Отличный сервис"])
+        got, _ = nb.predict_llr_batch(fresh)
+        lemw = nb._lemw
+        want = [nb._llr_prior + sum(lemw[sa._tok_lemma[t]] for t in fresh.doc(i)) for i in range(len(fresh))]
+        if not bigrams:
+            assert np.allclose(got, want)
+        assert np.array_equal(nb._token_weights(), lemw[np.array(sa._tok_lemma, dtype=np.int64)])